@@ -0,0 +1,238 @@
+"""
+Stamps, decoded once and packed into an atlas.
+
+Every stamp is decoded a single time, converted to premultiplied ARGB (the
+canvas format, so drawing one needs no conversion) and scaled to each of
+STAMP_SCALES. The variants are packed into a few large page images, and a
+stamp is drawn with one drawImage from its page, however fast the stamps
+come. Other sizes and rotations are made from the full size variant the
+first time they are drawn, and packed in alongside.
+
+Decoding and scaling happen on a thread pool: add() queues stamps to load
+in the background, and load_folder() scans a folder of images there too.
+Only packing into the pages happens on the GUI thread. A stamp needed
+before its background load finishes is loaded there and then.
+"""
+
+import os
+
+import constants
+from PyQt6.QtCore import (
+    QObject,
+    QPointF,
+    QRect,
+    QRectF,
+    QSizeF,
+    Qt,
+    QThreadPool,
+    pyqtSignal,
+)
+from PyQt6.QtGui import QImage, QImageReader, QPainter, QTransform
+from store import new_image
+
+
+def load_image(path):
+    """
+    Decode a stamp, from the resources or from the stamps folder next to
+    this file if the resources aren't loaded.
+
+    :return: premultiplied QImage, null if it couldn't be read.
+    """
+    image = QImage(path)
+    if image.isNull() and path.startswith(":/"):
+        image = QImage(os.path.join(os.path.dirname(__file__), path[2:]))
+    return image.convertToFormat(constants.IMAGE_FORMAT)
+
+
+def transformed(image, scale=1.0, angle=0):
+    if scale == 1 and angle % 360 == 0:
+        return image
+    transform = QTransform().rotate(angle).scale(scale, scale)
+    return image.transformed(
+        transform, Qt.TransformationMode.SmoothTransformation
+    ).convertToFormat(constants.IMAGE_FORMAT)
+
+
+def decode(path, scales=constants.STAMP_SCALES):
+    """
+    Load a stamp and make its prescaled variants.
+
+    :return: dict of (scale, angle) to QImage, empty if it can't be read.
+    """
+    image = load_image(path)
+    if image.isNull():
+        return {}
+    return {(scale, 0): transformed(image, scale) for scale in scales}
+
+
+def placed(rect, center):
+    """
+    Return where a stamp variant of size rect goes, centred on center.
+    """
+    return QRectF(
+        QPointF(center.x() - rect.width() // 2, center.y() - rect.height() // 2),
+        QSizeF(rect.size()),
+    )
+
+
+def image_files(folder):
+    """
+    Return the paths of the images Qt can read in folder, sorted by name.
+    """
+    extensions = {"." + bytes(f).decode() for f in QImageReader.supportedImageFormats()}
+    return sorted(
+        entry.path
+        for entry in os.scandir(folder)
+        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions
+    )
+
+
+class StampAtlas(QObject):
+    """
+    The stamps, by path, packed into page images for drawing.
+
+    :param page_size: width and height of each page. A variant bigger than
+    this gets an image of its own instead.
+    """
+
+    # Emitted on the GUI thread when stamps are added, with the new count.
+    stamps_changed = pyqtSignal(int)
+
+    # Emitted from the worker threads.
+    _decoded = pyqtSignal(str, object)
+    _found = pyqtSignal(object)
+
+    def __init__(
+        self,
+        page_size=constants.STAMP_ATLAS_PAGE_SIZE,
+        scales=constants.STAMP_SCALES,
+        pool=None,
+    ):
+        super().__init__()
+        self.page_size = page_size
+        self.scales = scales
+        self.pool = pool or QThreadPool.globalInstance()
+
+        self.paths = []
+        self.pages = []
+        # (path, scale, angle) to (page, QRect) for every packed variant.
+        self.variants = {}
+        # Paths which couldn't be read.
+        self.unreadable = set()
+        # The shelf being filled on the last page: its top, height and how
+        # far along it is filled.
+        self.shelf = (0, 0, 0)
+
+        self._decoded.connect(self._pack_decoded)
+        self._found.connect(self.add)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, paths):
+        """
+        Add stamps, loading them in the background.
+        """
+        new = [path for path in paths if path not in self.paths]
+        for path in new:
+            self.paths.append(path)
+            self.pool.start(lambda path=path: self._decode(path))
+        if new:
+            self.stamps_changed.emit(len(self.paths))
+
+    def load_folder(self, folder):
+        """
+        Add every image in folder, scanning and loading in the background.
+        """
+        self.pool.start(lambda: self._found.emit(image_files(folder)))
+
+    def _decode(self, path):
+        self._decoded.emit(path, decode(path, self.scales))
+
+    def _pack_decoded(self, path, images):
+        if (path, 1.0, 0) in self.variants:
+            # Already loaded, as it was needed before this finished.
+            return
+        if not images:
+            self.unreadable.add(path)
+            if path in self.paths:
+                self.paths.remove(path)
+                self.stamps_changed.emit(len(self.paths))
+            return
+        for (scale, angle), image in images.items():
+            self.variants[(path, scale, angle)] = self.pack(image)
+
+    def variant(self, path, scale=1.0, angle=0):
+        """
+        Return the page and rect holding path at scale and angle, making
+        the variant if it doesn't exist yet.
+
+        :return: tuple of (page QImage, QRect), or None if path can't be read.
+        """
+        key = (path, scale, angle % 360)
+        if key in self.variants:
+            return self.variants[key]
+        if path in self.unreadable:
+            return None
+
+        if (path, 1.0, 0) not in self.variants:
+            if path not in self.paths:
+                self.paths.append(path)
+                self.stamps_changed.emit(len(self.paths))
+            self._pack_decoded(path, decode(path, self.scales))
+            if (path, 1.0, 0) not in self.variants:
+                return None
+            if key in self.variants:
+                return self.variants[key]
+
+        page, rect = self.variants[(path, 1.0, 0)]
+        self.variants[key] = self.pack(transformed(page.copy(rect), scale, angle))
+        return self.variants[key]
+
+    def pack(self, image):
+        """
+        Copy image into a page, shelf by shelf.
+
+        :return: tuple of (page QImage, QRect).
+        """
+        w, h = image.width(), image.height()
+        size = self.page_size
+        if w > size or h > size:
+            # Too big to share a page, so it gets one to itself.
+            page = new_image(w, h)
+            rect = QRect(0, 0, w, h)
+            self._blit(page, image, rect)
+            return page, rect
+
+        top, height, x = self.shelf
+        if x + w > size:
+            # Start a new shelf.
+            top, height, x = top + height + 1, 0, 0
+        if not self.pages or top + h > size:
+            page = new_image(size, size)
+            page.fill(Qt.GlobalColor.transparent)
+            self.pages.append(page)
+            top, height, x = 0, 0, 0
+
+        page = self.pages[-1]
+        rect = QRect(x, top, w, h)
+        self._blit(page, image, rect)
+        # Leave a pixel between variants, so scaled draws don't bleed.
+        self.shelf = (top, max(height, h), x + w + 1)
+        return page, rect
+
+    def _blit(self, page, image, rect):
+        p = QPainter(page)
+        p.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        p.drawImage(rect.topLeft(), image)
+        p.end()
+
+    def image(self, path):
+        """
+        Return a copy of the full size stamp, e.g. for an icon.
+        """
+        found = self.variant(path)
+        if found is None:
+            return QImage()
+        page, rect = found
+        return page.copy(rect)
@@ -0,0 +1,95 @@
+"""
+Benchmark the canvas's mouse move dispatch, with and without a handler.
+
+Times Canvas.mouseMoveEvent in a mode whose tool has a move handler that
+does nothing, and in a mode with no move handler at all (fill). For
+comparison, ByName does the same as the canvas did before tools.py:
+map the event to image coordinates, then look the handler up by formatting
+a method name and calling getattr on every event.
+
+Run with: python bench_dispatch.py [--events 10000] [--rounds 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import tools
+from canvas import Canvas
+from PyQt6.QtCore import QEvent, QPointF, Qt
+from PyQt6.QtGui import QMouseEvent
+from PyQt6.QtWidgets import QApplication
+
+
+@tools.register
+class NoopTool(tools.Tool):
+    __slots__ = ()
+
+    name = "noop"
+
+    def mouseMoveEvent(self, e):
+        pass
+
+
+class ByName(Canvas):
+    """
+    A canvas dispatching moves as it did before the tools registry.
+    """
+
+    def noop_mouseMoveEvent(self, e):
+        pass
+
+    def mouseMoveEvent(self, e):
+        e = self.map_event(e)
+        if self.stroke_tail and hasattr(self, "%s_strokeEvent" % self.mode):
+            self.queue_stroke(e.position())
+            return
+        fn = getattr(self, "%s_mouseMoveEvent" % self.mode, None)
+        if fn:
+            return fn(e)
+
+
+def bench(canvas, mode, event, count, rounds):
+    canvas.set_mode(mode)
+    runs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(count):
+            canvas.mouseMoveEvent(event)
+        runs.append((time.perf_counter() - start) / count)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    pos = QPointF(10, 10)
+    event = QMouseEvent(
+        QEvent.Type.MouseMove,
+        pos,
+        pos,
+        Qt.MouseButton.NoButton,
+        Qt.MouseButton.NoButton,
+        Qt.KeyboardModifier.NoModifier,
+    )
+
+    print("%-28s %12s %12s" % ("move dispatch", "by name", "table"))
+    for mode, label in (("noop", "no-op handler"), ("fill", "no handler (fill)")):
+        times = []
+        for cls in (ByName, Canvas):
+            canvas = cls()
+            canvas.initialize()
+            times.append(bench(canvas, mode, event, args.events, args.rounds))
+        print("%-28s %9.2f us %9.2f us" % (label, times[0] * 1e6, times[1] * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark the flood fill, comparing the original pixel-by-pixel search
+against the NumPy scanline fill in fill.py.
+
+Two cases are measured on a canvas of CANVAS_DIMENSIONS: filling a blank
+canvas (one huge span per row) and filling a 1-pixel-wide maze (many
+tiny spans, the worst case for a scanline fill).
+
+Run with: python bench_fill.py [--repeat N] [--skip-legacy]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import constants
+import numpy as np
+from fill import flood_fill, image_array
+from PyQt6.QtCore import QPoint
+from PyQt6.QtGui import QColor, QGuiApplication, QImage, QPainter, QPen, QPixmap
+
+
+def legacy_fill(pixmap, x, y, color):
+    """
+    The original Canvas.fill_mousePressEvent search, for comparison.
+    """
+    image = pixmap.toImage()
+    w, h = image.width(), image.height()
+    target_color = image.pixel(QPoint(x, y))
+
+    have_seen = set()
+    queue = [(x, y)]
+
+    def get_cardinal_points(have_seen, center_pos):
+        points = []
+        cx, cy = center_pos
+        for x, y in [(1, 0), (0, 1), (-1, 0), (0, -1)]:
+            xx, yy = cx + x, cy + y
+            if xx >= 0 and xx < w and yy >= 0 and yy < h and (xx, yy) not in have_seen:
+                points.append((xx, yy))
+                have_seen.add((xx, yy))
+        return points
+
+    p = QPainter(pixmap)
+    p.setPen(QPen(color))
+    while queue:
+        x, y = queue.pop()
+        if image.pixel(x, y) == target_color:
+            p.drawPoint(QPoint(x, y))
+            queue.extend(get_cardinal_points(have_seen, (x, y)))
+    p.end()
+
+
+def numpy_fill(pixmap, x, y, color):
+    """
+    The current Canvas fill path: convert, fill spans, convert back.
+    """
+    image = pixmap.toImage().convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+    flood_fill(image, x, y, color)
+    return QPixmap.fromImage(image)
+
+
+def blank_canvas():
+    image = QImage(
+        *constants.CANVAS_DIMENSIONS, QImage.Format.Format_ARGB32_Premultiplied
+    )
+    image.fill(QColor("white"))
+    return image
+
+
+def maze_canvas(seed=0):
+    """
+    Generate a perfect maze with 1-pixel corridors and walls, so the fill
+    has to wind through every corridor on the canvas.
+    """
+    rng = random.Random(seed)
+    image = QImage(
+        *constants.CANVAS_DIMENSIONS, QImage.Format.Format_ARGB32_Premultiplied
+    )
+    image.fill(QColor("black"))
+    arr = image_array(image)
+    white = arr.dtype.type(QColor("white").rgba())
+
+    h, w = arr.shape
+    cols, rows = (w - 1) // 2, (h - 1) // 2
+    visited = np.zeros((rows, cols), dtype=bool)
+    stack = [(0, 0)]
+    visited[0, 0] = True
+    arr[1, 1] = white
+    while stack:
+        cx, cy = stack[-1]
+        options = [
+            (cx + dx, cy + dy)
+            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1))
+            if 0 <= cx + dx < cols
+            and 0 <= cy + dy < rows
+            and not visited[cy + dy, cx + dx]
+        ]
+        if not options:
+            stack.pop()
+            continue
+        nx, ny = rng.choice(options)
+        visited[ny, nx] = True
+        # Knock through the wall between the cells, and open the new cell.
+        arr[cy + ny + 1, cx + nx + 1] = white
+        arr[2 * ny + 1, 2 * nx + 1] = white
+        stack.append((nx, ny))
+
+    return image
+
+
+def measure(fn, base, repeat):
+    """
+    Time the fill, then run it once more under tracemalloc for the peak
+    allocation (tracing slows allocation-heavy code down too much to time).
+    """
+    times = []
+    for _ in range(repeat):
+        pixmap = QPixmap.fromImage(base)
+        start = time.perf_counter()
+        fn(pixmap, 1, 1, QColor("red"))
+        times.append(time.perf_counter() - start)
+
+    pixmap = QPixmap.fromImage(base)
+    tracemalloc.start()
+    fn(pixmap, 1, 1, QColor("red"))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    app = QGuiApplication(sys.argv)  # noqa: F841, required for QPixmap.
+
+    cases = [("full canvas", blank_canvas()), ("maze", maze_canvas())]
+    fills = [("numpy scanline", numpy_fill)]
+    if not args.skip_legacy:
+        fills.insert(0, ("legacy", legacy_fill))
+
+    w, h = constants.CANVAS_DIMENSIONS
+    print("Canvas %dx%d, best of %d" % (w, h, args.repeat))
+    for case_name, base in cases:
+        for fill_name, fn in fills:
+            # The legacy fill is slow enough that one timed run is plenty.
+            repeat = 1 if fn is legacy_fill else args.repeat
+            best, peak = measure(fn, base, repeat)
+            print(
+                "%-12s %-15s %9.1f ms %9.1f MB peak"
+                % (case_name, fill_name, best * 1000, peak / 1e6)
+            )
+
+
+if __name__ == "__main__":
+    main()
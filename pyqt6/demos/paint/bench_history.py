@@ -0,0 +1,136 @@
+"""
+Benchmark the tile-based undo history with a long run of brush strokes.
+
+Each step draws a short random stroke (as the brush tool would, touching
+each segment before painting it) and commits it to the history. Then the
+whole history is undone and redone. Reports the per-step latency of commit,
+undo and redo, and the memory held compared with full-image snapshots.
+
+Run with: python bench_history.py [--steps N] [--size WxH]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import constants
+from history import History
+from PyQt6.QtCore import QPointF, QRectF, Qt
+from PyQt6.QtGui import QColor, QGuiApplication, QImage, QPainter, QPen
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(name, times):
+    print(
+        "%-8s p50 %7.3f ms   p99 %7.3f ms   max %7.3f ms"
+        % (
+            name,
+            percentile(times, 50) * 1000,
+            percentile(times, 99) * 1000,
+            max(times) * 1000,
+        )
+    )
+
+
+def stroke(rng, w, h):
+    """
+    A random brush stroke: a short wandering polyline and a pen.
+    """
+    x, y = rng.uniform(0, w), rng.uniform(0, h)
+    points = [QPointF(x, y)]
+    for _ in range(rng.randint(5, 30)):
+        x += rng.gauss(0, 8)
+        y += rng.gauss(0, 8)
+        points.append(QPointF(x, y))
+    pen = QPen(
+        QColor(rng.choice(constants.COLORS)),
+        rng.randint(1, 20) * constants.BRUSH_MULT,
+        Qt.PenStyle.SolidLine,
+        Qt.PenCapStyle.RoundCap,
+        Qt.PenJoinStyle.RoundJoin,
+    )
+    return points, pen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument(
+        "--size", default="%dx%d" % constants.CANVAS_DIMENSIONS, help="e.g. 600x400"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = QGuiApplication(sys.argv)  # noqa: F841
+
+    w, h = (int(v) for v in args.size.split("x"))
+    image = QImage(w, h, constants.IMAGE_FORMAT)
+    image.fill(QColor("white"))
+
+    rng = random.Random(args.seed)
+    history = History()
+    commit_times, paint_times = [], []
+
+    for _ in range(args.steps):
+        points, pen = stroke(rng, w, h)
+        pad = pen.widthF() / 2 + 1
+
+        start = time.perf_counter()
+        history.begin(image)
+        for a, b in zip(points, points[1:]):
+            # As Canvas.segment_rect, the segment bounds plus the pen width.
+            rect = QRectF(a, b).normalized().adjusted(-pad, -pad, pad, pad)
+            rect = rect.toAlignedRect()
+            history.touch(image, rect)
+            p = QPainter(image)
+            p.setPen(pen)
+            p.drawLine(a, b)
+            p.end()
+        paint_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        history.commit(image)
+        commit_times.append(time.perf_counter() - start)
+
+    undo_times = []
+    while history.can_undo():
+        start = time.perf_counter()
+        image, _ = history.undo(image)
+        undo_times.append(time.perf_counter() - start)
+
+    redo_times = []
+    while history.can_redo():
+        start = time.perf_counter()
+        image, _ = history.redo(image)
+        redo_times.append(time.perf_counter() - start)
+
+    snapshot = image.sizeInBytes()
+    print(
+        "Canvas %dx%d, %d steps, %dpx tiles, budget %.0f MB"
+        % (w, h, args.steps, history.tile_size, history.max_bytes / 1e6)
+    )
+    report("stroke", paint_times)
+    report("commit", commit_times)
+    report("undo", undo_times)
+    report("redo", redo_times)
+    print(
+        "Retained %d steps in %.1f MB (%.1f KB/step), full snapshots would need %.1f MB"
+        % (
+            len(history.undo_stack),
+            history.nbytes / 1e6,
+            history.nbytes / max(len(history.undo_stack), 1) / 1e3,
+            snapshot * len(history.undo_stack) / 1e6,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
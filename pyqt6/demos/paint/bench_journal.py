@@ -0,0 +1,76 @@
+"""
+Benchmark quitting while an autosave checkpoint is still being written.
+
+Fills a canvas with noise (so the tiles barely compress), takes one
+checkpoint of all of it, and closes the journal straight away, as happens
+when quitting just after a big change. Closing as on a clean exit throws
+the pending checkpoint away; closing with --keep (remove=False) writes it
+all first, at the autosave rate. Reports the time the GUI thread spent
+copying tiles for the checkpoint and the time close() took.
+
+Run with: python bench_journal.py [--size 3000x3000] [--rate BYTES] [--keep]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import constants
+import journal
+import numpy as np
+from canvas import Canvas
+from fill import image_array
+from PyQt6.QtWidgets import QApplication
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="3000x3000")
+    parser.add_argument("--rate", type=int, default=constants.AUTOSAVE_BYTES_PER_SECOND)
+    parser.add_argument("--keep", action="store_true", help="close without discarding")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = QApplication(sys.argv[:1])
+    canvas = Canvas()
+    canvas.initialize()
+    canvas.blank(width, height)
+    pixels = image_array(canvas.image)
+    pixels[:] = np.random.default_rng(0).integers(
+        0, 2**32, pixels.shape, dtype=np.uint32
+    )
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, constants.AUTOSAVE_FILE % 0)
+    autosave = journal.Journal(canvas, path, rate=args.rate, interval=10**9)
+    canvas.damage(canvas.image.rect())
+
+    start = time.perf_counter()
+    autosave.checkpoint()
+    copy = time.perf_counter() - start
+    # Let the writer get going.
+    time.sleep(0.2)
+    app.processEvents()
+
+    start = time.perf_counter()
+    autosave.close(remove=not args.keep)
+    close = time.perf_counter() - start
+
+    print("%dx%d checkpoint, %d MB/s:" % (width, height, args.rate // (1024 * 1024)))
+    print("  copy tiles  %8.1f ms" % (copy * 1000))
+    print(
+        "  close       %8.1f ms (%s)"
+        % (close * 1000, "writes it all" if args.keep else "discards")
+    )
+
+    if os.path.exists(path):
+        os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
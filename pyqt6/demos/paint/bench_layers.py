@@ -0,0 +1,139 @@
+"""
+Benchmark the layer composition caches in layers.py with many layers.
+
+For each layer count, a stack is built with the active layer in the
+middle, and brush strokes are painted into it. Each stroke is timed as
+the canvas would do it: paint the segment, mark it dirty and recomposite.
+The same strokes are then timed recompositing every layer under the
+dirty rect directly, which is what drawing without the caches costs.
+
+Also times switching the active layer, which rebuilds the caches.
+
+Run with: python bench_layers.py [--layers 1,5,10,25] [--size 2000x1500]
+[--strokes N] [--blend]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from layers import BLEND_MODES, Layer, LayerStack, blank_layer_image
+from PyQt6.QtCore import QPointF, QRect, QSize, Qt
+from PyQt6.QtGui import QColor, QGuiApplication, QPainter, QPen
+from store import new_image
+
+
+def build_stack(count, size, blend):
+    """
+    A white background and count - 1 layers of translucent blobs. With
+    blend, every other layer uses a blend mode other than normal.
+    """
+    rng = random.Random(count)
+    background = new_image(size.width(), size.height())
+    background.fill(QColor("white"))
+    stack = LayerStack(background)
+
+    modes = [mode for mode in BLEND_MODES if mode != "normal"]
+    for n in range(1, count):
+        image = blank_layer_image(size)
+        p = QPainter(image)
+        p.setPen(Qt.PenStyle.NoPen)
+        for _ in range(20):
+            p.setBrush(QColor.fromHsv(rng.randrange(360), 200, 220, 160))
+            w, h = rng.randrange(50, 600), rng.randrange(50, 600)
+            p.drawEllipse(
+                rng.randrange(size.width() - w), rng.randrange(size.height() - h), w, h
+            )
+        p.end()
+        mode = modes[n % len(modes)] if blend and n % 2 else "normal"
+        stack.add(Layer("Layer %d" % n, image, opacity=0.8, mode=mode), n)
+
+    stack.set_active(count // 2)
+    return stack
+
+
+def strokes(size, count):
+    rng = random.Random(0)
+    for _ in range(count):
+        x, y = rng.uniform(0, size.width()), rng.uniform(0, size.height())
+        yield QPointF(x, y), QPointF(x + rng.uniform(-40, 40), y + rng.uniform(-40, 40))
+
+
+def paint(stack, start, end):
+    pen = QPen(QColor("black"), 20, cap=Qt.PenCapStyle.RoundCap)
+    p = QPainter(stack.layer.image)
+    p.setPen(pen)
+    p.drawLine(start, end)
+    p.end()
+    return QRect(start.toPoint(), end.toPoint()).normalized().adjusted(-11, -11, 11, 11)
+
+
+def cached(stack, rect):
+    stack.invalidate(rect)
+    stack.update()
+
+
+def uncached(stack, rect):
+    """
+    Recomposite rect from every layer, as drawing without caches would.
+    """
+    p = QPainter(stack.composite)
+    p.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+    p.fillRect(rect, Qt.GlobalColor.transparent)
+    for layer in stack.layers:
+        layer.draw(p, rect)
+    p.end()
+
+
+def measure(stack, size, count, composite):
+    times = []
+    for start, end in strokes(size, count):
+        t = time.perf_counter()
+        composite(stack, paint(stack, start, end))
+        times.append(time.perf_counter() - t)
+    return statistics.median(times) * 1000, max(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--layers", default="1,5,10,25")
+    parser.add_argument("--size", default="2000x1500")
+    parser.add_argument("--strokes", type=int, default=200)
+    parser.add_argument("--blend", action="store_true", help="mix in blend modes")
+    args = parser.parse_args()
+
+    app = QGuiApplication(sys.argv)  # noqa: F841
+    size = QSize(*(int(v) for v in args.size.split("x")))
+
+    print(
+        "Canvas %dx%d, %d strokes per run" % (size.width(), size.height(), args.strokes)
+    )
+    print(
+        "%6s  %18s  %18s  %14s"
+        % ("layers", "cached ms (max)", "uncached ms (max)", "switch ms")
+    )
+    for count in (int(n) for n in args.layers.split(",")):
+        stack = build_stack(count, size, args.blend)
+        stack.update()
+
+        fast = "%9.3f (%6.2f)" % measure(stack, size, args.strokes, cached)
+        # A single layer is drawn as it is, with nothing to composite.
+        slow = "-"
+        if stack.composite is not None:
+            slow = "%9.3f (%6.2f)" % measure(stack, size, args.strokes, uncached)
+
+        start = time.perf_counter()
+        stack.set_active(max(stack.active - 1, 0))
+        stack.update()
+        switch = (time.perf_counter() - start) * 1000
+
+        print("%6d  %18s  %18s  %14.1f" % (count, fast, slow, switch))
+
+
+if __name__ == "__main__":
+    main()
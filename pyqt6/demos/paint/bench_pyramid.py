@@ -0,0 +1,108 @@
+"""
+Benchmark painting a large canvas zoomed out, from the mipmap pyramid.
+
+Shows an image in an 800x600 canvas zoomed to fit, and times the first
+repaint (which builds the pyramid tiles it needs), then repaints with the
+tiles cached, and a repaint after a small edit (which rebuilds only the
+tiles it touched). For comparison it also times drawing the whole image
+scaled down directly with QPainter's smooth transform, which is fast but
+samples the image bilinearly rather than averaging it, so fine detail
+aliases; it also reads every page of a memory-mapped image.
+
+Run with: python bench_pyramid.py [--size 8000x6000] [--rounds 10]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from canvas import Canvas
+from PyQt6.QtCore import QRect, QRectF
+from PyQt6.QtGui import QColor, QImage, QPainter
+from PyQt6.QtWidgets import QApplication
+
+
+def scribble(image, count, seed=0):
+    """
+    Cover the image with random colored rects, so the tiles aren't flat.
+    """
+    rng = random.Random(seed)
+    p = QPainter(image)
+    for _ in range(count):
+        w, h = rng.randrange(20, 800), rng.randrange(20, 800)
+        x, y = rng.randrange(image.width() - w), rng.randrange(image.height() - h)
+        p.fillRect(x, y, w, h, QColor.fromHsv(rng.randrange(360), 200, 220))
+    p.end()
+
+
+def timed(fn, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="8000x6000")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = QApplication(sys.argv[:1])
+    canvas = Canvas()
+    canvas.initialize()
+    canvas.resize(800, 600)
+    canvas.show()
+    canvas.blank(width, height)
+    scribble(canvas.image, 2000)
+    canvas.zoom_fit()
+    app.processEvents()
+    canvas.pyramid.invalidate()
+
+    start = time.perf_counter()
+    canvas.repaint()
+    first = time.perf_counter() - start
+    cached = timed(canvas.repaint, args.rounds)
+
+    def edit():
+        rect = QRect(width // 2, height // 2, 100, 100)
+        p = QPainter(canvas.image)
+        p.fillRect(rect, QColor("black"))
+        p.end()
+        canvas.damage(rect)
+        canvas.repaint()
+
+    edited = timed(edit, args.rounds)
+
+    # Drawing the whole image scaled down, into a canvas sized target.
+    target = QImage(canvas.size(), QImage.Format.Format_ARGB32_Premultiplied)
+    fit = QRectF(0, 0, width * canvas.zoom, height * canvas.zoom)
+
+    def direct():
+        p = QPainter(target)
+        p.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        p.drawImage(fit, canvas.image)
+        p.end()
+
+    scaled = timed(direct, max(args.rounds // 5, 1))
+
+    print(
+        "%dx%d image at %d%% in an 800x600 canvas, median of %d:"
+        % (width, height, round(canvas.zoom * 100), args.rounds)
+    )
+    print("  first paint (builds tiles) %8.1f ms" % (first * 1000))
+    print("  repaint, tiles cached      %8.1f ms" % (cached * 1000))
+    print("  edit and repaint           %8.1f ms" % (edited * 1000))
+    print("  whole image, bilinear      %8.1f ms" % (scaled * 1000))
+
+
+if __name__ == "__main__":
+    main()
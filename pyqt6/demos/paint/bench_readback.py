@@ -0,0 +1,125 @@
+"""
+Benchmark the tools which read pixels back: the dropper and copying a
+rectangle or polygon selection, on a large canvas.
+
+Each is timed through its tool, which reads only the pixels it needs from
+the composited image. For comparison the same reads are timed as the
+canvas did them before, on a pixmap of the whole canvas (as the label
+used to hold): converting it to an image to read one pixel, and masking
+all of it with a full size QBitmap to copy a polygon.
+
+Run with: python bench_readback.py [--size 8000x6000] [--rounds 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from canvas import Canvas
+from PyQt6.QtCore import QEvent, QPointF, Qt
+from PyQt6.QtGui import (
+    QBitmap,
+    QBrush,
+    QColor,
+    QMouseEvent,
+    QPainter,
+    QPen,
+    QPixmap,
+    QPolygonF,
+)
+from PyQt6.QtWidgets import QApplication
+
+
+def timed(fn, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def press(x, y):
+    pos = QPointF(x, y)
+    return QMouseEvent(
+        QEvent.Type.MouseButtonPress,
+        pos,
+        pos,
+        Qt.MouseButton.LeftButton,
+        Qt.MouseButton.LeftButton,
+        Qt.KeyboardModifier.NoModifier,
+    )
+
+
+def old_dropper(pixmap, pos):
+    return QColor(pixmap.toImage().pixel(pos.toPoint())).name()
+
+
+def old_polygon_copy(pixmap, points):
+    pixmap = QPixmap(pixmap)
+    bitmap = QBitmap(pixmap.size())
+    bitmap.clear()
+    p = QPainter(bitmap)
+    userpoly = QPolygonF(points).toPolygon()
+    p.setPen(QPen(Qt.GlobalColor.color1))
+    p.setBrush(QBrush(Qt.GlobalColor.color1))
+    p.drawPolygon(userpoly)
+    p.end()
+    pixmap.setMask(bitmap)
+    return pixmap.copy(userpoly.boundingRect())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="8000x6000")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = QApplication(sys.argv[:1])
+    canvas = Canvas()
+    canvas.initialize()
+    canvas.blank(width, height)
+    pixmap = QPixmap.fromImage(canvas.composite())
+
+    cx, cy = width / 2, height / 2
+    points = [
+        QPointF(cx - 200, cy - 150),
+        QPointF(cx + 150, cy - 200),
+        QPointF(cx + 220, cy + 120),
+        QPointF(cx - 100, cy + 180),
+    ]
+
+    canvas.set_mode("dropper")
+    event = press(cx, cy)
+    dropper = timed(lambda: canvas.tool.mousePressEvent(event), args.rounds)
+    old = timed(lambda: old_dropper(pixmap, QPointF(cx, cy)), args.rounds)
+    results = [("dropper", old, dropper)]
+
+    canvas.set_mode("selectrect")
+    canvas.tool.origin_pos, canvas.tool.current_pos = points[0], points[2]
+    canvas.tool.locked = True
+    rect = timed(canvas.tool.copy, args.rounds)
+    selected = QPolygonF([points[0], points[2]]).boundingRect().toRect()
+    old = timed(lambda: pixmap.copy(selected), args.rounds)
+    results.append(("rect copy", old, rect))
+
+    canvas.set_mode("selectpoly")
+    canvas.tool.points, canvas.tool.current_pos = points[:-1], points[-1]
+    canvas.tool.locked = True
+    poly = timed(canvas.tool.copy, args.rounds)
+    old = timed(lambda: old_polygon_copy(pixmap, points), args.rounds)
+    results.append(("polygon copy", old, poly))
+
+    print("%dx%d canvas, median of %d:" % (width, height, args.rounds))
+    print("  %-14s %14s %14s" % ("", "whole pixmap", "tool"))
+    for name, before, after in results:
+        print("  %-14s %11.2f ms %11.2f ms" % (name, before * 1000, after * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Replay a recorded input session headless, and report how long each tool's
+event handlers took.
+
+Record a session with: python main.py --record session.jsonl
+Replay it with: python bench_replay.py session.jsonl [--paint] [--repeat N]
+
+Without a session file, a synthetic one is generated which exercises every
+mode with a 1000 Hz mouse (use --save to keep it). Prints latency
+percentiles per mode and event type, the stroke input stats (events per
+frame and flush times, see stroke.InputStats), and a SHA-256 checksum of
+the final image. The checksum is deterministic (the spray is seeded), so
+a change in it means a change in what the tools draw.
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import constants
+import numpy as np
+import recorder
+import spray
+from canvas import Canvas
+from fill import image_array
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication
+
+LEFT = Qt.MouseButton.LeftButton.value
+NONE = Qt.MouseButton.NoButton.value
+
+
+def synthetic_session(seed=0, strokes=5, rate=1000):
+    """
+    Generate a session using every mode, with events at rate per second.
+    """
+    rng = random.Random(seed)
+    w, h = constants.CANVAS_DIMENSIONS
+    records = [
+        dict(
+            type="start",
+            size=[w, h],
+            mode=constants.MODES[0],
+            primary="#000000",
+            secondary="#ffffff",
+            stamp=constants.STAMPS[0],
+            config=recorder.config_state(Canvas.config),
+        )
+    ]
+    clock = [0.0]
+
+    def log(**record):
+        clock[0] += 1 / rate
+        record["t"] = round(clock[0], 6)
+        records.append(record)
+
+    def mouse(kind, x, y, button=NONE, buttons=NONE):
+        log(type=kind, x=x, y=y, button=button, buttons=buttons, modifiers=0)
+
+    def drag(points):
+        mouse("press", *points[0], LEFT, LEFT)
+        for x, y in points[1:]:
+            mouse("move", x, y, NONE, LEFT)
+        # Hold still for a few frames before letting go, so the stroke's
+        # last frame is flushed before it ends.
+        clock[0] += 0.05
+        mouse("release", *points[-1], LEFT, NONE)
+
+    def wander(n):
+        x, y = rng.uniform(0, w), rng.uniform(0, h)
+        angle = rng.uniform(0, 2 * math.pi)
+        points = []
+        for _ in range(n):
+            angle += rng.gauss(0, 0.2)
+            x = min(max(x + 2 * math.cos(angle), 0), w - 1)
+            y = min(max(y + 2 * math.sin(angle), 0), h - 1)
+            points.append((round(x, 2), round(y, 2)))
+        return points
+
+    for mode in constants.MODES:
+        log(type="mode", value=mode)
+        log(type="primary", value=rng.choice(constants.COLORS))
+        for _ in range(strokes):
+            if mode in ("fill", "dropper", "stamp"):
+                x, y = wander(1)[0]
+                mouse("press", x, y, LEFT, LEFT)
+                mouse("release", x, y, LEFT, NONE)
+
+            elif mode in ("polyline", "polygon", "selectpoly"):
+                points = wander(200)
+                for x, y in points[::50]:
+                    mouse("press", x, y, LEFT, LEFT)
+                    mouse("release", x, y, LEFT, NONE)
+                for x, y in points:
+                    mouse("move", x, y)
+                mouse("dblclick", *points[-1], LEFT, LEFT)
+
+            elif mode == "text":
+                x, y = wander(1)[0]
+                mouse("press", x, y, LEFT, LEFT)
+                mouse("release", x, y, LEFT, NONE)
+                for char in "Piecasso":
+                    log(type="key", key=ord(char.upper()), text=char, modifiers=0)
+                mouse("press", x, y, LEFT, LEFT)
+                mouse("release", x, y, LEFT, NONE)
+
+            else:
+                drag(wander(200))
+
+    return records
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("session", nargs="?", help="recorded .jsonl session")
+    parser.add_argument("--save", metavar="PATH", help="save the session replayed")
+    parser.add_argument("--paint", action="store_true", help="time repaints too")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+
+    if args.session:
+        records = recorder.load(args.session)
+    else:
+        records = synthetic_session(args.seed)
+    if args.save:
+        recorder.save(args.save, records)
+
+    canvas = Canvas()
+    canvas.initialize()
+    canvas.resize(*records[0]["size"])
+    if args.paint:
+        canvas.show()
+        # Let the window be exposed, or repaint() does nothing.
+        app.processEvents()
+
+    timings = {}
+    for _ in range(args.repeat):
+        # Seed the spray, so every run draws the same image.
+        spray.rng = np.random.default_rng(args.seed)
+        start = time.perf_counter()
+        for key, times in recorder.replay(canvas, records, paint=args.paint).items():
+            timings.setdefault(key, []).extend(times)
+        total = time.perf_counter() - start
+
+    print(
+        "%d records, replayed %d time(s), last run %.0f ms"
+        % (len(records), args.repeat, total * 1000)
+    )
+    print(
+        "%-12s %-8s %7s %9s %9s %9s %9s"
+        % ("mode", "event", "count", "p50 ms", "p90 ms", "p99 ms", "max ms")
+    )
+    for (mode, kind), times in sorted(timings.items()):
+        print(
+            "%-12s %-8s %7d %9.3f %9.3f %9.3f %9.3f"
+            % (
+                mode,
+                kind,
+                len(times),
+                percentile(times, 50) * 1000,
+                percentile(times, 90) * 1000,
+                percentile(times, 99) * 1000,
+                max(times) * 1000,
+            )
+        )
+
+    # Latency isn't shown, as a replay runs faster than real time.
+    strokes = canvas.input_stats.summary()
+    print(
+        "stroke input: %.1f events/frame, flush mean %.3f ms, max %.3f ms "
+        "(last %d flushes)"
+        % (
+            strokes["events_per_frame"],
+            strokes["flush_ms"],
+            strokes["flush_max_ms"],
+            len(canvas.input_stats.events),
+        )
+    )
+
+    image = canvas.image
+    digest = hashlib.sha256(image_array(image).tobytes()).hexdigest()
+    print("image %dx%d sha256 %s" % (image.width(), image.height(), digest))
+
+
+if __name__ == "__main__":
+    main()
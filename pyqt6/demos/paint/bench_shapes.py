@@ -0,0 +1,105 @@
+"""
+Benchmark the vector layer shape index in vector.py.
+
+Fills a ShapeDocument with random rects, ellipses, lines and polygons, then
+times hit-testing random points, moving random shapes (redrawing the area
+they leave and enter, as the canvas does) and redrawing the whole image.
+
+Run with: python bench_shapes.py [--shapes 50000] [--size 2000x1500]
+[--hits N]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QPointF, QRectF, QSize, Qt
+from PyQt6.QtGui import QBrush, QColor, QGuiApplication, QPen
+from store import new_image
+from vector import Shape, ShapeDocument
+
+KINDS = ["drawRect", "drawEllipse", "drawLine", "drawPolygon"]
+
+
+def random_shape(rng, size, n):
+    x, y = rng.uniform(0, size.width()), rng.uniform(0, size.height())
+    w, h = rng.uniform(5, 80), rng.uniform(5, 80)
+    kind = KINDS[n % len(KINDS)]
+    if kind == "drawLine":
+        args = (QPointF(x, y), QPointF(x + w, y + h))
+    elif kind == "drawPolygon":
+        args = (QPointF(x, y), QPointF(x + w, y), QPointF(x, y + h))
+    else:
+        args = (QRectF(x, y, w, h),)
+    pen = QPen(QColor.fromHsv(rng.randrange(360), 200, 200), rng.randint(1, 5))
+    brush = QBrush(QColor.fromHsv(rng.randrange(360), 100, 255)) if n % 2 else None
+    return Shape(kind, args, pen, brush)
+
+
+def timings(values):
+    values = sorted(values)
+    return (
+        statistics.median(values) * 1000,
+        values[int(len(values) * 0.99)] * 1000,
+        values[-1] * 1000,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=50000)
+    parser.add_argument("--size", default="2000x1500")
+    parser.add_argument("--hits", type=int, default=5000)
+    args = parser.parse_args()
+
+    app = QGuiApplication(sys.argv)  # noqa: F841
+    size = QSize(*(int(v) for v in args.size.split("x")))
+    rng = random.Random(0)
+
+    doc = ShapeDocument()
+    start = time.perf_counter()
+    for n in range(args.shapes):
+        doc.add(random_shape(rng, size, n))
+    print(
+        "%d shapes on %dx%d, indexed in %.2f s"
+        % (args.shapes, size.width(), size.height(), time.perf_counter() - start)
+    )
+
+    def point():
+        return QPointF(rng.uniform(0, size.width()), rng.uniform(0, size.height()))
+
+    hits = []
+    for _ in range(args.hits):
+        p = point()
+        start = time.perf_counter()
+        doc.hit(p)
+        hits.append(time.perf_counter() - start)
+
+    image = new_image(size.width(), size.height())
+    image.fill(Qt.GlobalColor.transparent)
+    start = time.perf_counter()
+    doc.render(image, image.rect())
+    full = time.perf_counter() - start
+
+    moves = []
+    keys = list(doc.shapes)
+    for _ in range(200):
+        key = rng.choice(keys)
+        start = time.perf_counter()
+        moved = doc.shapes[key].translated(QPointF(rng.uniform(-20, 20), 0))
+        doc.render(image, doc.set(key, moved).toAlignedRect())
+        moves.append(time.perf_counter() - start)
+
+    print("%-10s  %9s  %9s  %9s" % ("", "p50 ms", "p99 ms", "max ms"))
+    print("%-10s  %9.3f  %9.3f  %9.3f" % ("hit test", *timings(hits)))
+    print("%-10s  %9.3f  %9.3f  %9.3f" % ("move", *timings(moves)))
+    print("full redraw %.1f ms" % (full * 1000))
+
+
+if __name__ == "__main__":
+    main()
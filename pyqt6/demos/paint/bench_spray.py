@@ -0,0 +1,95 @@
+"""
+Benchmark the spray tool, comparing the original per-dot loop against the
+batched NumPy spray in spray.py.
+
+Each "event" is the work done by one spray mouse move: generate the dots
+around a point and paint them into the canvas image. Reports events per
+second at a range of brush sizes.
+
+Run with: python bench_spray.py [--events N] [--sizes 1,5,10,20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import constants
+import numpy as np
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QColor, QGuiApplication, QImage, QPainter, QPen
+from spray import spray_offsets
+from stroke import points_polygon
+
+
+def legacy_spray(image, pos, size, color):
+    """
+    The original Canvas.spray_mouseMoveEvent loop, for comparison.
+    """
+    p = QPainter(image)
+    p.setPen(QPen(color, 1))
+    for n in range(size * constants.SPRAY_PAINT_N):
+        xo = random.gauss(0, size * constants.SPRAY_PAINT_MULT)
+        yo = random.gauss(0, size * constants.SPRAY_PAINT_MULT)
+        p.drawPoint(QPointF(pos.x() + xo, pos.y() + yo))
+    p.end()
+
+
+def numpy_spray(image, pos, size, color):
+    """
+    The current Canvas spray path, with the default density and falloff.
+    """
+    offsets = spray_offsets(
+        size * constants.SPRAY_PAINT_N, size * constants.SPRAY_PAINT_MULT
+    )
+    points, _ = points_polygon(offsets + np.array([pos.x(), pos.y()]))
+    p = QPainter(image)
+    p.setPen(QPen(color, 1))
+    p.drawPoints(points)
+    p.end()
+
+
+def measure(fn, image, size, events):
+    rng = random.Random(0)
+    w, h = image.width(), image.height()
+    color = QColor("red")
+    start = time.perf_counter()
+    for _ in range(events):
+        fn(image, QPointF(rng.uniform(0, w), rng.uniform(0, h)), size, color)
+    return events / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--sizes", default="1,5,10,20")
+    args = parser.parse_args()
+
+    app = QGuiApplication(sys.argv)  # noqa: F841
+
+    image = QImage(*constants.CANVAS_DIMENSIONS, constants.IMAGE_FORMAT)
+    image.fill(QColor("white"))
+
+    print(
+        "Canvas %dx%d, %d events per run" % (*constants.CANVAS_DIMENSIONS, args.events)
+    )
+    for size in (int(s) for s in args.sizes.split(",")):
+        legacy = measure(legacy_spray, image, size, args.events)
+        batched = measure(numpy_spray, image, size, args.events)
+        print(
+            "size %2d (%5d dots)   legacy %8.0f events/s   numpy %8.0f events/s   x%.1f"
+            % (
+                size,
+                size * constants.SPRAY_PAINT_N,
+                legacy,
+                batched,
+                batched / legacy,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
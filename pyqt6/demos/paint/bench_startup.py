@@ -0,0 +1,207 @@
+"""
+Benchmark the cost of loading Piecasso's resources at startup, comparing
+the generated resources_rc.py module against a compiled resources.rcc.
+
+Every copy of the app (PyQt5, PyQt6, PySide2 and PySide6) is measured with
+its own binding, each in a fresh interpreter:
+
+- module (cold): import resources_rc.py with no cached bytecode, so it is
+  parsed and compiled, then register it.
+- module (warm): the same import from cached bytecode.
+- rcc: QResource.registerResource() on the .rcc file.
+
+Each mode then reads one stamp, to show the cost of first use. Copies
+without a resources.rcc get one built from the data in their
+resources_rc.py. The generated modules all import PySide6, so they are
+pointed at the copy's own binding before being timed.
+
+Run with: python bench_startup.py [--runs N]
+"""
+
+import argparse
+import ast
+import json
+import os
+import py_compile
+import re
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+COPIES = [
+    ("pyqt5", "PyQt5"),
+    ("pyqt6", "PyQt6"),
+    ("pyside2", "PySide2"),
+    ("pyside6", "PySide6"),
+]
+
+# Run in a fresh interpreter for each measurement; prints JSON timings.
+PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {path!r})
+from {binding} import QtCore
+
+start = time.perf_counter()
+if {mode!r} == "rcc":
+    assert QtCore.QResource.registerResource({rcc!r})
+else:
+    import resources_rc
+load = time.perf_counter() - start
+
+start = time.perf_counter()
+f = QtCore.QFile(":/stamps/pie-apple.png")
+f.open(QtCore.QIODevice.OpenModeFlag.ReadOnly)
+assert len(f.readAll()) > 0
+first_use = time.perf_counter() - start
+
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(dict(load=load, first_use=first_use, rss=rss)))
+"""
+
+
+def module_data(path):
+    """
+    Return the (struct, names, data) byte strings from a resources_rc.py.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    values = {
+        node.targets[0].id: node.value.value
+        for node in tree.body
+        if isinstance(node, ast.Assign)
+        and isinstance(node.targets[0], ast.Name)
+        and node.targets[0].id.startswith("qt_resource_")
+    }
+    return (
+        values["qt_resource_struct"],
+        values["qt_resource_name"],
+        values["qt_resource_data"],
+    )
+
+
+def build_rcc(module_path, rcc_path):
+    """
+    Write the resources from a resources_rc.py as a binary .rcc file.
+
+    A (version 3) .rcc is a short header followed by the same data, names
+    and tree blobs the Python module registers.
+    """
+    tree, names, data = module_data(module_path)
+    header = 4 + 5 * 4
+    with open(rcc_path, "wb") as f:
+        f.write(b"qres")
+        f.write(
+            struct.pack(
+                ">IIIII",
+                3,  # Format version.
+                header + len(data) + len(names),  # Tree offset.
+                header,  # Data offset.
+                header + len(data),  # Names offset.
+                0,  # Flags.
+            )
+        )
+        f.write(data)
+        f.write(names)
+        f.write(tree)
+
+
+def probe(binding, path, mode, rcc=None):
+    code = PROBE.format(binding=binding, path=path, mode=mode, rcc=rcc)
+    env = dict(os.environ)
+    if mode == "cold":
+        # Parse and compile the module every time.
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout)
+
+
+def measure(binding, workdir, runs):
+    """
+    Time each mode for one copy, with its resources in workdir.
+    """
+    module = os.path.join(workdir, "resources_rc.py")
+    rcc = os.path.join(workdir, "resources.rcc")
+    pycache = os.path.join(workdir, "__pycache__")
+
+    results = {}
+    for mode in ("cold", "warm", "rcc"):
+        samples = []
+        for _ in range(runs):
+            if mode == "cold":
+                shutil.rmtree(pycache, ignore_errors=True)
+            elif mode == "warm":
+                py_compile.compile(module)
+            samples.append(probe(binding, workdir, mode, rcc))
+        results[mode] = {
+            key: statistics.median(s[key] for s in samples) for key in samples[0]
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        "%-8s %-13s %10s %14s %10s"
+        % ("copy", "mode", "load ms", "first use ms", "max RSS MB")
+    )
+    for name, binding in COPIES:
+        paint = os.path.join(ROOT, name, "demos", "paint")
+        if not os.path.exists(os.path.join(paint, "resources_rc.py")):
+            continue
+
+        with tempfile.TemporaryDirectory() as workdir:
+            # Point the module at this copy's own binding.
+            with open(os.path.join(paint, "resources_rc.py")) as f:
+                source = f.read()
+            source = re.sub(
+                r"^from \w+ import QtCore$",
+                "from %s import QtCore" % binding,
+                source,
+                flags=re.MULTILINE,
+            )
+            with open(os.path.join(workdir, "resources_rc.py"), "w") as f:
+                f.write(source)
+
+            rcc = os.path.join(paint, "resources.rcc")
+            if os.path.exists(rcc):
+                shutil.copy(rcc, os.path.join(workdir, "resources.rcc"))
+            else:
+                build_rcc(
+                    os.path.join(paint, "resources_rc.py"),
+                    os.path.join(workdir, "resources.rcc"),
+                )
+
+            try:
+                results = measure(binding, workdir, args.runs)
+            except RuntimeError as e:
+                print("%-8s skipped: %s" % (name, e))
+                continue
+
+        labels = {"cold": "module (cold)", "warm": "module (warm)", "rcc": "rcc"}
+        for mode, result in results.items():
+            print(
+                "%-8s %-13s %10.1f %14.2f %10.1f"
+                % (
+                    name,
+                    labels[mode],
+                    result["load"] * 1000,
+                    result["first_use"] * 1000,
+                    result["rss"] / 1024,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,42 @@
-import random
+import time
 
 import constants
-from PyQt6.QtCore import QPoint, QPointF, QRect, Qt, pyqtSignal
+import numpy as np
+from atlas import StampAtlas
+from export import ExportJob
+from fill import image_array
+from filters import FILTERS, FilterJob, rect_slices
+from history import History
+from layers import Layer, LayerStack, blank_layer_image
+from PyQt6.QtCore import (
+    QLineF,
+    QPointF,
+    QRect,
+    QRectF,
+    QSize,
+    QSizeF,
+    Qt,
+    QThreadPool,
+    QTimer,
+    pyqtSignal,
+)
 from PyQt6.QtGui import (
-    QBitmap,
     QBrush,
     QColor,
     QFont,
+    QMouseEvent,
     QPainter,
+    QPalette,
     QPen,
     QPixmap,
-    QPolygon,
+    QPolygonF,
+    QTransform,
 )
 from PyQt6.QtWidgets import QLabel
-from utils import build_font
+from store import MappedImage, Pyramid, from_image, new_image
+from stroke import InputStats, catmull_rom, points_polygon
+from tools import tool_for
+from vector import ShapeDocument
 
 
 class Canvas(QLabel):
@@ -24,12 +47,25 @@ class Canvas(QLabel):
 
     primary_color_updated = pyqtSignal(str)
     secondary_color_updated = pyqtSignal(str)
+    layers_updated = pyqtSignal()
+    image_updated = pyqtSignal(QRect)
+    zoom_changed = pyqtSignal(float)
 
     # Store configuration settings, including pen width, fonts etc.
     config = {
         # Drawing options.
         "size": 1,
         "fill": True,
+        # Fill tool options.
+        "fill_tolerance": 0,
+        "fill_connectivity": 4,
+        # Spray tool options: dots relative to SPRAY_PAINT_N, and 0 (even)
+        # to 1 (gaussian) for how they thin out towards the edge.
+        "spray_density": 1.0,
+        "spray_falloff": 1.0,
+        # Stamp options: scale, and rotation in degrees.
+        "stamp_scale": 1.0,
+        "stamp_angle": 0,
         # Font options.
         "font": QFont("Times"),
         "fontsize": 12,
@@ -38,12 +74,62 @@ class Canvas(QLabel):
         "underline": False,
     }
 
-    active_color = None
-    preview_pen = None
+    # The tool for the current mode, and its event handlers.
+    tool = None
+    handlers = None
 
     timer_event = None
 
-    current_stamp = None
+    overlay_event = None
+    overlay_bounds = None
+    overlay_rect = QRect()
+
+    # The stamps, and the path of the one in use.
+    stamps = None
+    current_stamp_path = None
+
+    # Stroke input queue: positions waiting to be drawn, when the oldest
+    # arrived, and the trailing control points of the curve drawn so far.
+    stroke_queue = ()
+    stroke_queued_at = None
+    stroke_tail = ()
+
+    # The running FilterJob, if any.
+    filter_job = None
+
+    # Running ExportJobs, which must be told before the image changes.
+    export_jobs = ()
+
+    # The active layer's image, which the tools paint into, and the stack
+    # of all layers.
+    image = None
+    layers = None
+    pyramid = None
+
+    # View: scale factor, and the image point shown at the widget's top left.
+    zoom = 1.0
+    offset = QPointF()
+    pan_pos = None
+    # Whether to outline the pixels when zoomed in to PIXEL_GRID_ZOOM.
+    show_grid = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.history = History()
+
+        self.input_stats = InputStats()
+        self.stroke_timer = QTimer(self)
+        self.stroke_timer.setSingleShot(True)
+        self.stroke_timer.setInterval(constants.FRAME_INTERVAL)
+        self.stroke_timer.timeout.connect(self.flush_stroke)
+
+        self.filter_pool = QThreadPool(self)
+
+        self.stamps = StampAtlas()
+        self.stamps.add(constants.STAMPS)
+
+        self.tool = tool_for(self, self.mode)
+        self.handlers = self.tool.handlers
 
     def initialize(self):
         self.background_color = (
@@ -57,673 +143,826 @@ class Canvas(QLabel):
             else QColor(Qt.GlobalColor.white)
         )
         self.eraser_color.setAlpha(100)
-        self.reset()
+        self.blank(*constants.CANVAS_DIMENSIONS)
 
     def reset(self):
-        # Create the pixmap for display.
-        pixmap = QPixmap(*constants.CANVAS_DIMENSIONS)
-        pixmap.fill(self.background_color)
-        self.setPixmap(pixmap)
-
-    def set_primary_color(self, hex):
-        self.primary_color = QColor(hex)
-
-    def set_secondary_color(self, hex):
-        self.secondary_color = QColor(hex)
-
-    def set_config(self, key, value):
-        self.config[key] = value
-
-    def set_mode(self, mode):
-        # Clean up active timer animations.
-        self.timer_cleanup()
-        # Reset mode-specific vars (all)
-        self.active_shape_fn = None
-        self.active_shape_args = ()
-
-        self.origin_pos = None
-
-        self.current_pos = None
-        self.last_pos = None
-
-        self.history_pos = None
-        self.last_history = []
-
-        self.current_text = ""
-        self.last_text = ""
-
-        self.last_config = {}
-
-        self.dash_offset = 0
-        self.locked = False
-        # Apply the mode
-        self.mode = mode
-
-    def reset_mode(self):
-        self.set_mode(self.mode)
-
-    def on_timer(self):
-        if self.timer_event:
-            self.timer_event()
-
-    def timer_cleanup(self):
-        if self.timer_event:
-            # Stop the timer, then trigger cleanup.
-            timer_event = self.timer_event
-            self.timer_event = None
-            timer_event(final=True)
-
-    # Mouse events.
-
-    def mousePressEvent(self, e):
-        fn = getattr(self, "%s_mousePressEvent" % self.mode, None)
-        if fn:
-            return fn(e)
-
-    def mouseMoveEvent(self, e):
-        fn = getattr(self, "%s_mouseMoveEvent" % self.mode, None)
-        if fn:
-            return fn(e)
-
-    def mouseReleaseEvent(self, e):
-        fn = getattr(self, "%s_mouseReleaseEvent" % self.mode, None)
-        if fn:
-            return fn(e)
-
-    def mouseDoubleClickEvent(self, e):
-        fn = getattr(self, "%s_mouseDoubleClickEvent" % self.mode, None)
-        if fn:
-            return fn(e)
-
-    # Generic events (shared by brush-like tools)
-
-    def generic_mousePressEvent(self, e):
-        self.last_pos = e.position()
-
-        if e.button() == Qt.MouseButton.LeftButton:
-            self.active_color = self.primary_color
+        # Clear the active layer, to the background color if it's the bottom.
+        self.cancel_filter()
+        if self.layers.layer.shapes is not None:
+            self.reset_mode()
+            self.begin_edit()
+            for key in list(self.layers.layer.shapes.shapes):
+                self.change_shape(key, None)
+            self.end_edit()
+            return
+        self.begin_edit()
+        self.touch(self.image.rect())
+        if self.layers.active == 0:
+            self.image.fill(self.background_color)
         else:
-            self.active_color = self.secondary_color
-
-    def generic_mouseReleaseEvent(self, e):
-        self.last_pos = None
+            self.image.fill(Qt.GlobalColor.transparent)
+        self.end_edit()
+        self.damage(self.image.rect())
 
-    # Mode-specific events.
+    def blank(self, width, height):
+        # Create the image we draw on.
+        image = new_image(width, height)
+        image.fill(self.background_color)
+        self.replace_image(image)
 
-    # Select polygon events
-
-    def selectpoly_mousePressEvent(self, e):
-        if not self.locked or e.button == Qt.MouseButton.RightButton:
-            self.active_shape_fn = "drawPolygon"
-            self.preview_pen = constants.SELECTION_PEN
-            self.generic_poly_mousePressEvent(e)
-
-    def selectpoly_timerEvent(self, final=False):
-        self.generic_poly_timerEvent(final)
-
-    def selectpoly_mouseMoveEvent(self, e):
-        if not self.locked:
-            self.generic_poly_mouseMoveEvent(e)
-
-    def selectpoly_mouseDoubleClickEvent(self, e):
-        self.current_pos = e.position()
-        self.locked = True
-
-    def selectpoly_copy(self):
+    def replace_image(self, image, record=True):
         """
-        Copy a polygon region from the current image, returning it.
-
-        Create a mask for the selected area, and use it to blank
-        out non-selected regions. Then get the bounding rect of the
-        selection and crop to produce the smallest possible image.
+        Replace the whole image, recording it as a single undoable edit.
 
-        :return: QPixmap of the copied region.
+        :param image: the new image, from store.new_image() or from_image().
+        :param record: if False, clear the history instead. Use this when
+        opening a file, rather than holding a copy of the old image. With
+        more than one layer the history is always cleared, as only the
+        active layer is kept and the others can't be brought back.
         """
-        self.timer_cleanup()
-
-        pixmap = self.pixmap().copy()
-        bitmap = QBitmap(*constants.CANVAS_DIMENSIONS)
-        bitmap.clear()  # Starts with random data visible.
-
-        p = QPainter(bitmap)
-        # Construct a mask where the user selected area will be kept,
-        # the rest removed from the image is transparent.
-        userpoly = QPolygon(self.history_pos + [self.current_pos])
-        p.setPen(QPen(Qt.GlobalColor.color1))
-        p.setBrush(QBrush(Qt.GlobalColor.color1))  # Solid color, Qt.color1 == bit on.
-        p.drawPolygon(userpoly)
-        p.end()
-
-        # Set our created mask on the image.
-        pixmap.setMask(bitmap)
-
-        # Calculate the bounding rect and return a copy of that region.
-        return pixmap.copy(userpoly.boundingRect())
-
-    # Select rectangle events
-
-    def selectrect_mousePressEvent(self, e):
-        self.active_shape_fn = "drawRect"
-        self.preview_pen = constants.SELECTION_PEN
-        self.generic_shape_mousePressEvent(e)
-
-    def selectrect_timerEvent(self, final=False):
-        self.generic_shape_timerEvent(final)
-
-    def selectrect_mouseMoveEvent(self, e):
-        if not self.locked:
-            self.current_pos = e.position()
-
-    def selectrect_mouseReleaseEvent(self, e):
-        self.current_pos = e.position()
-        self.locked = True
+        self.cancel_filter()
+        if self.image is not None and record and len(self.layers) == 1:
+            self.begin_edit()
+            # The old image itself isn't changed, so exports needn't know.
+            self.history.touch_all(self.image)
+        else:
+            self.history.clear()
+        self.set_image(image)
+        self.end_edit()
 
-    def selectrect_copy(self):
+    def load_image(self, image):
+        """
+        Open image at its own size, replacing the current image and history,
+        and zoom out until it fits the view.
         """
-        Copy a rectangle region of the current image, returning it.
+        self.replace_image(from_image(image), record=False)
+        self.zoom = min(1.0, self.fit_zoom())
+        self.offset = QPointF()
+        self.set_view()
+        self.zoom_changed.emit(self.zoom)
 
-        :return: QPixmap of the copied region.
+    def set_image(self, image):
         """
-        self.timer_cleanup()
-        return self.pixmap().copy(QRect(self.origin_pos, self.current_pos))
-
-    # Eraser events
-
-    def eraser_mousePressEvent(self, e):
-        self.generic_mousePressEvent(e)
-
-    def eraser_mouseMoveEvent(self, e):
-        if self.last_pos:
-            pixmap = self.pixmap()
-            p = QPainter(pixmap)
-            p.setPen(
-                QPen(
-                    self.eraser_color,
-                    30,
-                    Qt.PenStyle.SolidLine,
-                    Qt.PenCapStyle.RoundCap,
-                    Qt.PenJoinStyle.RoundJoin,
-                )
-            )
-            p.drawLine(self.last_pos, e.position())
-
-            self.last_pos = e.position()
-            p.end()
-            self.setPixmap(pixmap)
+        Make image the whole picture, as the only layer.
+        """
+        if self.layers is None:
+            self.layers = LayerStack(image)
+        else:
+            for layer in self.layers.reset(image):
+                self.history.forget(layer)
+        self.image = image
+        self.updateGeometry()
+        self.refresh_layers()
+        self.set_view()
+
+    # Rendering.
+    #
+    # The canvas is backed by a persistent QImage, which tools paint into
+    # directly. Rather than replacing the whole label pixmap after every
+    # change, tools call damage() with the rect they touched, and paintEvent
+    # only redraws that region of the widget.
+    #
+    # Tools work entirely in image coordinates. Mouse events are mapped
+    # from the widget through the view (zoom and offset) before they reach
+    # the tools, and damage() maps rects back. Zoomed out, the view is
+    # drawn from the mipmap tiles in self.pyramid.
+
+    def pixmap(self):
+        """
+        Return a copy of the current image, all layers composited, as a QPixmap.
+        """
+        image = self.composite()
+        if isinstance(image, MappedImage):
+            # Copy first, or the pixmap would share the mapped pixels and
+            # the next edit would detach the image onto the heap.
+            return QPixmap.fromImage(image.copy())
+        return QPixmap.fromImage(image)
 
-    def eraser_mouseReleaseEvent(self, e):
-        self.generic_mouseReleaseEvent(e)
+    def sizeHint(self):
+        size = QSizeF(self.image.size()) * self.zoom
+        return size.toSize().boundedTo(QSize(*constants.CANVAS_MAX_VIEW))
 
-    # Stamp (pie) events
+    def minimumSizeHint(self):
+        return self.image.size().boundedTo(QSize(*constants.CANVAS_DIMENSIONS))
 
-    def stamp_mousePressEvent(self, e):
-        pixmap = self.pixmap()
-        p = QPainter(pixmap)
-        stamp = self.current_stamp
-        point = QPointF(
-            e.position().x() - stamp.width() // 2,
-            e.position().y() - stamp.height() // 2,
+    def view_transform(self):
+        """
+        Return the transform from image to widget coordinates.
+        """
+        return (
+            QTransform()
+            .scale(self.zoom, self.zoom)
+            .translate(-self.offset.x(), -self.offset.y())
         )
-        p.drawPixmap(point, stamp)
-        p.end()
-        self.setPixmap(pixmap)
-
-    # Pen events
-
-    def pen_mousePressEvent(self, e):
-        self.generic_mousePressEvent(e)
-
-    def pen_mouseMoveEvent(self, e):
-        if self.last_pos:
-            pixmap = self.pixmap()
-            p = QPainter(pixmap)
-            p.setPen(
-                QPen(
-                    self.active_color,
-                    self.config["size"],
-                    Qt.PenStyle.SolidLine,
-                    Qt.PenCapStyle.RoundCap,
-                    Qt.PenJoinStyle.RoundJoin,
-                )
-            )
-            p.drawLine(self.last_pos, e.position())
-
-            self.last_pos = e.position()
-            p.end()
-            self.setPixmap(pixmap)
-
-    def pen_mouseReleaseEvent(self, e):
-        self.generic_mouseReleaseEvent(e)
-
-    # Brush events
-
-    def brush_mousePressEvent(self, e):
-        self.generic_mousePressEvent(e)
-
-    def brush_mouseMoveEvent(self, e):
-        if self.last_pos:
-            pixmap = self.pixmap()
-            p = QPainter(pixmap)
-            p.setPen(
-                QPen(
-                    self.active_color,
-                    self.config["size"] * constants.BRUSH_MULT,
-                    Qt.PenStyle.SolidLine,
-                    Qt.PenCapStyle.RoundCap,
-                    Qt.PenJoinStyle.RoundJoin,
-                )
-            )
-            p.drawLine(self.last_pos, e.position())
-
-            self.last_pos = e.position()
-            p.end()
-            self.setPixmap(pixmap)
 
-    def brush_mouseReleaseEvent(self, e):
-        self.generic_mouseReleaseEvent(e)
+    def map_to_image(self, pos):
+        return pos / self.zoom + self.offset
 
-    # Spray events
+    def map_to_view(self, rect):
+        """
+        Return the widget rect covering rect in image coordinates.
+        """
+        rect = self.view_transform().mapRect(QRectF(rect))
+        return rect.toAlignedRect().adjusted(-1, -1, 1, 1)
 
-    def spray_mousePressEvent(self, e):
-        self.generic_mousePressEvent(e)
+    def update_view(self, rect):
+        """
+        Repaint the part of the widget showing rect, in image coordinates.
+        """
+        if not rect.isEmpty():
+            self.update(self.map_to_view(rect))
 
-    def spray_mouseMoveEvent(self, e):
-        if self.last_pos:
-            pixmap = self.pixmap()
-            p = QPainter(pixmap)
-            p.setPen(QPen(self.active_color, 1))
+    def damage(self, rect):
+        """
+        Repaint after the image was changed inside rect.
+        """
+        self.layers.invalidate(rect)
+        self.pyramid.invalidate(rect)
+        self.update_view(rect)
+        self.image_updated.emit(rect)
 
-            for n in range(self.config["size"] * constants.SPRAY_PAINT_N):
-                xo = random.gauss(0, self.config["size"] * constants.SPRAY_PAINT_MULT)
-                yo = random.gauss(0, self.config["size"] * constants.SPRAY_PAINT_MULT)
-                point = QPointF(e.position().x() + xo, e.position().y() + yo)
-                p.drawPoint(point)
-            p.end()
-            self.setPixmap(pixmap)
+    def set_view(self, zoom=None, anchor=None):
+        """
+        Set the zoom, keeping the image point under anchor (a widget position)
+        still, and clamp the offset so the image stays in view.
+        """
+        if zoom is not None:
+            zoom = min(max(zoom, constants.ZOOM_MIN), constants.ZOOM_MAX)
+            if anchor is None:
+                anchor = QPointF(self.width() / 2, self.height() / 2)
+            fixed = self.map_to_image(anchor)
+            changed = zoom != self.zoom
+            self.zoom = zoom
+            self.offset = fixed - anchor / zoom
+            self.updateGeometry()
+            if changed:
+                self.zoom_changed.emit(zoom)
+
+        # Scroll no further than the image edges, pinning smaller images
+        # to the top left.
+        max_x = max(0.0, self.image.width() - self.width() / self.zoom)
+        max_y = max(0.0, self.image.height() - self.height() / self.zoom)
+        self.offset = QPointF(
+            min(max(self.offset.x(), 0.0), max_x),
+            min(max(self.offset.y(), 0.0), max_y),
+        )
+        self.update()
 
-    def spray_mouseReleaseEvent(self, e):
-        self.generic_mouseReleaseEvent(e)
+    def zoom_in(self):
+        steps = [zoom for zoom in constants.ZOOM_STEPS if zoom > self.zoom * 1.001]
+        self.set_view(steps[0] if steps else constants.ZOOM_MAX)
 
-    # Text events
+    def zoom_out(self):
+        steps = [zoom for zoom in constants.ZOOM_STEPS if zoom < self.zoom / 1.001]
+        self.set_view(steps[-1] if steps else constants.ZOOM_MIN)
 
-    def keyPressEvent(self, e):
-        if self.mode == "text":
-            if e.key() == Qt.Key.Key_Backspace:
-                self.current_text = self.current_text[:-1]
-            else:
-                self.current_text = self.current_text + e.text()
-
-    def text_mousePressEvent(self, e):
-        if e.button() == Qt.MouseButton.LeftButton and self.current_pos is None:
-            self.current_pos = e.position()
-            self.current_text = ""
-            self.timer_event = self.text_timerEvent
-
-        elif e.button() == Qt.MouseButton.LeftButton:
-            self.timer_cleanup()
-            # Draw the text to the image
-            pixmap = self.pixmap()
-            p = QPainter(pixmap)
-            p.setRenderHints(QPainter.RenderHint.Antialiasing)
-            font = build_font(self.config)
-            p.setFont(font)
-            pen = QPen(
-                self.primary_color,
-                1,
-                Qt.PenStyle.SolidLine,
-                Qt.PenCapStyle.RoundCap,
-                Qt.PenJoinStyle.RoundJoin,
-            )
-            p.setPen(pen)
-            p.drawText(self.current_pos, self.current_text)
-            p.end()
-            self.setPixmap(pixmap)
+    def zoom_reset(self):
+        self.set_view(1.0)
 
-            self.reset_mode()
+    def fit_zoom(self):
+        """
+        Return the largest zoom step showing the whole image.
+        """
+        for zoom in reversed(constants.ZOOM_STEPS):
+            if (
+                self.image.width() * zoom <= self.width()
+                and self.image.height() * zoom <= self.height()
+            ):
+                return zoom
+        return constants.ZOOM_MIN
+
+    def zoom_fit(self):
+        self.offset = QPointF()
+        self.set_view(self.fit_zoom(), QPointF())
+
+    def set_grid(self, show):
+        self.show_grid = show
+        self.update()
+
+    def resizeEvent(self, e):
+        if self.image is not None:
+            self.set_view()
+
+    def wheelEvent(self, e):
+        delta = e.angleDelta()
+        if e.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            steps = delta.y() / 120
+            self.set_view(self.zoom * 2**steps, e.position())
+        else:
+            if e.modifiers() & Qt.KeyboardModifier.ShiftModifier:
+                delta = delta.transposed()
+            self.offset -= QPointF(delta) / self.zoom
+            self.set_view()
+
+    def paintEvent(self, e):
+        image = self.composite()
+        p = QPainter(self)
+        rect = e.rect()
+        p.fillRect(rect, self.palette().color(QPalette.ColorRole.Dark))
+
+        p.setTransform(self.view_transform())
+        exposed = self.view_transform().inverted()[0].mapRect(QRectF(rect))
+        exposed = exposed.toAlignedRect().intersected(self.image.rect())
+        level = Pyramid.level_for(self.zoom)
+        if level == 0:
+            # Zoomed in, show the pixels as they are.
+            p.drawImage(exposed, image, exposed)
+        else:
+            p.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+            for tile in self.pyramid.tiles(level, exposed):
+                target = self.pyramid.tile_rect(level, *tile)
+                p.drawImage(QRectF(target), self.pyramid.tile(level, *tile))
+            p.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
 
-        elif e.button() == Qt.MouseButton.RightButton and self.current_pos:
-            self.reset_mode()
+        if self.show_grid and self.zoom >= constants.PIXEL_GRID_ZOOM:
+            self.draw_grid(p, exposed)
 
-    def text_timerEvent(self, final=False):
-        pixmap = self.pixmap()
-        p = QPainter(pixmap)
-        p.setCompositionMode(QPainter.CompositionMode.RasterOp_SourceXorDestination)
-        pen = constants.PREVIEW_PEN
-        p.setPen(pen)
-        if self.last_text:
-            font = build_font(self.last_config)
-            p.setFont(font)
-            p.drawText(self.current_pos, self.last_text)
-
-        if not final:
-            font = build_font(self.config)
-            p.setFont(font)
-            p.drawText(self.current_pos, self.current_text)
-
-        self.last_text = self.current_text
-        self.last_config = self.config.copy()
+        if self.overlay_event and exposed.intersects(self.overlay_rect):
+            self.overlay_event(p)
         p.end()
-        self.setPixmap(pixmap)
 
-    # Fill events
-
-    def fill_mousePressEvent(self, e):
-        if e.button() == Qt.MouseButton.LeftButton:
-            self.active_color = self.primary_color
-        else:
-            self.active_color = self.secondary_color
-
-        image = self.pixmap().toImage()
-        w, h = image.width(), image.height()
-        x, y = int(e.position().x()), int(e.position().y())
-
-        # Get our target color from origin.
-        point = QPoint(x, y)
-        target_color = image.pixel(point)
-
-        have_seen = set()
-        queue = [(x, y)]
-
-        def get_cardinal_points(have_seen, center_pos):
-            points = []
-            cx, cy = center_pos
-            for x, y in [(1, 0), (0, 1), (-1, 0), (0, -1)]:
-                xx, yy = cx + x, cy + y
-                if (
-                    xx >= 0
-                    and xx < w
-                    and yy >= 0
-                    and yy < h
-                    and (xx, yy) not in have_seen
-                ):
-                    points.append((xx, yy))
-                    have_seen.add((xx, yy))
-
-            return points
-
-        # Now perform the search and fill.
-        pixmap = self.pixmap()
-        p = QPainter(pixmap)
-        p.setPen(QPen(self.active_color))
-
-        while queue:
-            x, y = queue.pop()
-            if image.pixel(x, y) == target_color:
-                p.drawPoint(QPoint(x, y))
-                queue.extend(get_cardinal_points(have_seen, (x, y)))
+    def draw_grid(self, p, rect):
+        """
+        Outline the pixels in rect, one device pixel wide whatever the zoom.
+        """
+        # Draw in widget coordinates, as scaled lines are much slower.
+        p.save()
+        p.resetTransform()
+        p.setPen(QPen(QColor(*constants.PIXEL_GRID_COLOR), 0))
+        view = QRectF(self.map_to_view(rect))
+        origin = self.view_transform().map(QPointF(rect.topLeft()))
+        lines = [
+            QLineF(x, view.top(), x, view.bottom())
+            for x in (origin.x() + n * self.zoom for n in range(rect.width() + 1))
+        ]
+        lines += [
+            QLineF(view.left(), y, view.right(), y)
+            for y in (origin.y() + n * self.zoom for n in range(rect.height() + 1))
+        ]
+        p.drawLines(lines)
+        p.restore()
+
+    def segment_rect(self, start, end, width):
+        """
+        Return the image rect covered by a line segment drawn with a pen
+        of the given width, including round caps.
+        """
+        pad = width / 2 + 1
+        return (
+            QRectF(start, end)
+            .normalized()
+            .adjusted(-pad, -pad, pad, pad)
+            .toAlignedRect()
+        )
 
+    def draw_stroke(self, pen, points):
+        """
+        Draw a polyline through points, an (n, 2) array, repainting only its bounds.
+        """
+        polygon, bounds = points_polygon(points)
+        rect = self.segment_rect(bounds.topLeft(), bounds.bottomRight(), pen.widthF())
+        self.touch(rect)
+        p = QPainter(self.image)
+        p.setPen(pen)
+        p.drawPolyline(polygon)
         p.end()
-        self.setPixmap(pixmap)
-
-    # Dropper events
-
-    def dropper_mousePressEvent(self, e):
-        c = self.pixmap().toImage().pixel(e.position())
-        hex = QColor(c).name()
-
-        if e.button() == Qt.MouseButton.LeftButton:
-            self.set_primary_color(hex)
-            self.primary_color_updated.emit(hex)  # Update UI.
+        self.damage(rect)
+
+    # Stroke input.
+    #
+    # Freehand tools can receive far more move events than there are frames
+    # to show them in. While a stroke is in progress, moves for tools with a
+    # strokeEvent handler are queued instead, and flushed once per
+    # frame: the queued positions are smoothed into a single Catmull-Rom
+    # polyline, and the tool's strokeEvent draws it in one go.
+
+    def queue_stroke(self, pos):
+        if not self.stroke_queue:
+            self.stroke_queue = []
+            self.stroke_queued_at = time.perf_counter()
+            self.stroke_timer.start()
+        self.stroke_queue.append((pos.x(), pos.y()))
+
+    def flush_stroke(self, final=False):
+        """
+        Draw any queued stroke positions.
 
-        elif e.button() == Qt.MouseButton.RightButton:
-            self.set_secondary_color(hex)
-            self.secondary_color_updated.emit(hex)  # Update UI.
+        The curve is drawn up to the last-but-one position, as the spline
+        needs the following point for its shape. A final flush (when the
+        stroke ends) draws it all the way to the last position.
+        """
+        self.stroke_timer.stop()
+        fn = self.handlers["strokeEvent"]
+        if fn is None or not self.stroke_tail:
+            return
+
+        started_at = time.perf_counter()
+        queue, self.stroke_queue = self.stroke_queue, ()
+        points = list(self.stroke_tail) + list(queue)
+        if final and len(points) >= 2 and points[-1] != points[-2]:
+            # The last segment is never drawn until the next point arrives,
+            # even when an earlier flush has emptied the queue. Repeat the
+            # end point, so the curve reaches it.
+            points.append(points[-1])
+
+        if len(points) >= 4:
+            fn(catmull_rom(np.array(points)))
+        self.stroke_tail = points[-3:]
+
+        if queue:
+            self.input_stats.record(len(queue), self.stroke_queued_at, started_at)
+
+    # Overlay.
+    #
+    # Shape previews, text being typed and selections are never drawn into
+    # the image. Modes set an overlay with a function which paints it and a
+    # function returning the rect it covers, and paintEvent draws it on top
+    # of the image. Changing the overlay only repaints its old and new rects.
+
+    def set_overlay(self, paint, bounds):
+        self.overlay_event = paint
+        self.overlay_bounds = bounds
+        self.refresh_overlay()
+
+    def refresh_overlay(self):
+        rect = self.overlay_bounds() if self.overlay_event else QRect()
+        self.update_view(self.overlay_rect.united(rect))
+        self.overlay_rect = rect
+
+    def clear_overlay(self):
+        self.overlay_event = None
+        self.refresh_overlay()
+
+    def overlay_timerEvent(self, final=False):
+        if final:
+            self.clear_overlay()
+        elif self.tool.preview_pen:
+            # Animate the marching ants.
+            self.tool.dash_offset -= 1
+            self.update_view(self.overlay_rect)
+
+    def shape_pen(self):
+        return QPen(
+            self.primary_color,
+            self.config["size"],
+            Qt.PenStyle.SolidLine,
+            Qt.PenCapStyle.RoundCap,
+            Qt.PenJoinStyle.RoundJoin,
+        )
 
-    # Generic shape events: Rectangle, Ellipse, Rounded-rect
+    def shape_brush(self):
+        if self.config["fill"]:
+            return QBrush(self.secondary_color)
+        return QBrush()
 
-    def generic_shape_mousePressEvent(self, e):
-        self.origin_pos = e.position()
-        self.current_pos = e.position()
-        self.timer_event = self.generic_shape_timerEvent
+    def draw_preview(self, p, shape_fn, *args, brush=None):
+        """
+        Draw a shape onto the overlay using the named QPainter method.
 
-    def generic_shape_timerEvent(self, final=False):
-        pixmap = self.pixmap()
-        p = QPainter(pixmap)
-        p.setCompositionMode(QPainter.CompositionMode.RasterOp_SourceXorDestination)
-        pen = self.preview_pen
-        pen.setDashOffset(self.dash_offset)
-        p.setPen(pen)
-        if self.last_pos:
-            getattr(p, self.active_shape_fn)(
-                QRect(self.origin_pos, self.last_pos), *self.active_shape_args
-            )
-
-        if not final:
-            self.dash_offset -= 1
-            pen.setDashOffset(self.dash_offset)
+        Selections (with the tool's preview_pen set) are drawn as marching ants, dashes
+        over a solid dark line so they show up on any background. Anything
+        else is drawn exactly as it will be drawn into the image.
+        """
+        draw = getattr(p, shape_fn)
+        preview_pen = self.tool.preview_pen
+        if preview_pen:
+            p.setPen(constants.SELECTION_SHADOW_PEN)
+            draw(*args)
+            pen = QPen(preview_pen)
+            pen.setDashOffset(self.tool.dash_offset)
             p.setPen(pen)
-            getattr(p, self.active_shape_fn)(
-                QRect(self.origin_pos, self.current_pos), *self.active_shape_args
-            )
-
-        p.end()
-        self.setPixmap(pixmap)
-        self.last_pos = self.current_pos
-
-    def generic_shape_mouseMoveEvent(self, e):
-        self.current_pos = e.position()
-
-    def generic_shape_mouseReleaseEvent(self, e):
-        if self.last_pos:
-            # Clear up indicator.
-            self.timer_cleanup()
-
-            pixmap = self.pixmap()
-            p = QPainter(pixmap)
-            p.setPen(
-                QPen(
-                    self.primary_color,
-                    self.config["size"],
-                    Qt.PenStyle.SolidLine,
-                    Qt.PenCapStyle.RoundCap,
-                    Qt.PenJoinStyle.RoundJoin,
-                )
-            )
-
-            if self.config["fill"]:
-                p.setBrush(QBrush(self.secondary_color))
-            getattr(p, self.active_shape_fn)(
-                QRect(self.origin_pos, e.position()), *self.active_shape_args
-            )
-            p.end()
-            self.setPixmap(pixmap)
+        else:
+            p.setPen(self.shape_pen())
+            if brush:
+                p.setBrush(brush)
+        draw(*args)
 
+    def preview_rect(self, points):
+        """
+        Return the image rect covered by a preview shape through points.
+        """
+        bounds = QPolygonF(points).boundingRect()
+        preview_pen = self.tool.preview_pen
+        width = preview_pen.widthF() if preview_pen else self.config["size"]
+        return self.segment_rect(bounds.topLeft(), bounds.bottomRight(), width)
+
+    # Undo history.
+    #
+    # Anything which changes the image does so inside an edit: call
+    # begin_edit() first, touch() with each rect before painting into it,
+    # and end_edit() when done. Only the touched tiles are stored.
+
+    def begin_edit(self):
+        self.history.begin(self.image, self.layers.layer)
+
+    def touch(self, rect):
+        self.preserve(rect)
+        self.history.touch(self.image, rect)
+
+    def end_edit(self):
+        if self.filter_job:
+            # The filter ends its own edit, when it finishes or is cancelled.
+            return
+        self.history.commit(self.image)
+
+    def undo(self):
+        self.cancel_filter()
         self.reset_mode()
+        self.end_edit()
+        edit = self.history.peek_undo()
+        self.select_edit_layer(edit)
+        self.preserve(self.image.rect())
+        self.apply_history(*self.history.undo(self.image))
+        self.revert_changes(edit, undo=True)
+
+    def redo(self):
+        self.cancel_filter()
+        self.reset_mode()
+        self.end_edit()
+        edit = self.history.peek_redo()
+        self.select_edit_layer(edit)
+        self.preserve(self.image.rect())
+        self.apply_history(*self.history.redo(self.image))
+        self.revert_changes(edit, undo=False)
+
+    def select_edit_layer(self, edit):
+        # Undo and redo apply to the layer the edit was made to.
+        if edit is not None and edit.layer in self.layers.layers:
+            index = self.layers.layers.index(edit.layer)
+            if index != self.layers.active:
+                self.select_layer(index)
+
+    def revert_changes(self, edit, undo):
+        """
+        Put back the shapes an edit changed. Their pixels are restored with
+        the rest of the edit's tiles, so nothing is redrawn.
+        """
+        if edit is None or not edit.changes or edit.layer.shapes is None:
+            return
+        changes = reversed(edit.changes) if undo else edit.changes
+        for key, before, after in changes:
+            edit.layer.shapes.set(key, before if undo else after)
+
+    def apply_history(self, image, rect):
+        if image is self.image:
+            self.damage(rect)
+        else:
+            # The step changed the image size.
+            self.set_image(image)
+
+    # Filters.
+    #
+    # Filters run in the background (see filters.py) as a single edit.
+    # Each tile is written into the image as it arrives, so the result
+    # appears progressively. Tools are disabled until the filter finishes
+    # or is cancelled, which puts back any tiles already written. A filter
+    # which fails is cancelled the same way.
+
+    def apply_filter(self, name, **params):
+        """
+        Start running the named filter from filters.FILTERS over the image.
 
-    # Line events
-
-    def line_mousePressEvent(self, e):
-        self.origin_pos = e.position()
-        self.current_pos = e.position()
-        self.preview_pen = constants.PREVIEW_PEN
-        self.timer_event = self.line_timerEvent
-
-    def line_timerEvent(self, final=False):
-        pixmap = self.pixmap()
-        p = QPainter(pixmap)
-        p.setCompositionMode(QPainter.CompositionMode.RasterOp_SourceXorDestination)
-        pen = self.preview_pen
-        p.setPen(pen)
-        if self.last_pos:
-            p.drawLine(self.origin_pos, self.last_pos)
-
-        if not final:
-            p.drawLine(self.origin_pos, self.current_pos)
+        :return: the FilterJob, for its progress and finished signals.
+        """
+        self.cancel_filter()
+        self.reset_mode()
 
-        p.end()
-        self.setPixmap(pixmap)
-
-        self.last_pos = self.current_pos
-
-    def line_mouseMoveEvent(self, e):
-        self.current_pos = e.position()
-
-    def line_mouseReleaseEvent(self, e):
-        if self.last_pos:
-            # Clear up indicator.
-            self.timer_cleanup()
-
-            pixmap = self.pixmap()
-            p = QPainter(pixmap)
-            p.setPen(
-                QPen(
-                    self.primary_color,
-                    self.config["size"],
-                    Qt.PenStyle.SolidLine,
-                    Qt.PenCapStyle.RoundCap,
-                    Qt.PenJoinStyle.RoundJoin,
-                )
-            )
-
-            p.drawLine(self.origin_pos, e.position())
-            p.end()
-            self.setPixmap(pixmap)
+        job = FilterJob(self.image, FILTERS[name], params, pool=self.filter_pool)
+        job.tile_done.connect(self.filter_tileDone)
+        job.finished.connect(self.filter_finished)
+        job.failed.connect(self.filter_failed)
+        self.filter_job = job
+        self.begin_edit()
+        job.start()
+        return job
+
+    def filter_tileDone(self, rect, result):
+        self.touch(rect)
+        image_array(self.image)[rect_slices(rect)] = result
+        self.damage(rect)
+
+    def filter_finished(self):
+        self.filter_job = None
+        self.end_edit()
+
+    def filter_failed(self, error):
+        self.cancel_filter()
+
+    def cancel_filter(self):
+        job = self.filter_job
+        if job is None:
+            return
+        job.cancel()
+        self.filter_job = None
+
+        arr = image_array(self.image)
+        for rect in job.applied:
+            self.preserve(rect)
+            arr[rect_slices(rect)] = job.source[rect_slices(rect)]
+            self.damage(rect)
+        # Nothing is left changed, so this records nothing.
+        self.end_edit()
+
+    # Layers.
+    #
+    # The tools paint into the active layer's image, self.image. What is
+    # shown, copied and saved is the composite of every layer, which the
+    # LayerStack keeps cached in tiles: damage() marks tiles dirty, and
+    # composite() brings them up to date. Changing the layers finishes
+    # anything in progress first, as it may change self.image.
+
+    def composite(self):
+        """
+        Return the image with all layers composited, brought up to date.
+        """
+        if self.export_jobs:
+            rect = self.layers.dirty_rect()
+            for job in self.export_jobs:
+                job.preserve(self.layers.image(), rect)
+        self.layers.update()
+        return self.layers.image()
+
+    def refresh_layers(self):
+        """
+        Repaint everything, after the layers changed.
+        """
+        self.image = self.layers.layer.image
+        image = self.layers.image()
+        if self.pyramid is None or self.pyramid.image is not image:
+            self.pyramid = Pyramid(image)
+        else:
+            self.pyramid.invalidate()
+        self.update()
+        self.layers_updated.emit()
 
+    def settle(self):
+        self.cancel_filter()
         self.reset_mode()
+        self.end_edit()
 
-    # Generic poly events
-    def generic_poly_mousePressEvent(self, e):
-        if e.button() == Qt.MouseButton.LeftButton:
-            if self.history_pos:
-                self.history_pos.append(e.position())
-            else:
-                self.history_pos = [e.position()]
-                self.current_pos = e.position()
-                self.timer_event = self.generic_poly_timerEvent
-
-        elif e.button() == Qt.MouseButton.RightButton and self.history_pos:
-            # Clean up, we're not drawing
-            self.timer_cleanup()
-            self.reset_mode()
-
-    def generic_poly_timerEvent(self, final=False):
-        pixmap = self.pixmap()
-        p = QPainter(pixmap)
-        p.setCompositionMode(QPainter.CompositionMode.RasterOp_SourceXorDestination)
-        pen = self.preview_pen
-        pen.setDashOffset(self.dash_offset)
-        p.setPen(pen)
-        if self.last_history:
-            getattr(p, self.active_shape_fn)(*self.last_history)
+    def set_layers(self, layers, active=0):
+        """
+        Replace the whole picture with the given Layers, clearing the history.
+        """
+        self.cancel_filter()
+        self.reset_mode()
+        self.history.clear()
+        self.layers.replace(layers, active)
+        self.updateGeometry()
+        self.refresh_layers()
+        self.set_view()
 
-        if not final:
-            self.dash_offset -= 1
-            pen.setDashOffset(self.dash_offset)
-            p.setPen(pen)
-            getattr(p, self.active_shape_fn)(*self.history_pos + [self.current_pos])
+    def add_layer(self, vector=False):
+        """
+        Add an empty layer above the active one, and make it active.
 
-        p.end()
-        self.setPixmap(pixmap)
+        :param vector: make it a vector layer, which keeps shapes as objects.
+        """
+        self.settle()
+        index = self.layers.active + 1
+        image = blank_layer_image(self.layers.size())
+        shapes = ShapeDocument() if vector else None
+        name = "%s %d" % ("Vector" if vector else "Layer", len(self.layers))
+        self.layers.add(Layer(name, image, shapes=shapes), index)
+        self.select_layer(index)
+
+    def remove_layer(self, index=None):
+        """
+        Remove a layer, by default the active one, along with its history.
+        """
+        if len(self.layers) == 1:
+            return
+        self.settle()
+        layer = self.layers.remove(self.layers.active if index is None else index)
+        self.history.forget(layer)
+        self.refresh_layers()
+
+    def move_layer(self, index, to):
+        if not 0 <= to < len(self.layers):
+            return
+        self.settle()
+        self.layers.move(index, to)
+        self.refresh_layers()
+
+    def select_layer(self, index):
+        self.settle()
+        self.layers.set_active(index)
+        self.refresh_layers()
+
+    def set_layer(self, index, **properties):
+        """
+        Change a layer's name, opacity, mode or visibility.
+        """
+        self.layers.set(index, **properties)
+        self.refresh_layers()
 
-        self.last_pos = self.current_pos
-        self.last_history = self.history_pos + [self.current_pos]
+    # Saving.
+    #
+    # Exports run in the background from a copy-on-write snapshot, so
+    # anything which writes into the image must call preserve() first. Edits
+    # do so through touch().
 
-    def generic_poly_mouseMoveEvent(self, e):
-        self.current_pos = e.position()
+    def export_image(self, path, format="png", **options):
+        """
+        Start saving the image to path in the background.
 
-    def generic_poly_mouseDoubleClickEvent(self, e):
-        self.timer_cleanup()
-        pixmap = self.pixmap()
-        p = QPainter(pixmap)
-        p.setPen(
-            QPen(
-                self.primary_color,
-                self.config["size"],
-                Qt.PenStyle.SolidLine,
-                Qt.PenCapStyle.RoundCap,
-                Qt.PenJoinStyle.RoundJoin,
-            )
-        )
+        :param options: level (PNG) or quality (JPEG, WebP), see ExportJob.
+        :return: the ExportJob, for its progress and result signals.
+        """
+        job = ExportJob(self.composite(), path, format, **options)
+        self.export_jobs = self.export_jobs + (job,)
+        for signal in (job.finished, job.failed, job.cancelled):
+            signal.connect(lambda *args, job=job: self.export_done(job))
+        job.start()
+        return job
 
-        # Note the brush is ignored for polylines.
-        if self.secondary_color:
-            p.setBrush(QBrush(self.secondary_color))
+    def export_done(self, job):
+        self.export_jobs = tuple(j for j in self.export_jobs if j is not job)
 
-        getattr(p, self.active_shape_fn)(*self.history_pos + [e.position()])
-        p.end()
-        self.setPixmap(pixmap)
+    def preserve(self, rect):
+        """
+        Let running exports copy anything under rect before it changes.
+        """
+        for job in self.export_jobs:
+            job.preserve(self.image, rect)
 
+    def flip(self, horizontal=True):
+        """
+        Mirror the image in place, left-right or top-bottom.
+        """
+        self.cancel_filter()
         self.reset_mode()
+        if self.layers.layer.shapes is not None:
+            self.flip_shapes(horizontal)
+            return
+        arr = image_array(self.image)
+        self.begin_edit()
+        self.touch(self.image.rect())
+        arr[:] = arr[:, ::-1] if horizontal else arr[::-1]
+        self.end_edit()
+        self.damage(self.image.rect())
 
-    # Polyline events
-
-    def polyline_mousePressEvent(self, e):
-        self.active_shape_fn = "drawPolyline"
-        self.preview_pen = constants.PREVIEW_PEN
-        self.generic_poly_mousePressEvent(e)
-
-    def polyline_timerEvent(self, final=False):
-        self.generic_poly_timerEvent(final)
-
-    def polyline_mouseMoveEvent(self, e):
-        self.generic_poly_mouseMoveEvent(e)
-
-    def polyline_mouseDoubleClickEvent(self, e):
-        self.generic_poly_mouseDoubleClickEvent(e)
-
-    # Rectangle events
-
-    def rect_mousePressEvent(self, e):
-        self.active_shape_fn = "drawRect"
-        self.active_shape_args = ()
-        self.preview_pen = constants.PREVIEW_PEN
-        self.generic_shape_mousePressEvent(e)
-
-    def rect_timerEvent(self, final=False):
-        self.generic_shape_timerEvent(final)
+    def set_primary_color(self, hex):
+        self.primary_color = QColor(hex)
+        self.tool.style_changed()
 
-    def rect_mouseMoveEvent(self, e):
-        self.generic_shape_mouseMoveEvent(e)
+    def set_secondary_color(self, hex):
+        self.secondary_color = QColor(hex)
+        self.tool.style_changed()
 
-    def rect_mouseReleaseEvent(self, e):
-        self.generic_shape_mouseReleaseEvent(e)
+    def set_config(self, key, value):
+        self.config[key] = value
+        if key in ("size", "fill"):
+            self.tool.style_changed()
+        # Sizes, fonts etc. all show in previews.
+        self.refresh_overlay()
 
-    # Polygon events
+    def set_mode(self, mode):
+        # Clean up active timer animations.
+        self.timer_cleanup()
+        # Draw the rest of any stroke in progress.
+        self.flush_stroke(final=True)
+        self.stroke_queue = ()
+        self.stroke_tail = ()
+        # Finish any edit left open by the previous mode.
+        self.end_edit()
+        # A new tool, with its state reset.
+        self.mode = mode
+        self.tool = tool_for(self, mode)
+        self.handlers = self.tool.handlers
 
-    def polygon_mousePressEvent(self, e):
-        self.active_shape_fn = "drawPolygon"
-        self.preview_pen = constants.PREVIEW_PEN
-        self.generic_poly_mousePressEvent(e)
+    def reset_mode(self):
+        self.set_mode(self.mode)
 
-    def polygon_timerEvent(self, final=False):
-        self.generic_poly_timerEvent(final)
+    def on_timer(self):
+        if self.timer_event:
+            self.timer_event()
 
-    def polygon_mouseMoveEvent(self, e):
-        self.generic_poly_mouseMoveEvent(e)
+    def timer_cleanup(self):
+        if self.timer_event:
+            # Stop the timer, then trigger cleanup.
+            timer_event = self.timer_event
+            self.timer_event = None
+            timer_event(final=True)
 
-    def polygon_mouseDoubleClickEvent(self, e):
-        self.generic_poly_mouseDoubleClickEvent(e)
+    # Mouse events.
+    #
+    # The middle button pans the view, anything else goes to the tool's
+    # handlers with the position mapped to image coordinates.
+
+    def map_event(self, e):
+        return QMouseEvent(
+            e.type(),
+            self.map_to_image(e.position()),
+            e.globalPosition(),
+            e.button(),
+            e.buttons(),
+            e.modifiers(),
+        )
 
-    # Ellipse events
+    def mousePressEvent(self, e):
+        if e.button() == Qt.MouseButton.MiddleButton:
+            self.pan_pos = e.position()
+            return
+        if self.filter_job:
+            # Wait for the filter to finish before drawing.
+            return
+        if self.layers.layer.shapes is not None and not self.tool.vector:
+            # Vector layers are only drawn from their shapes.
+            return
+        fn = self.handlers["mousePressEvent"]
+        if fn:
+            return fn(self.map_event(e))
 
-    def ellipse_mousePressEvent(self, e):
-        self.active_shape_fn = "drawEllipse"
-        self.active_shape_args = ()
-        self.preview_pen = constants.PREVIEW_PEN
-        self.generic_shape_mousePressEvent(e)
+    def mouseMoveEvent(self, e):
+        if self.pan_pos is not None:
+            self.offset -= (e.position() - self.pan_pos) / self.zoom
+            self.pan_pos = e.position()
+            self.set_view()
+            return
+        if self.stroke_tail and self.handlers["strokeEvent"]:
+            self.queue_stroke(self.map_to_image(e.position()))
+            return
+        fn = self.handlers["mouseMoveEvent"]
+        if fn:
+            return fn(self.map_event(e))
 
-    def ellipse_timerEvent(self, final=False):
-        self.generic_shape_timerEvent(final)
+    def mouseReleaseEvent(self, e):
+        if e.button() == Qt.MouseButton.MiddleButton:
+            self.pan_pos = None
+            return
+        fn = self.handlers["mouseReleaseEvent"]
+        if fn:
+            return fn(self.map_event(e))
 
-    def ellipse_mouseMoveEvent(self, e):
-        self.generic_shape_mouseMoveEvent(e)
+    def mouseDoubleClickEvent(self, e):
+        fn = self.handlers["mouseDoubleClickEvent"]
+        if fn:
+            return fn(self.map_event(e))
 
-    def ellipse_mouseReleaseEvent(self, e):
-        self.generic_shape_mouseReleaseEvent(e)
+    def keyPressEvent(self, e):
+        fn = self.handlers["keyPressEvent"]
+        if fn:
+            fn(e)
 
-    # Roundedrect events
+    # Stamps.
 
-    def roundrect_mousePressEvent(self, e):
-        self.active_shape_fn = "drawRoundedRect"
-        self.active_shape_args = (25, 25)
-        self.preview_pen = constants.PREVIEW_PEN
-        self.generic_shape_mousePressEvent(e)
+    def set_stamp(self, path):
+        self.current_stamp_path = path
 
-    def roundrect_timerEvent(self, final=False):
-        self.generic_shape_timerEvent(final)
+    # Shapes.
+    #
+    # The shape tools hand the finished shape to add_shape(). On a raster
+    # layer it is drawn straight into the image; on a vector layer it is
+    # added to the layer's ShapeDocument, and the image is redrawn from the
+    # shapes under its bounds. Undo restores the pixels from the history
+    # tiles as usual, and the shapes from the changes recorded with them.
 
-    def roundrect_mouseMoveEvent(self, e):
-        self.generic_shape_mouseMoveEvent(e)
+    def add_shape(self, shape, rect):
+        """
+        Draw or add shape, which covers rect, as a single edit.
+        """
+        self.begin_edit()
+        shapes = self.layers.layer.shapes
+        if shapes is not None:
+            key = shapes.next_id
+            self.change_shape(key, shape)
+        else:
+            self.touch(rect)
+            p = QPainter(self.image)
+            shape.draw(p)
+            p.end()
+            self.damage(rect)
+        self.end_edit()
 
-    def roundrect_mouseReleaseEvent(self, e):
-        self.generic_shape_mouseReleaseEvent(e)
+    def change_shape(self, key, shape):
+        """
+        Replace, add or (with None) remove a shape on the active vector
+        layer, within an edit, and redraw the area affected.
+        """
+        shapes = self.layers.layer.shapes
+        before = shapes.shapes.get(key)
+        self.history.record(key, before, shape)
+        self.render_shapes(shapes.set(key, shape))
+
+    def render_shapes(self, rect):
+        rect = rect.toAlignedRect().intersected(self.image.rect())
+        if rect.isEmpty():
+            return
+        self.touch(rect)
+        self.layers.layer.shapes.render(self.image, rect)
+        self.damage(rect)
+
+    def flip_shapes(self, horizontal):
+        w, h = self.image.width(), self.image.height()
+        if horizontal:
+            transform = QTransform(-1, 0, 0, 1, w, 0)
+        else:
+            transform = QTransform(1, 0, 0, -1, 0, h)
+        shapes = self.layers.layer.shapes
+        self.begin_edit()
+        for key, shape in list(shapes.shapes.items()):
+            self.history.record(key, shape, shape.mapped(transform))
+            shapes.set(key, shape.mapped(transform))
+        self.render_shapes(QRectF(self.image.rect()))
+        self.end_edit()
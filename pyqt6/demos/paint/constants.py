@@ -1,5 +1,5 @@
 from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QColor, QPen
+from PyQt6.QtGui import QColor, QImage, QPen
 
 BRUSH_MULT = 3
 SPRAY_PAINT_MULT = 5
@@ -77,6 +77,70 @@ MODES = [
 
 CANVAS_DIMENSIONS = 600, 400
 
+# Pixel format of the canvas image, the fastest format for QPainter to draw on.
+IMAGE_FORMAT = QImage.Format.Format_ARGB32_Premultiplied
+
+# Undo history: tile edge in pixels, zlib level and memory budget for all steps.
+HISTORY_TILE_SIZE = 64
+HISTORY_COMPRESSION = 1
+HISTORY_MAX_BYTES = 64 * 1024 * 1024
+
+# Images with at least this many pixels are kept in a memory-mapped file.
+MAPPED_IMAGE_PIXELS = 4096 * 4096
+# Mipmap tiles used to draw zoomed-out views: edge in pixels and cache limit.
+MIPMAP_TILE_SIZE = 256
+MIPMAP_CACHE_TILES = 512
+
+# View zoom limits (10% to 3200%), the steps zooming in and out goes
+# through, and the largest size the canvas asks the layout for.
+ZOOM_MIN = 0.1
+ZOOM_MAX = 32
+ZOOM_STEPS = [0.1, 0.125, 0.25, 0.5, 1, 2, 4, 8, 16, 32]
+# Zoomed in this far, the pixels are outlined in this RGBA colour.
+PIXEL_GRID_ZOOM = 8
+PIXEL_GRID_COLOR = 128, 128, 128, 96
+CANVAS_MAX_VIEW = 1200, 800
+
+# Filters are run in tiles of this size, in parallel.
+FILTER_TILE_SIZE = 256
+
+# Saving: formats (name and file extension), and their default settings.
+# Images are read for saving in bands of this many rows.
+EXPORT_FORMATS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+EXPORT_PNG_LEVEL = 6
+EXPORT_QUALITY = 90
+EXPORT_BAND_ROWS = 64
+
+# Autosave: how often to checkpoint (ms), the most bytes per second to
+# write, the journal tile size, and the smallest journal worth compacting.
+AUTOSAVE_INTERVAL = 5000
+AUTOSAVE_BYTES_PER_SECOND = 4 * 1024 * 1024
+JOURNAL_TILE_SIZE = 128
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+# Journal file names, numbered for each running instance.
+AUTOSAVE_FILE = "autosave-%s.pcj"
+
+# Profiler: event handler times kept for the percentiles, spans kept for
+# the trace, and how often the HUD refreshes (ms).
+PROFILE_SAMPLES = 500
+PROFILE_TRACE_SPANS = 200000
+PROFILE_HUD_INTERVAL = 500
+
+# Stamps: the sizes made as each stamp loads (others are made when first
+# used), the atlas page size, and how far apart drag-stamps are, relative
+# to the stamp width.
+STAMP_SCALES = (0.5, 1.0, 1.5, 2.0)
+STAMP_ATLAS_PAGE_SIZE = 1024
+STAMP_SPACING = 0.5
+
+# Vector layers: the grid cell size for finding shapes, and how near (in
+# pixels) a click must be to a shape's outline to hit it.
+SHAPE_GRID_CELL = 32
+SHAPE_HIT_TOLERANCE = 3
+
+# Queued stroke input is drawn once per frame, every this many milliseconds.
+FRAME_INTERVAL = 16
+
 STAMPS = [
     ":/stamps/pie-apple.png",
     ":/stamps/pie-cherry.png",
@@ -89,4 +153,8 @@ STAMPS = [
 ]
 
 SELECTION_PEN = QPen(QColor(0xFF, 0xFF, 0xFF), 1, Qt.PenStyle.DashLine)
-PREVIEW_PEN = QPen(QColor(0xFF, 0xFF, 0xFF), 1, Qt.PenStyle.SolidLine)
+# Drawn under the selection dashes, so they are visible on light backgrounds.
+SELECTION_SHADOW_PEN = QPen(QColor(0x00, 0x00, 0x00), 1, Qt.PenStyle.SolidLine)
+# Selections stay one screen pixel wide at any zoom.
+SELECTION_PEN.setCosmetic(True)
+SELECTION_SHADOW_PEN.setCosmetic(True)
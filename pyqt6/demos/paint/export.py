@@ -0,0 +1,288 @@
+"""
+Save the image in the background, without freezing the UI.
+
+An ExportJob takes a copy-on-write snapshot of the image, which costs
+nothing up front: the image is split into bands of rows, and the canvas
+calls preserve() before it paints into any of them, so a band is only
+copied if it is about to change before the encoder has read it. The
+encoder then runs on a worker thread, reading the image a band at a time.
+
+PNG is written here, a band at a time, straight through zlib to the file,
+so even a huge image never needs a second full copy in memory. JPEG and
+WebP go through QImageWriter, which needs the whole image at once.
+
+Files are written to a temporary file next to the target, and renamed over
+it only once complete, so a failed or cancelled export never leaves a
+half-written file behind.
+"""
+
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+import constants
+import numpy as np
+from fill import image_array
+from filters import channels
+from PyQt6 import sip
+from PyQt6.QtCore import QBuffer, QIODevice, QObject, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage, QImageWriter
+
+# New files get the usual permissions, rather than mkstemp's owner-only.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def formats():
+    """
+    Return the formats which can be saved, as a dict of name to file
+    extension. PNG is always available, the others if Qt has a plugin.
+    """
+    supported = {bytes(f).decode() for f in QImageWriter.supportedImageFormats()}
+    return {
+        name: extension
+        for name, extension in constants.EXPORT_FORMATS.items()
+        if name == "png" or name in supported
+    }
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Snapshot:
+    """
+    A copy-on-write snapshot of an image, read back in bands of rows.
+
+    preserve() is called on the GUI thread before writing into the image,
+    and band() on the encoder thread. The lock makes sure a band is either
+    copied before it is written, or read before it is written, never both
+    at once.
+    """
+
+    def __init__(self, image, band_rows=constants.EXPORT_BAND_ROWS):
+        self.image = image
+        self.array = image_array(image)
+        self.band_rows = band_rows
+        self.bands = -(-image.height() // band_rows)
+
+        self.saved = {}
+        self.read = set()
+        self.lock = threading.Lock()
+
+    def _rows(self, n):
+        return slice(n * self.band_rows, (n + 1) * self.band_rows)
+
+    def preserve(self, image, rect):
+        """
+        Copy any bands under rect which haven't been read yet.
+        """
+        if image is not self.image or rect.isEmpty():
+            return
+        first = max(rect.top(), 0) // self.band_rows
+        last = min(rect.bottom() // self.band_rows, self.bands - 1)
+        with self.lock:
+            for n in range(first, last + 1):
+                if n not in self.read and n not in self.saved:
+                    self.saved[n] = self.array[self._rows(n)].copy()
+
+    def band(self, n):
+        """
+        Return band n as a (rows, width) uint32 array, as it was when the
+        snapshot was taken. Each band can be read once.
+        """
+        with self.lock:
+            self.read.add(n)
+            saved = self.saved.pop(n, None)
+            if saved is not None:
+                return saved
+            return self.array[self._rows(n)].copy()
+
+
+def png_chunk(tag, data):
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data))
+    )
+
+
+def png_header(width, height):
+    # 8 bits per channel, RGBA, default compression, filtering and no
+    # interlacing.
+    return PNG_SIGNATURE + png_chunk(
+        b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    )
+
+
+def rgba(band, premultiplied):
+    """
+    Convert a band of 32-bit pixels to (rows, width, 4) straight RGBA bytes.
+    """
+    ch = channels(band)
+    rgba = ch[..., [2, 1, 0, 3]]
+    if premultiplied:
+        alpha = ch[..., 3]
+        partial = (alpha > 0) & (alpha < 255)
+        if partial.any():
+            a = alpha[partial].astype(np.float32)[:, None]
+            colour = rgba[partial][:, :3] * (255 / a) + 0.5
+            rgba[partial, :3] = np.minimum(colour, 255).astype(np.uint8)
+    return rgba
+
+
+def png_rows(rgba, previous):
+    """
+    Filter a band of RGBA rows for PNG, with the "up" filter: each byte is
+    stored as the difference from the byte above it.
+
+    :param previous: the last row of the band before, or None at the top.
+    :return: the filtered rows as bytes, each prefixed with its filter type.
+    """
+    rows = rgba.reshape(len(rgba), -1)
+    above = np.empty_like(rows)
+    above[0] = previous if previous is not None else 0
+    above[1:] = rows[:-1]
+    out = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+    out[:, 0] = 2
+    np.subtract(rows, above, out=out[:, 1:])
+    return out.tobytes()
+
+
+class ExportJob(QObject):
+    """
+    Saves an image to a file on a worker thread.
+
+    :param image: the QImage to save. Anything which writes into it while
+    the job runs must call preserve() first.
+    :param path: the file to write.
+    :param format: a key of constants.EXPORT_FORMATS.
+    :param level: zlib compression level for PNG, 0-9.
+    :param quality: quality for JPEG and WebP, 0-100.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    # Emitted from the worker thread, and re-emitted as the signals above on
+    # the GUI thread, so nothing is missed before the caller connects.
+    _progress = pyqtSignal(int, int)
+    _finished = pyqtSignal(str)
+    _failed = pyqtSignal(str)
+    _cancelled = pyqtSignal()
+
+    def __init__(
+        self,
+        image,
+        path,
+        format="png",
+        level=constants.EXPORT_PNG_LEVEL,
+        quality=constants.EXPORT_QUALITY,
+        pool=None,
+    ):
+        super().__init__()
+        self.snapshot = Snapshot(image)
+        self.path = path
+        self.format = format
+        self.level = level
+        self.quality = quality
+        self.pool = pool or QThreadPool.globalInstance()
+        self.is_cancelled = False
+
+        self._progress.connect(self.progress)
+        self._finished.connect(self.finished)
+        self._failed.connect(self.failed)
+        self._cancelled.connect(self.cancelled)
+
+    def start(self):
+        self.pool.start(self._run)
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def preserve(self, image, rect):
+        self.snapshot.preserve(image, rect)
+
+    def bands(self):
+        """
+        Yield the image a band at a time, emitting progress.
+        """
+        for n in range(self.snapshot.bands):
+            if self.is_cancelled:
+                raise Cancelled()
+            yield self.snapshot.band(n)
+            self._progress.emit(n + 1, self.snapshot.bands)
+
+    def _run(self):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        try:
+            fd, temp = tempfile.mkstemp(
+                prefix=".%s." % name, suffix=".tmp", dir=directory
+            )
+        except OSError as e:
+            self._failed.emit(str(e))
+            return
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if self.format == "png":
+                    self.write_png(f)
+                else:
+                    self.write_qt(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp, 0o666 & ~UMASK)
+            os.replace(temp, self.path)
+
+        except Cancelled:
+            os.remove(temp)
+            self._cancelled.emit()
+        except Exception as e:
+            if os.path.exists(temp):
+                os.remove(temp)
+            self._failed.emit(str(e))
+        else:
+            self._finished.emit(self.path)
+
+    def write_png(self, f):
+        image = self.snapshot.image
+        premultiplied = image.format() == QImage.Format.Format_ARGB32_Premultiplied
+        compressor = zlib.compressobj(self.level)
+
+        f.write(png_header(image.width(), image.height()))
+        previous = None
+        for band in self.bands():
+            pixels = rgba(band, premultiplied)
+            data = compressor.compress(png_rows(pixels, previous))
+            previous = pixels[-1].reshape(-1)
+            if data:
+                f.write(png_chunk(b"IDAT", data))
+        f.write(png_chunk(b"IDAT", compressor.flush()))
+        f.write(png_chunk(b"IEND", b""))
+
+    def write_qt(self, f):
+        image = self.snapshot.image
+        arr = np.concatenate(list(self.bands()))
+        copy = QImage(
+            sip.voidptr(arr.ctypes.data),
+            arr.shape[1],
+            arr.shape[0],
+            arr.strides[0],
+            image.format(),
+        )
+
+        # Qt's encoders need the whole image, so encode into memory.
+        buffer = QBuffer()
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        writer = QImageWriter(buffer, self.format.encode())
+        writer.setQuality(self.quality)
+        if not writer.write(copy):
+            raise OSError(writer.errorString())
+        f.write(buffer.data().data())
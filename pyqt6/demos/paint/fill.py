@@ -0,0 +1,189 @@
+"""
+Scanline flood fill operating directly on QImage pixel data.
+
+The image bits are viewed as a 2D NumPy array of 32-bit pixels (no copy),
+so the match test, the span search and the final write are all done
+in bulk rather than pixel-by-pixel through QImage.pixel().
+"""
+
+from bisect import bisect_right
+
+import numpy as np
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+
+# Formats we can view as one uint32 per pixel.
+PIXEL32_FORMATS = (
+    QImage.Format.Format_RGB32,
+    QImage.Format.Format_ARGB32,
+    QImage.Format.Format_ARGB32_Premultiplied,
+)
+
+
+def image_array(image):
+    """
+    Return a writable (height, width) uint32 view onto the image pixels.
+
+    The image must be in one of PIXEL32_FORMATS. Writing into the array
+    writes into the image, without any copy in either direction.
+
+    :param image: QImage to view.
+    :return: numpy.ndarray of shape (height, width), dtype uint32.
+    """
+    if image.format() not in PIXEL32_FORMATS:
+        raise ValueError("Unsupported image format: %s" % image.format())
+
+    ptr = image.bits()  # Non-const bits(), detaches any shared copy.
+    ptr.setsize(image.sizeInBytes())
+    stride = image.bytesPerLine() // 4
+    arr = np.frombuffer(ptr, dtype=np.uint32).reshape(image.height(), stride)
+    return arr[:, : image.width()]
+
+
+def color_value(color, fmt):
+    """
+    Convert a QColor to the raw 32-bit value used by an image format.
+
+    Premultiplied formats store scaled channels, so rather than
+    reimplementing that let Qt fill a single pixel and read it back.
+
+    :param color: QColor to convert.
+    :param fmt: QImage.Format of the target image.
+    :return: int raw pixel value.
+    """
+    swatch = QImage(1, 1, fmt)
+    swatch.fill(color)
+    return int(image_array(swatch)[0, 0])
+
+
+def match_mask(arr, target, tolerance=0):
+    """
+    Build a boolean mask of the pixels which match the target value.
+
+    :param arr: (h, w) uint32 pixel array.
+    :param target: raw uint32 pixel value to match.
+    :param tolerance: maximum per-channel difference (0-255) to still match.
+    :return: (h, w) bool numpy.ndarray.
+    """
+    if not tolerance:
+        return arr == target
+
+    channels = arr.view(np.uint8).reshape(arr.shape + (4,))
+    target_channels = np.array([target], dtype=np.uint32).view(np.uint8)
+    diff = np.abs(channels.astype(np.int16) - target_channels.astype(np.int16))
+    return diff.max(axis=2) <= tolerance
+
+
+def find_runs(mask):
+    """
+    Find every horizontal run of True values in a 2D mask.
+
+    Runs are returned in row-major order, so within each row they are
+    sorted by both start and end.
+
+    :param mask: (h, w) bool numpy.ndarray.
+    :return: tuple of (rows, starts, ends) int arrays, end exclusive.
+    """
+    h, w = mask.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends
+
+
+def fill_mask(image, x, y, color, tolerance=0, connectivity=4):
+    """
+    Find the region a flood fill from (x, y) would cover, without filling it.
+
+    This is a scanline fill over precomputed spans. All runs of matching
+    pixels are found in a single vectorised pass, then the fill walks
+    from the seed span to the spans it touches in the rows above and
+    below. The Python loop runs once per span rather than once per pixel.
+
+    :param image: QImage in one of PIXEL32_FORMATS.
+    :param x: seed x coordinate.
+    :param y: seed y coordinate.
+    :param color: QColor to fill with.
+    :param tolerance: maximum per-channel difference (0-255) to treat as a match.
+    :param connectivity: 4 or 8, whether diagonal neighbours are connected.
+    :return: tuple of ((h, w) bool mask, QRect bounding the region). The
+        mask is None if there is nothing to fill.
+    """
+    if connectivity not in (4, 8):
+        raise ValueError("connectivity must be 4 or 8")
+
+    arr = image_array(image)
+    h, w = arr.shape
+    if not (0 <= x < w and 0 <= y < h):
+        return None, QRect()
+
+    value = color_value(color, image.format())
+    target = int(arr[y, x])
+    if target == value and not tolerance:
+        # Filling with the same color would change nothing.
+        return None, QRect()
+
+    run_rows, run_starts, run_ends = find_runs(match_mask(arr, target, tolerance))
+    # Index of the first run on each row, plus a sentinel for the last row.
+    row_ptr = np.searchsorted(run_rows, np.arange(h + 1)).tolist()
+    starts, ends = run_starts.tolist(), run_ends.tolist()
+    # With 8-connectivity spans touching diagonally also connect.
+    reach = 1 if connectivity == 8 else 0
+
+    # The seed pixel always matches, so it is always inside a run.
+    seed = bisect_right(starts, x, row_ptr[y], row_ptr[y + 1]) - 1
+
+    visited = bytearray(len(starts))
+    stack = [(seed, y)]
+    while stack:
+        run, ry = stack.pop()
+        if visited[run]:
+            continue
+        visited[run] = 1
+
+        x0, x1 = starts[run] - reach, ends[run] + reach
+        for ny in (ry - 1, ry + 1):
+            if 0 <= ny < h:
+                # Runs on a row are disjoint and sorted, so skip straight
+                # to the first one ending after our span starts.
+                hi = row_ptr[ny + 1]
+                n = bisect_right(ends, x0, row_ptr[ny], hi)
+                while n < hi and starts[n] < x1:
+                    if not visited[n]:
+                        stack.append((n, ny))
+                    n += 1
+
+    selected = np.frombuffer(visited, dtype=np.uint8).astype(bool)
+    rows, x0s, x1s = run_rows[selected], run_starts[selected], run_ends[selected]
+
+    # Mark span edges and accumulate along rows to get the filled pixels.
+    marks = np.zeros((h, w + 1), dtype=np.int8)
+    marks[rows, x0s] = 1
+    marks[rows, x1s] = -1
+    filled = np.cumsum(marks, axis=1, dtype=np.int8)[:, :w].astype(bool)
+
+    top, left = int(rows.min()), int(x0s.min())
+    return filled, QRect(left, top, int(x1s.max()) - left, int(rows.max()) - top + 1)
+
+
+def apply_mask(image, mask, color):
+    """
+    Set every pixel of image under mask to color, in a single pass.
+    """
+    image_array(image)[mask] = color_value(color, image.format())
+
+
+def flood_fill(image, x, y, color, tolerance=0, connectivity=4):
+    """
+    Flood fill the region connected to (x, y) with color, in place.
+
+    Takes the same arguments as fill_mask().
+
+    :return: QRect bounding the filled region (empty if nothing was filled).
+    """
+    mask, rect = fill_mask(image, x, y, color, tolerance, connectivity)
+    if mask is not None:
+        apply_mask(image, mask, color)
+    return rect
@@ -0,0 +1,325 @@
+"""
+Image filters, run tile by tile on a thread pool.
+
+Filters work on NumPy views of the image bits. A FilterJob first takes a
+snapshot of the image, then splits it into tiles and filters each tile on
+a QThreadPool worker. Filters which look at neighbouring pixels (blur,
+sharpen) read a margin of snapshot pixels around each tile, so tiles never
+see each other's output. NumPy releases the GIL for the heavy lifting, so
+tiles really do run in parallel.
+
+Finished tiles are handed back to the GUI thread one at a time (tile_done),
+so the canvas can show them as they arrive, and a job can be cancelled at
+any point, dropping any tiles not yet started. If a tile raises, the job
+cancels itself and emits failed instead of finished.
+"""
+
+from functools import partial
+
+import constants
+import numpy as np
+from fill import image_array
+from PyQt6.QtCore import QObject, QRect, QThreadPool, pyqtSignal
+
+
+def channels(arr):
+    """
+    View a (h, w) uint32 pixel array as (h, w, 4) uint8, in B, G, R, A order.
+    """
+    return arr.view(np.uint8).reshape(arr.shape + (4,))
+
+
+def pixels(ch):
+    """
+    Convert a (h, w, 4) channel array back to (h, w) uint32 pixels.
+    """
+    return np.ascontiguousarray(ch, dtype=np.uint8).view(np.uint32)[..., 0]
+
+
+def rect_slices(rect):
+    """
+    Return the (rows, columns) slices for a QRect, to index a pixel array.
+    """
+    return (
+        slice(rect.top(), rect.bottom() + 1),
+        slice(rect.left(), rect.right() + 1),
+    )
+
+
+# Point filters. Each builds a 256 entry lookup table, applied to the
+# colour channels of unpremultiplied pixels.
+
+
+def apply_lut(src, lut):
+    ch = channels(src).copy()
+    alpha = ch[..., 3]
+    if (alpha == 255).all():
+        # Opaque, so premultiplied and straight colours are the same.
+        ch[..., :3] = lut[ch[..., :3]]
+        return pixels(ch)
+
+    a = alpha.astype(np.float32)[..., None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        straight = np.where(a > 0, ch[..., :3] * (255 / a), 0)
+    straight = lut[np.clip(straight + 0.5, 0, 255).astype(np.uint8)]
+    ch[..., :3] = (straight * (a / 255) + 0.5).astype(np.uint8)
+    return pixels(ch)
+
+
+def lut_range(values):
+    return np.clip(np.round(values), 0, 255).astype(np.uint8)
+
+
+def invert(src):
+    return apply_lut(src, 255 - np.arange(256, dtype=np.uint8))
+
+
+def brightness_contrast(src, brightness=0, contrast=0):
+    """
+    :param brightness: -100 to 100, added as a percentage of full scale.
+    :param contrast: -100 to 100, scaling about the mid-point.
+    """
+    x = np.arange(256, dtype=np.float32)
+    scale = ((100 + contrast) / 100) ** 2
+    return apply_lut(src, lut_range((x - 128) * scale + 128 + brightness * 2.55))
+
+
+def levels(src, black=0, white=255, gamma=1.0):
+    """
+    Stretch black..white to the full range, then apply gamma.
+    """
+    x = np.arange(256, dtype=np.float32)
+    x = np.clip((x - black) / max(white - black, 1), 0, 1)
+    return apply_lut(src, lut_range(x ** (1 / gamma) * 255))
+
+
+def posterize(src, levels=4):
+    x = np.arange(256, dtype=np.float32)
+    steps = levels - 1
+    return apply_lut(src, lut_range(np.round(x / 255 * steps) * 255 / steps))
+
+
+# Neighbourhood filters. These receive the tile with a margin of `halo`
+# pixels on every side, and return the tile without it. Premultiplied
+# pixels can be averaged directly.
+
+
+def gaussian_kernel(radius):
+    sigma = max(radius / 2, 0.5)
+    x = np.arange(-radius, radius + 1, dtype=np.float32)
+    kernel = np.exp(-(x**2) / (2 * sigma**2))
+    return kernel / kernel.sum()
+
+
+def convolve(ch, radius):
+    """
+    Separable gaussian blur of a (h, w, 4) float array, trimming radius
+    pixels from every side.
+    """
+    kernel = gaussian_kernel(radius)
+    h, w = ch.shape[:2]
+    rows = sum(k * ch[:, i : w - 2 * radius + i] for i, k in enumerate(kernel))
+    return sum(k * rows[i : h - 2 * radius + i] for i, k in enumerate(kernel))
+
+
+def finish(ch):
+    """
+    Round a float channel array to pixels, keeping colour within alpha.
+    """
+    ch = np.clip(ch + 0.5, 0, 255)
+    ch[..., :3] = np.minimum(ch[..., :3], ch[..., 3:])
+    return pixels(ch.astype(np.uint8))
+
+
+def blur(src, radius=2):
+    return finish(convolve(channels(src).astype(np.float32), radius))
+
+
+def sharpen(src, radius=2, amount=1.0):
+    """
+    Unsharp mask: push each pixel away from its blurred surroundings.
+    """
+    ch = channels(src).astype(np.float32)
+    blurred = convolve(ch, radius)
+    centre = ch[radius:-radius, radius:-radius]
+    return finish(centre + amount * (centre - blurred))
+
+
+class Filter:
+    """
+    A filter function, with its parameters for the UI.
+
+    :param params: list of (name, label, default, minimum, maximum) tuples.
+    The type of the default sets whether the value is an int or a float.
+    :param halo: name of the parameter giving the margin the filter needs
+    around each tile, if any.
+    """
+
+    def __init__(self, label, apply, params=(), halo=None):
+        self.label = label
+        self.apply = apply
+        self.params = params
+        self.halo = halo
+
+    def defaults(self):
+        return {name: default for name, _, default, _, _ in self.params}
+
+
+FILTERS = {
+    "invert": Filter("Invert Colors", invert),
+    "blur": Filter("Blur", blur, [("radius", "Radius", 2, 1, 50)], halo="radius"),
+    "sharpen": Filter(
+        "Sharpen",
+        sharpen,
+        [("radius", "Radius", 2, 1, 20), ("amount", "Amount", 1.0, 0.1, 5.0)],
+        halo="radius",
+    ),
+    "brightness_contrast": Filter(
+        "Brightness/Contrast",
+        brightness_contrast,
+        [
+            ("brightness", "Brightness", 0, -100, 100),
+            ("contrast", "Contrast", 0, -100, 100),
+        ],
+    ),
+    "levels": Filter(
+        "Levels",
+        levels,
+        [
+            ("black", "Black point", 0, 0, 254),
+            ("white", "White point", 255, 1, 255),
+            ("gamma", "Gamma", 1.0, 0.1, 10.0),
+        ],
+    ),
+    "posterize": Filter("Posterize", posterize, [("levels", "Levels", 4, 2, 64)]),
+}
+
+
+class FilterJob(QObject):
+    """
+    Runs a filter over an image on a thread pool, a tile at a time.
+
+    The image itself is never written to from here: connect to tile_done
+    to receive each filtered tile (as a QRect and a pixel array) on the
+    GUI thread, and write it in.
+    """
+
+    tile_done = pyqtSignal(QRect, object)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    # Emitted from the worker threads, and delivered on the GUI thread.
+    _snapshot_ready = pyqtSignal()
+    _tile_ready = pyqtSignal(QRect, object)
+    _failed = pyqtSignal(str)
+
+    def __init__(
+        self,
+        image,
+        filter,
+        params=None,
+        pool=None,
+        tile_size=constants.FILTER_TILE_SIZE,
+    ):
+        super().__init__()
+        self.image = image
+        self.filter = filter
+        self.params = dict(filter.defaults(), **(params or {}))
+        self.halo = self.params[filter.halo] if filter.halo else 0
+        self.pool = pool or QThreadPool.globalInstance()
+        self.tile_size = tile_size
+
+        self.source = None
+        self.rects = []
+        self.applied = []
+        self.cancelled = False
+
+        self._snapshot_ready.connect(self._start_tiles)
+        self._tile_ready.connect(self._collect)
+        self._failed.connect(self._fail)
+
+    def start(self):
+        # Even the snapshot is taken off the GUI thread, as on a large
+        # image the copy alone can take a noticeable time.
+        self.pool.start(self._snapshot)
+
+    def cancel(self):
+        """
+        Stop the job. Tiles already delivered stay delivered, nothing more is.
+        """
+        self.cancelled = True
+        self.pool.clear()
+
+    def _snapshot(self):
+        # Copy a band at a time, so other threads get the GIL in between.
+        try:
+            arr = image_array(self.image)
+            source = np.empty_like(arr)
+            for y in range(0, arr.shape[0], self.tile_size):
+                source[y : y + self.tile_size] = arr[y : y + self.tile_size]
+        except Exception as e:
+            self._failed.emit(str(e))
+            return
+        self.source = source
+        self._snapshot_ready.emit()
+
+    def _start_tiles(self):
+        if self.cancelled:
+            return
+        ts = self.tile_size
+        h, w = self.source.shape
+        self.rects = [
+            QRect(x, y, min(ts, w - x), min(ts, h - y))
+            for y in range(0, h, ts)
+            for x in range(0, w, ts)
+        ]
+        self.progress.emit(0, len(self.rects))
+        if not self.rects:
+            self.finished.emit()
+        for rect in self.rects:
+            self.pool.start(partial(self._run, rect))
+
+    def _run(self, rect):
+        if self.cancelled:
+            return
+        try:
+            result = self._filter_tile(rect)
+        except Exception as e:
+            self._failed.emit(str(e) or type(e).__name__)
+            return
+        self._tile_ready.emit(rect, result)
+
+    def _filter_tile(self, rect):
+        # The tile plus its halo, with the image edges extended outwards.
+        h, w = self.source.shape
+        r = self.halo
+        x0, y0 = rect.left() - r, rect.top() - r
+        x1, y1 = rect.right() + 1 + r, rect.bottom() + 1 + r
+        src = self.source[max(y0, 0) : min(y1, h), max(x0, 0) : min(x1, w)]
+        if r:
+            pad = (
+                (max(-y0, 0), max(y1 - h, 0)),
+                (max(-x0, 0), max(x1 - w, 0)),
+            )
+            src = np.pad(src, pad, mode="edge")
+
+        params = {name: self.params[name] for name, *_ in self.filter.params}
+        return self.filter.apply(src, **params)
+
+    def _collect(self, rect, result):
+        if self.cancelled:
+            return
+        self.applied.append(rect)
+        self.tile_done.emit(rect, result)
+        self.progress.emit(len(self.applied), len(self.rects))
+        if len(self.applied) == len(self.rects):
+            self.finished.emit()
+
+    def _fail(self, error):
+        # Only the first failure is reported, the rest are dropped with
+        # the job.
+        if self.cancelled:
+            return
+        self.cancel()
+        self.failed.emit(error)
@@ -0,0 +1,269 @@
+"""
+Undo/redo history for the canvas, stored as compressed tile deltas.
+
+The image is split into a grid of fixed-size tiles. While an edit is in
+progress the canvas reports each rect it is about to paint, and the tiles
+under it are copied before they change. When the edit ends, only the tiles
+which actually changed are kept, as zlib-compressed before/after pairs.
+
+Edits are held in a ring bounded by total compressed size, so the oldest
+steps are dropped once the memory budget is used up.
+"""
+
+import zlib
+from collections import deque
+
+import constants
+import numpy as np
+from fill import image_array
+from PyQt6.QtCore import QRect
+from store import new_image
+
+
+class Edit:
+    """
+    A single undoable step: the tiles it changed, before and after.
+
+    If the edit resized the image, the tiles cover the whole image on
+    each side, so either state can be rebuilt from scratch.
+    """
+
+    __slots__ = (
+        "before_size",
+        "after_size",
+        "before",
+        "after",
+        "nbytes",
+        "layer",
+        "changes",
+    )
+
+    def __init__(self, before_size, after_size, before, after, layer=None, changes=()):
+        self.before_size = before_size
+        self.after_size = after_size
+        # Lists of (QRect, compressed bytes) tuples.
+        self.before = before
+        self.after = after
+        self.nbytes = sum(len(data) for _, data in before + after)
+        # Whatever the edit was made to, for callers with several images.
+        self.layer = layer
+        # Changes to anything besides the pixels, see History.record().
+        self.changes = changes
+
+
+class History:
+    """
+    Tile-based undo/redo stack for a QImage.
+
+    Call begin() before an edit, touch() with each rect before painting
+    into it, and commit() once the edit is complete.
+    """
+
+    def __init__(
+        self,
+        max_bytes=constants.HISTORY_MAX_BYTES,
+        tile_size=constants.HISTORY_TILE_SIZE,
+        level=constants.HISTORY_COMPRESSION,
+    ):
+        self.max_bytes = max_bytes
+        self.tile_size = tile_size
+        self.level = level
+
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.nbytes = 0
+
+        self._size = None
+        self._pending = None
+        self._layer = None
+        self._changes = []
+
+    @property
+    def active(self):
+        return self._pending is not None
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.nbytes = 0
+        self._size = None
+        self._pending = None
+
+    def tiles(self, size, rect):
+        """
+        Yield the (tx, ty) tile coordinates covered by rect, clipped to size.
+        """
+        rect = rect.intersected(QRect(0, 0, size.width(), size.height()))
+        if rect.isEmpty():
+            return
+        ts = self.tile_size
+        for ty in range(rect.top() // ts, rect.bottom() // ts + 1):
+            for tx in range(rect.left() // ts, rect.right() // ts + 1):
+                yield tx, ty
+
+    def tile_rect(self, size, tx, ty):
+        ts = self.tile_size
+        return QRect(tx * ts, ty * ts, ts, ts).intersected(
+            QRect(0, 0, size.width(), size.height())
+        )
+
+    def _read(self, image, rect):
+        arr = image_array(image)
+        return arr[
+            rect.top() : rect.bottom() + 1, rect.left() : rect.right() + 1
+        ].tobytes()
+
+    def _write(self, image, rect, data):
+        arr = image_array(image)
+        arr[rect.top() : rect.bottom() + 1, rect.left() : rect.right() + 1] = (
+            np.frombuffer(zlib.decompress(data), dtype=np.uint32).reshape(
+                rect.height(), rect.width()
+            )
+        )
+
+    def begin(self, image, layer=None):
+        """
+        Start recording an edit to image. Does nothing if one is already open,
+        so nested operations are folded into the outer edit.
+
+        :param layer: stored with the edit, see peek_undo().
+        """
+        if self._pending is None:
+            self._size = image.size()
+            self._pending = {}
+            self._layer = layer
+            self._changes = []
+
+    def touch(self, image, rect):
+        """
+        Save the current state of any tiles under rect which this edit
+        hasn't already saved. Must be called before painting into rect.
+        """
+        if self._pending is None:
+            return
+        for tile in self.tiles(self._size, rect):
+            if tile not in self._pending:
+                self._pending[tile] = self._read(
+                    image, self.tile_rect(self._size, *tile)
+                )
+
+    def touch_all(self, image):
+        self.touch(image, image.rect())
+
+    def record(self, key, before, after):
+        """
+        Record a change made by this edit to something other than the
+        pixels, such as a shape on a vector layer. The caller reverts it
+        with the edit's changes after undo() and redo().
+        """
+        if self._pending is not None:
+            self._changes.append((key, before, after))
+
+    def commit(self, image):
+        """
+        Finish the current edit, storing the tiles which changed.
+        """
+        if self._pending is None:
+            return
+
+        pending, self._pending = self._pending, None
+        before_size, after_size = self._size, image.size()
+
+        before, after = [], []
+        if before_size == after_size:
+            for tile, raw in pending.items():
+                rect = self.tile_rect(before_size, *tile)
+                current = self._read(image, rect)
+                if current != raw:
+                    before.append((rect, zlib.compress(raw, self.level)))
+                    after.append((rect, zlib.compress(current, self.level)))
+
+        else:
+            # The image was replaced with one of a different size. The caller
+            # must have touched the whole image before replacing it.
+            for tile, raw in pending.items():
+                rect = self.tile_rect(before_size, *tile)
+                before.append((rect, zlib.compress(raw, self.level)))
+            for tile in self.tiles(after_size, image.rect()):
+                rect = self.tile_rect(after_size, *tile)
+                after.append((rect, zlib.compress(self._read(image, rect), self.level)))
+
+        if not before and not after and not self._changes:
+            return
+
+        self.push(
+            Edit(before_size, after_size, before, after, self._layer, self._changes)
+        )
+
+    def push(self, edit):
+        self.undo_stack.append(edit)
+        self.nbytes += edit.nbytes
+
+        # New edits invalidate anything which was undone.
+        for dropped in self.redo_stack:
+            self.nbytes -= dropped.nbytes
+        self.redo_stack.clear()
+
+        # Drop the oldest steps to stay within budget, but always keep the latest.
+        while self.nbytes > self.max_bytes and len(self.undo_stack) > 1:
+            self.nbytes -= self.undo_stack.popleft().nbytes
+
+    def peek_undo(self):
+        """
+        Return the Edit undo() would revert, or None. Its layer tells the
+        caller which image to pass in.
+        """
+        return self.undo_stack[-1] if self.undo_stack else None
+
+    def peek_redo(self):
+        return self.redo_stack[-1] if self.redo_stack else None
+
+    def forget(self, layer):
+        """
+        Drop every edit made to layer, once it no longer exists.
+        """
+        for stack in (self.undo_stack, self.redo_stack):
+            kept = [edit for edit in stack if edit.layer is not layer]
+            self.nbytes -= sum(edit.nbytes for edit in stack if edit.layer is layer)
+            stack.clear()
+            stack.extend(kept)
+
+    def _apply(self, image, size, tiles):
+        if image.size() != size:
+            image = new_image(size.width(), size.height(), image.format())
+
+        dirty = QRect()
+        for rect, data in tiles:
+            self._write(image, rect, data)
+            dirty = dirty.united(rect)
+        return image, dirty
+
+    def undo(self, image):
+        """
+        Revert the last edit.
+
+        :param image: the current image, modified in place if possible.
+        :return: tuple of (image, dirty QRect). The image is a new QImage if
+        the edit changed the image size.
+        """
+        if not self.undo_stack:
+            return image, QRect()
+        edit = self.undo_stack.pop()
+        self.redo_stack.append(edit)
+        return self._apply(image, edit.before_size, edit.before)
+
+    def redo(self, image):
+        """
+        Re-apply the last undone edit. Returns (image, dirty QRect) as undo().
+        """
+        if not self.redo_stack:
+            return image, QRect()
+        edit = self.redo_stack.pop()
+        self.undo_stack.append(edit)
+        return self._apply(image, edit.after_size, edit.after)
@@ -0,0 +1,505 @@
+"""
+Autosave to an append-only journal, for recovery after a crash.
+
+The Journal watches the canvas and keeps a set of dirty tiles for each
+layer. Every AUTOSAVE_INTERVAL it takes a checkpoint: the dirty tiles are
+copied (on the GUI thread, so they are consistent, but only the tiles
+which changed) and handed to a JournalWriter thread. The writer compresses
+them and appends them to the journal file, followed by a commit record,
+never writing faster than its bytes-per-second budget. If the writer is
+still busy with the last checkpoint, the next one waits and the dirty
+tiles just accumulate.
+
+As tiles are rewritten the journal grows, so once it is more than twice
+the size of the latest copy of every tile the writer compacts it: the
+latest records are copied to a new file, which replaces the old one.
+
+recover() reads a journal back, up to its last complete checkpoint, and
+rebuilds the layers. Undo history isn't journaled.
+
+A checkpoint which fails to be written (the disk is full, say) is cut back
+off the journal, so it stays readable as of the last commit, and its tiles
+are marked dirty again for the next checkpoint. Journal emits failed with
+the error each time.
+
+Every running instance has its own journal, claimed with a lock file by
+claim(), so one instance never offers to recover (or deletes) the journal
+of another that is still running. A journal whose lock was left behind by
+a process that has died is there to be recovered.
+
+The file is a sequence of records, each a length, a type byte, the payload
+and a CRC:
+
+- M: manifest, JSON. The image size, the layers (with an id for each and
+  their properties) and which is active.
+- T: tile. Layer id, x, y, width and height, then zlib-compressed pixels.
+- C: commit. Everything since the previous commit is complete.
+"""
+
+import glob
+import json
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+import constants
+import numpy as np
+from fill import image_array
+from layers import Layer, blank_layer_image
+from PyQt6.QtCore import QLockFile, QObject, QRect, QSize, QTimer, pyqtSignal
+
+MAGIC = b"PCJ1"
+HEADER = struct.Struct(">IB")
+TILE = struct.Struct(">IIIII")
+CRC = struct.Struct(">I")
+
+
+def record(kind, payload):
+    data = HEADER.pack(len(payload), ord(kind)) + payload
+    return data + CRC.pack(zlib.crc32(data))
+
+
+def read_records(f):
+    """
+    Yield (offset, kind, payload) for each record in a journal, stopping
+    at the first incomplete or corrupt one.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        return
+    while True:
+        offset = f.tell()
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        length, kind = HEADER.unpack(header)
+        payload = f.read(length)
+        crc = f.read(CRC.size)
+        if len(payload) < length or len(crc) < CRC.size:
+            return
+        if CRC.unpack(crc)[0] != zlib.crc32(header + payload):
+            return
+        yield offset, chr(kind), payload
+
+
+def claim(directory):
+    """
+    Find a journal path in directory which no running instance is using,
+    and lock it. Journals left by instances which died come first, so they
+    can be recovered.
+
+    :return: tuple of (path, locked QLockFile), or None if no lock can be
+    made there at all, for example if directory isn't writable. Keep the
+    lock until done with the journal.
+    """
+    pattern = os.path.join(directory, constants.AUTOSAVE_FILE)
+    existing = sorted(glob.glob(pattern % "*"))
+    n = 0
+    while True:
+        if existing:
+            path = existing.pop(0)
+        else:
+            path = pattern % n
+            n += 1
+        lock = QLockFile(path + ".lock")
+        # Never stale by age; Qt still takes over a lock whose process is
+        # gone.
+        lock.setStaleLockTime(0)
+        if lock.tryLock(0):
+            return path, lock
+        # Only a lock held by someone else is worth moving on from.
+        if lock.error() != QLockFile.LockError.LockFailedError:
+            return None
+
+
+class Discarded(Exception):
+    """
+    Raised in the writer thread when queued work is thrown away.
+    """
+
+
+def recover(path):
+    """
+    Rebuild the layers from a journal, as of its last complete checkpoint.
+
+    :return: tuple of (list of Layers, active index), or None if the
+    journal holds no complete checkpoint.
+    """
+    manifest, tiles = None, {}
+    pending_manifest, pending = None, {}
+    try:
+        with open(path, "rb") as f:
+            for _, kind, payload in read_records(f):
+                if kind == "M":
+                    pending_manifest = json.loads(payload)
+                elif kind == "T":
+                    pending[TILE.unpack_from(payload)[:3]] = payload
+                elif kind == "C":
+                    manifest = pending_manifest or manifest
+                    tiles.update(pending)
+                    pending_manifest, pending = None, {}
+    except OSError:
+        return None
+    if manifest is None:
+        return None
+
+    size = QSize(*manifest["size"])
+    layers = []
+    for entry in manifest["layers"]:
+        image = blank_layer_image(size)
+        arr = image_array(image)
+        for (layer_id, x, y), payload in tiles.items():
+            if layer_id != entry["id"]:
+                continue
+            w, h = TILE.unpack_from(payload)[3:]
+            pixels = np.frombuffer(
+                zlib.decompress(payload[TILE.size :]), dtype=np.uint32
+            )
+            arr[y : y + h, x : x + w] = pixels.reshape(h, w)
+        layers.append(
+            Layer(
+                entry["name"],
+                image,
+                opacity=entry["opacity"],
+                mode=entry["mode"],
+                visible=entry["visible"],
+            )
+        )
+    return layers, manifest["active"]
+
+
+class JournalWriter(threading.Thread):
+    """
+    Appends checkpoints to the journal file, off the GUI thread.
+
+    :param rate: maximum bytes written per second.
+    :param failed: called from the writer thread with the error message and
+        the (manifest, tiles) of a checkpoint which couldn't be written.
+    """
+
+    def __init__(self, path, rate=constants.AUTOSAVE_BYTES_PER_SECOND, failed=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.rate = rate
+        self.failed = failed
+        self.queue = queue.Queue()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.discarding = threading.Event()
+
+        self.file = None
+        self.manifest = None
+        # Where the latest record for each tile is, as (offset, length),
+        # and how many bytes those add up to.
+        self.index = {}
+        self.live_bytes = 0
+        self.ready_at = time.monotonic()
+
+    def submit(self, manifest, tiles):
+        """
+        Queue a checkpoint: the manifest, if it changed, and a list of
+        (layer id, QRect, pixel array) tiles.
+        """
+        self.idle.clear()
+        self.queue.put((manifest, tiles))
+
+    def stop(self, discard=False):
+        """
+        Stop the thread, once it has written everything queued, or with
+        discard as soon as it can, leaving the journal as of its last
+        commit.
+        """
+        if discard:
+            self.discarding.set()
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            try:
+                self.checkpoint(*batch)
+            except Discarded:
+                continue
+            except Exception as e:
+                # Keep going, the next checkpoint may succeed.
+                if self.failed:
+                    self.failed(str(e) or type(e).__name__, batch)
+            if self.queue.empty():
+                self.idle.set()
+        if self.file:
+            self.file.close()
+
+    def throttle(self, n):
+        """
+        Wait until n more bytes can be written within the budget.
+        """
+        if self.discarding.is_set():
+            raise Discarded
+        now = time.monotonic()
+        if self.ready_at > now and self.discarding.wait(self.ready_at - now):
+            raise Discarded
+        self.ready_at = max(self.ready_at, now) + n / self.rate
+
+    def write(self, f, data):
+        self.throttle(len(data))
+        offset = f.tell()
+        f.write(data)
+        return offset
+
+    def commit(self, f):
+        self.write(f, record("C", b""))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def checkpoint(self, manifest, tiles):
+        if manifest is not None:
+            self.manifest = manifest
+        # Compressed as they are written, so discarding stops both.
+        records = (
+            (
+                (layer_id, rect.x(), rect.y()),
+                record(
+                    "T",
+                    TILE.pack(layer_id, rect.x(), rect.y(), rect.width(), rect.height())
+                    + zlib.compress(pixels.tobytes(), constants.HISTORY_COMPRESSION),
+                ),
+            )
+            for layer_id, rect, pixels in tiles
+        )
+
+        if self.file is None:
+            # Start a new journal, which only replaces any old one once this
+            # first checkpoint is safely written.
+            self.file = self.rewrite(records)
+            return
+
+        f = self.file
+        start = f.tell()
+        written = {}
+        try:
+            if manifest is not None:
+                self.write(f, record("M", json.dumps(manifest).encode()))
+            for key, data in records:
+                written[key] = self.write(f, data), len(data)
+            self.commit(f)
+        except BaseException:
+            # Cut off the partial checkpoint, so the journal stays readable
+            # as of its last commit.
+            f.seek(start)
+            f.truncate()
+            raise
+        for key, (offset, length) in written.items():
+            self.live_bytes += length - self.index.get(key, (0, 0))[1]
+            self.index[key] = offset, length
+
+        if f.tell() > max(2 * self.live_bytes, constants.JOURNAL_COMPACT_BYTES):
+            self.file = self.rewrite(self.live_records())
+
+    def live_records(self):
+        """
+        Yield the latest record for every tile of a current layer.
+        """
+        ids = {entry["id"] for entry in self.manifest["layers"]}
+        for key, (offset, length) in sorted(self.index.items(), key=lambda i: i[1]):
+            if key[0] in ids:
+                self.file.seek(offset)
+                yield key, self.file.read(length)
+
+    def rewrite(self, records):
+        """
+        Write a new journal holding the manifest and the given tile records,
+        and swap it in for the old file.
+
+        :param records: (key, record) pairs, as kept in the index.
+        :return: the new file, open for appending.
+        """
+        directory, name = os.path.split(self.path)
+        fd, temp = tempfile.mkstemp(prefix=".%s." % name, dir=directory)
+        f = os.fdopen(fd, "w+b")
+        try:
+            f.write(MAGIC)
+            index = {}
+            self.write(f, record("M", json.dumps(self.manifest).encode()))
+            for key, data in records:
+                index[key] = self.write(f, data), len(data)
+            self.commit(f)
+        except BaseException:
+            f.close()
+            os.remove(temp)
+            raise
+        os.replace(temp, self.path)
+
+        if self.file:
+            self.file.close()
+        self.index = index
+        self.live_bytes = sum(length for _, length in index.values())
+        return f
+
+
+class Journal(QObject):
+    """
+    Autosaves a canvas to a journal file, see the module docstring.
+    """
+
+    failed = pyqtSignal(str)
+
+    # Emitted from the writer thread, and handled on the GUI thread.
+    _failed = pyqtSignal(str, object)
+
+    def __init__(
+        self,
+        canvas,
+        path,
+        rate=constants.AUTOSAVE_BYTES_PER_SECOND,
+        interval=constants.AUTOSAVE_INTERVAL,
+        tile_size=constants.JOURNAL_TILE_SIZE,
+        lock=None,
+    ):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.path = path
+        # The QLockFile from claim(), released on close.
+        self.lock = lock
+        self.tile_size = tile_size
+
+        # Journal ids for the layers, with the image each id was given for.
+        # A layer gets a new id whenever its image is replaced.
+        self.ids = {}
+        self.next_id = 0
+        self.manifest = None
+        self.manifest_changed = False
+        self.dirty = {}
+
+        self._failed.connect(self.checkpoint_failed)
+        self.writer = JournalWriter(path, rate, failed=self._failed.emit)
+        self.writer.start()
+
+        canvas.image_updated.connect(self.mark)
+        canvas.layers_updated.connect(self.restacked)
+        self.restacked()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.checkpoint)
+        self.timer.start(interval)
+
+    def layer_id(self, layer):
+        """
+        Return the id for layer, marking it all dirty if it's new.
+        """
+        seen = self.ids.get(layer)
+        if seen is None or seen[1] is not layer.image:
+            size = layer.image.size()
+            self.ids[layer] = self.next_id, layer.image
+            self.dirty[self.next_id] = set(
+                self.tiles(QRect(0, 0, size.width(), size.height()))
+            )
+            self.next_id += 1
+        return self.ids[layer][0]
+
+    def tiles(self, rect):
+        ts = self.tile_size
+        size = self.canvas.layers.size()
+        rect = rect.intersected(QRect(0, 0, size.width(), size.height()))
+        if rect.isEmpty():
+            return
+        for ty in range(rect.top() // ts, rect.bottom() // ts + 1):
+            for tx in range(rect.left() // ts, rect.right() // ts + 1):
+                yield tx, ty
+
+    def mark(self, rect):
+        layer_id = self.layer_id(self.canvas.layers.layer)
+        self.dirty.setdefault(layer_id, set()).update(self.tiles(rect))
+
+    def restacked(self):
+        layers = self.canvas.layers
+        entries = [
+            dict(
+                id=self.layer_id(layer),
+                name=layer.name,
+                opacity=layer.opacity,
+                mode=layer.mode,
+                visible=layer.visible,
+            )
+            for layer in layers.layers
+        ]
+        size = layers.size()
+        manifest = dict(
+            size=[size.width(), size.height()], layers=entries, active=layers.active
+        )
+        if manifest != self.manifest:
+            self.manifest = manifest
+            self.manifest_changed = True
+
+        # Forget removed layers.
+        current = {entry["id"] for entry in entries}
+        self.ids = {
+            layer: seen for layer, seen in self.ids.items() if layer in layers.layers
+        }
+        self.dirty = {i: tiles for i, tiles in self.dirty.items() if i in current}
+
+    def checkpoint(self):
+        """
+        Hand the tiles changed since the last checkpoint to the writer.
+        """
+        if not self.writer.idle.is_set():
+            return
+        if not self.manifest_changed and not any(self.dirty.values()):
+            return
+
+        images = {i: image for i, image in self.ids.values()}
+        tiles = []
+        for layer_id, dirty in self.dirty.items():
+            arr = image_array(images[layer_id])
+            for tx, ty in sorted(dirty):
+                rect = self.tile_rect(tx, ty)
+                pixels = arr[
+                    rect.top() : rect.bottom() + 1, rect.left() : rect.right() + 1
+                ]
+                tiles.append((layer_id, rect, pixels.copy()))
+
+        self.writer.submit(self.manifest if self.manifest_changed else None, tiles)
+        self.manifest_changed = False
+        self.dirty = {}
+
+    def checkpoint_failed(self, error, batch):
+        """
+        Mark the tiles of a checkpoint which couldn't be written dirty again,
+        so the next checkpoint tries them again.
+        """
+        manifest, tiles = batch
+        current = {i for i, _ in self.ids.values()}
+        ts = self.tile_size
+        for layer_id, rect, _ in tiles:
+            if layer_id in current:
+                self.dirty.setdefault(layer_id, set()).add(
+                    (rect.x() // ts, rect.y() // ts)
+                )
+        if manifest is not None:
+            self.manifest_changed = True
+        self.failed.emit(error)
+
+    def tile_rect(self, tx, ty):
+        ts = self.tile_size
+        size = self.canvas.layers.size()
+        return QRect(tx * ts, ty * ts, ts, ts).intersected(
+            QRect(0, 0, size.width(), size.height())
+        )
+
+    def close(self, remove=True):
+        """
+        Stop autosaving. By default the journal is removed, as the work in
+        it is no longer at risk, and anything still waiting to be written
+        to it is thrown away rather than holding up the exit.
+        """
+        self.timer.stop()
+        self.writer.stop(discard=remove)
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+        if self.lock is not None:
+            self.lock.unlock()
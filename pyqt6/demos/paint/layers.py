@@ -0,0 +1,272 @@
+"""
+Layers, and the cached composition of them for display.
+
+A LayerStack holds the layers bottom to top, with one of them active. The
+canvas tools paint into the active layer's image exactly as they would
+into a single image. To show the result the stack keeps three caches:
+
+- below: the visible layers under the active one, composited.
+- above: the visible layers over the active one, flattened. Normal
+  blending is associative, so this works as long as they all use it;
+  otherwise they are blended one at a time instead.
+- composite: below, then the active layer, then above.
+
+An edit to the active layer only dirties that region of the composite,
+and recompositing it takes three drawImage calls however many layers
+there are (if the layers above all blend normally), so extra layers don't
+make strokes any slower. Changing another layer, or which layer is
+active, rebuilds the below and above caches as well.
+
+With only the active layer visible, at full opacity and normal blending,
+the composite is simply that layer's image and nothing is cached at all.
+"""
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QPainter, QRegion
+from store import new_image
+
+BLEND_MODES = {
+    "normal": QPainter.CompositionMode.CompositionMode_SourceOver,
+    "multiply": QPainter.CompositionMode.CompositionMode_Multiply,
+    "screen": QPainter.CompositionMode.CompositionMode_Screen,
+    "overlay": QPainter.CompositionMode.CompositionMode_Overlay,
+    "darken": QPainter.CompositionMode.CompositionMode_Darken,
+    "lighten": QPainter.CompositionMode.CompositionMode_Lighten,
+    "color dodge": QPainter.CompositionMode.CompositionMode_ColorDodge,
+    "color burn": QPainter.CompositionMode.CompositionMode_ColorBurn,
+    "hard light": QPainter.CompositionMode.CompositionMode_HardLight,
+    "soft light": QPainter.CompositionMode.CompositionMode_SoftLight,
+    "difference": QPainter.CompositionMode.CompositionMode_Difference,
+    "exclusion": QPainter.CompositionMode.CompositionMode_Exclusion,
+}
+
+
+def blank_layer_image(size):
+    image = new_image(size.width(), size.height())
+    image.fill(Qt.GlobalColor.transparent)
+    return image
+
+
+class Layer:
+    """
+    A single layer: an image, and how it is blended onto those below.
+
+    :param shapes: for a vector layer, the vector.ShapeDocument its image
+    is drawn from.
+    """
+
+    __slots__ = ("name", "image", "opacity", "mode", "visible", "shapes")
+
+    def __init__(
+        self, name, image, opacity=1.0, mode="normal", visible=True, shapes=None
+    ):
+        self.name = name
+        self.image = image
+        self.opacity = opacity
+        self.mode = mode
+        self.visible = visible
+        self.shapes = shapes
+
+    @property
+    def shown(self):
+        return self.visible and self.opacity > 0
+
+    @property
+    def plain(self):
+        """
+        True if the layer is drawn exactly as it is.
+        """
+        return self.visible and self.opacity >= 1 and self.mode == "normal"
+
+    def draw(self, p, rect):
+        """
+        Blend the rect of this layer onto p, at the same position.
+        """
+        if self.shown:
+            p.setCompositionMode(BLEND_MODES[self.mode])
+            p.setOpacity(self.opacity)
+            p.drawImage(rect.topLeft(), self.image, rect)
+
+
+class LayerStack:
+    """
+    The layers of an image, bottom to top, with cached composition.
+
+    Call invalidate() after painting into the active layer, and update()
+    before reading image(), which is the composited result.
+    """
+
+    def __init__(self, image):
+        self.layers = [Layer("Background", image)]
+        self.active = 0
+        self.below_image = self.above_image = self.composite = None
+        self.restack()
+
+    def __len__(self):
+        return len(self.layers)
+
+    @property
+    def layer(self):
+        return self.layers[self.active]
+
+    def size(self):
+        return self.layers[0].image.size()
+
+    def reset(self, image):
+        """
+        Keep only the active layer, as a plain raster layer with image as its
+        pixels.
+
+        :return: the layers which were dropped.
+        """
+        layer = self.layer
+        dropped = [other for other in self.layers if other is not layer]
+        layer.image = image
+        layer.opacity, layer.mode, layer.visible = 1.0, "normal", True
+        layer.shapes = None
+        self.layers = [layer]
+        self.active = 0
+        self.restack()
+        return dropped
+
+    def replace(self, layers, active):
+        """
+        Replace every layer, e.g. with ones recovered from an autosave.
+        """
+        self.layers = list(layers)
+        self.active = active
+        self.restack()
+
+    def add(self, layer, index):
+        self.layers.insert(index, layer)
+        if index <= self.active:
+            self.active += 1
+        self.restack()
+
+    def remove(self, index):
+        if len(self.layers) == 1:
+            raise ValueError("Can't remove the last layer")
+        layer = self.layers.pop(index)
+        if index < self.active or self.active == len(self.layers):
+            self.active -= 1
+        self.restack()
+        return layer
+
+    def move(self, index, to):
+        active = self.layer
+        self.layers.insert(to, self.layers.pop(index))
+        self.active = self.layers.index(active)
+        self.restack()
+
+    def set_active(self, index):
+        self.active = index
+        self.restack()
+
+    def set(self, index, **properties):
+        """
+        Change layer properties: name, opacity, mode or visible.
+        """
+        layer = self.layers[index]
+        for key, value in properties.items():
+            setattr(layer, key, value)
+        if properties.keys() - {"name"}:
+            self.restack()
+
+    # Composition.
+
+    @property
+    def trivial(self):
+        return self.layer.plain and not any(
+            layer.shown for layer in self.layers if layer is not self.layer
+        )
+
+    def restack(self):
+        """
+        Rebuild the caches for the current layers, which are dropped if
+        they aren't needed and otherwise marked entirely dirty.
+        """
+        self.below = [layer for layer in self.layers[: self.active] if layer.shown]
+        self.above = [layer for layer in self.layers[self.active + 1 :] if layer.shown]
+        self.flatten_above = bool(self.above) and all(
+            layer.mode == "normal" for layer in self.above
+        )
+
+        if self.trivial:
+            self.below_image = self.above_image = self.composite = None
+            self.dirty = QRegion()
+            return
+
+        size = self.size()
+        self.below_image = self._cache(self.below_image, size, self.below)
+        self.above_image = self._cache(self.above_image, size, self.flatten_above)
+        self.composite = self._cache(self.composite, size, True)
+        self.stale = True
+        self.dirty = QRegion(0, 0, size.width(), size.height())
+
+    def _cache(self, image, size, needed):
+        if not needed:
+            return None
+        if image is None or image.size() != size:
+            return new_image(size.width(), size.height())
+        return image
+
+    def invalidate(self, rect):
+        """
+        Mark rect of the composite dirty, after painting into the active layer.
+        """
+        if self.composite is not None:
+            self.dirty = self.dirty.united(rect)
+
+    def dirty_rect(self):
+        """
+        Return the rect of the composite which update() will rewrite.
+        """
+        return self.dirty.boundingRect()
+
+    def image(self):
+        """
+        Return the composited image, as of the last update().
+        """
+        return self.composite if self.composite is not None else self.layer.image
+
+    def update(self):
+        """
+        Recomposite the dirty region.
+        """
+        if self.dirty.isEmpty():
+            return
+        if self.stale:
+            self._redraw(self.below_image, self.below)
+            self._redraw(self.above_image, self.above)
+            self.stale = False
+
+        # Clipping to the region means only the dirty pixels are drawn, even
+        # when it is made up of many small rects.
+        rect = self.dirty.boundingRect()
+        p = QPainter(self.composite)
+        p.setClipRegion(self.dirty)
+        p.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        if self.below_image:
+            p.drawImage(rect.topLeft(), self.below_image, rect)
+        else:
+            p.fillRect(rect, Qt.GlobalColor.transparent)
+        self.layer.draw(p, rect)
+        if self.above_image:
+            p.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+            p.setOpacity(1.0)
+            p.drawImage(rect.topLeft(), self.above_image, rect)
+        else:
+            for layer in self.above:
+                layer.draw(p, rect)
+        p.end()
+        self.dirty = QRegion()
+
+    def _redraw(self, image, layers):
+        if image is None:
+            return
+        p = QPainter(image)
+        p.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        p.fillRect(image.rect(), Qt.GlobalColor.transparent)
+        for layer in layers:
+            layer.draw(p, image.rect())
+        p.end()
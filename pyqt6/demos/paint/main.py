@@ -1,33 +1,61 @@
+import argparse
+import os
 import random
 import sys
 import types
 
 import constants
-import resources_rc
+import export
+import journal
+import vector
 from canvas import Canvas
+from filters import FILTERS
+from layers import BLEND_MODES
 from MainWindow import Ui_MainWindow
-from PyQt6.QtCore import QPoint, QRect, Qt, QTimer
-from PyQt6.QtGui import (
-    QFont,
-    QIcon,
-    QImage,
-    QPixmap,
-    QTransform,
-)
+from profiler import Profiler, ProfilerHud
+from PyQt6.QtCore import QResource, QStandardPaths, Qt, QTimer
+from PyQt6.QtGui import QAction, QFont, QIcon, QImage, QKeySequence, QPixmap
 from PyQt6.QtWidgets import (
     QApplication,
     QButtonGroup,
     QColorDialog,
     QComboBox,
+    QDialog,
+    QDialogButtonBox,
+    QDockWidget,
+    QDoubleSpinBox,
     QFileDialog,
     QFontComboBox,
+    QFormLayout,
+    QHBoxLayout,
+    QInputDialog,
     QLabel,
+    QListWidget,
+    QListWidgetItem,
     QMainWindow,
+    QMenu,
+    QMessageBox,
+    QProgressBar,
+    QPushButton,
     QSlider,
+    QSpinBox,
+    QVBoxLayout,
+    QWidget,
+)
+from recorder import Recorder
+
+# Register the compiled resources. Qt maps the .rcc file and only reads an
+# icon or stamp when it is first used, where importing resources_rc means
+# parsing a 1.2 MB module of byte literals. Rebuild it after changing
+# resources.qrc with: pyside6-rcc --binary resources.qrc -o resources.rcc
+# (resources_rc.py is generated for PySide6, so it can't be used here.)
+RESOURCES_RCC = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "resources.rcc"
 )
 
-# Not actually required, the import triggers this already.
-resources_rc.qInitResources()
+if not QResource.registerResource(RESOURCES_RCC):
+    # Stamps are still read from the stamps folder, see atlas.load_image().
+    print("Couldn't load %s, icons won't be shown" % RESOURCES_RCC, file=sys.stderr)
 
 
 class MainWindow(QMainWindow, Ui_MainWindow):
@@ -54,6 +82,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             btn.pressed.connect(lambda mode=mode: self.canvas.set_mode(mode))
             mode_group.addButton(btn)
 
+        # Selecting and moving shapes on vector layers, added below the others.
+        self.shapesButton = QPushButton("\u2196")
+        self.shapesButton.setToolTip("Select and move shapes (vector layers)")
+        self.shapesButton.setFixedSize(30, 30)
+        self.shapesButton.setCheckable(True)
+        self.shapesButton.pressed.connect(lambda: self.canvas.set_mode("shapes"))
+        mode_group.addButton(self.shapesButton)
+        self.gridLayout.addWidget(self.shapesButton, 8, 0, 1, 1)
+
         # Setup the color selection buttons.
         self.primaryButton.pressed.connect(
             lambda: self.choose_color(self.set_primary_color)
@@ -80,6 +117,16 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         # Setup up action signals
         self.actionCopy.triggered.connect(self.copy_to_clipboard)
 
+        # Undo/redo, added ahead of Copy in the Edit menu.
+        self.actionUndo = QAction("Undo", self)
+        self.actionUndo.setShortcut(QKeySequence.StandardKey.Undo)
+        self.actionUndo.triggered.connect(self.canvas.undo)
+        self.actionRedo = QAction("Redo", self)
+        self.actionRedo.setShortcut(QKeySequence.StandardKey.Redo)
+        self.actionRedo.triggered.connect(self.canvas.redo)
+        self.menuEdit.insertActions(self.actionCopy, [self.actionUndo, self.actionRedo])
+        self.menuEdit.insertSeparator(self.actionCopy)
+
         # Initialize animation timer.
         self.timer = QTimer()
         self.timer.timeout.connect(self.canvas.on_timer)
@@ -98,6 +145,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.current_stamp_n = -1
         self.next_stamp()
         self.stampnextButton.pressed.connect(self.next_stamp)
+        self.canvas.stamps.stamps_changed.connect(self.stamps_changed)
 
         # Menu options
         self.actionNewImage.triggered.connect(self.canvas.initialize)
@@ -108,6 +156,77 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.actionFlipHorizontal.triggered.connect(self.flip_horizontal)
         self.actionFlipVertical.triggered.connect(self.flip_vertical)
 
+        self.actionCancelSave = QAction("Cancel Save", self)
+        self.actionCancelSave.setEnabled(False)
+        self.actionCancelSave.triggered.connect(self.cancel_save)
+        self.menuFIle.addAction(self.actionCancelSave)
+
+        self.actionExportSvg = QAction("Export Shapes as SVG...", self)
+        self.actionExportSvg.triggered.connect(self.export_svg)
+        self.menuFIle.addAction(self.actionExportSvg)
+
+        self.actionLoadStamps = QAction("Load Stamps...", self)
+        self.actionLoadStamps.triggered.connect(self.load_stamps)
+        self.menuFIle.addAction(self.actionLoadStamps)
+
+        # Filters, added to the end of the Image menu.
+        self.menuImage.addSeparator()
+        self.filterActions = [self.actionInvertColors]
+        for name, filter in FILTERS.items():
+            if name == "invert":
+                continue  # Already in the menu.
+            action = QAction(filter.label + ("..." if filter.params else ""), self)
+            action.triggered.connect(lambda checked, name=name: self.run_filter(name))
+            self.menuImage.addAction(action)
+            self.filterActions.append(action)
+        self.actionCancelFilter = QAction("Cancel Filter", self)
+        self.actionCancelFilter.setShortcut(QKeySequence(Qt.Key.Key_Escape))
+        self.actionCancelFilter.setEnabled(False)
+        self.actionCancelFilter.triggered.connect(self.cancel_filter)
+        self.menuImage.addAction(self.actionCancelFilter)
+
+        self.filterProgress = QProgressBar()
+        self.filterProgress.setMaximumWidth(200)
+        self.filterProgress.hide()
+        self.statusBar.addPermanentWidget(self.filterProgress)
+
+        # View menu, for zooming.
+        self.menuView = QMenu("View", self)
+        self.menuBar.insertMenu(self.menuHelp.menuAction(), self.menuView)
+        for label, shortcut, slot in [
+            ("Zoom In", QKeySequence.StandardKey.ZoomIn, self.canvas.zoom_in),
+            ("Zoom Out", QKeySequence.StandardKey.ZoomOut, self.canvas.zoom_out),
+            ("Actual Size", QKeySequence("Ctrl+0"), self.canvas.zoom_reset),
+            ("Fit in Window", QKeySequence("Ctrl+9"), self.canvas.zoom_fit),
+        ]:
+            action = QAction(label, self)
+            action.setShortcut(shortcut)
+            action.triggered.connect(slot)
+            self.menuView.addAction(action)
+        self.menuView.addSeparator()
+        self.actionPixelGrid = QAction("Pixel Grid", self)
+        self.actionPixelGrid.setCheckable(True)
+        self.actionPixelGrid.setChecked(self.canvas.show_grid)
+        self.actionPixelGrid.toggled.connect(self.canvas.set_grid)
+        self.menuView.addAction(self.actionPixelGrid)
+
+        self.zoomLabel = QLabel()
+        self.statusBar.addPermanentWidget(self.zoomLabel)
+        self.canvas.zoom_changed.connect(self.zoom_changed)
+        self.zoom_changed(self.canvas.zoom)
+
+        self.exportProgress = QProgressBar()
+        self.exportProgress.setMaximumWidth(200)
+        self.exportProgress.hide()
+        self.statusBar.addPermanentWidget(self.exportProgress)
+
+        # Layers, in a panel on the right.
+        self.layersPanel = LayersPanel(self.canvas)
+        self.layersDock = QDockWidget("Layers", self)
+        self.layersDock.setWidget(self.layersPanel)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.layersDock)
+        self.canvas.layers_updated.connect(self.layers_changed)
+
         # Setup the drawing toolbar.
         self.fontselect = QFontComboBox()
         self.fontToolbar.addWidget(self.fontselect)
@@ -154,6 +273,68 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.drawingToolbar.addAction(self.actionFillShapes)
         self.actionFillShapes.setChecked(True)
 
+        # Stamp size and rotation.
+        self.stampscale = QComboBox()
+        for scale in constants.STAMP_SCALES:
+            self.stampscale.addItem("%d%%" % (scale * 100), scale)
+        self.stampscale.setCurrentIndex(constants.STAMP_SCALES.index(1.0))
+        self.stampscale.currentIndexChanged.connect(
+            lambda n: self.canvas.set_config("stamp_scale", self.stampscale.itemData(n))
+        )
+        self.drawingToolbar.addWidget(self.stampscale)
+        self.stampangle = QSpinBox()
+        self.stampangle.setRange(0, 345)
+        self.stampangle.setSingleStep(15)
+        self.stampangle.setWrapping(True)
+        self.stampangle.setSuffix("\u00b0")
+        self.stampangle.valueChanged.connect(
+            lambda a: self.canvas.set_config("stamp_angle", a)
+        )
+        self.drawingToolbar.addWidget(self.stampangle)
+
+        # Fill tolerance (per channel) and connectivity.
+        self.drawingToolbar.addSeparator()
+        self.filltolerance = QSpinBox()
+        self.filltolerance.setRange(0, 255)
+        self.filltolerance.setPrefix("\u00b1")
+        self.filltolerance.setToolTip("Fill tolerance, per channel")
+        self.filltolerance.valueChanged.connect(
+            lambda t: self.canvas.set_config("fill_tolerance", t)
+        )
+        self.drawingToolbar.addWidget(self.filltolerance)
+        self.fillconnectivity = QComboBox()
+        self.fillconnectivity.addItem("4-way", 4)
+        self.fillconnectivity.addItem("8-way", 8)
+        self.fillconnectivity.setToolTip("Fill through edges only, or corners too")
+        self.fillconnectivity.currentIndexChanged.connect(
+            lambda n: self.canvas.set_config(
+                "fill_connectivity", self.fillconnectivity.itemData(n)
+            )
+        )
+        self.drawingToolbar.addWidget(self.fillconnectivity)
+
+        # Spray density, and falloff from even (0) to gaussian (1).
+        self.drawingToolbar.addSeparator()
+        self.spraydensity = QSpinBox()
+        self.spraydensity.setRange(10, 400)
+        self.spraydensity.setSingleStep(10)
+        self.spraydensity.setValue(100)
+        self.spraydensity.setSuffix("%")
+        self.spraydensity.setToolTip("Spray density")
+        self.spraydensity.valueChanged.connect(
+            lambda d: self.canvas.set_config("spray_density", d / 100)
+        )
+        self.drawingToolbar.addWidget(self.spraydensity)
+        self.sprayfalloff = QDoubleSpinBox()
+        self.sprayfalloff.setRange(0.0, 1.0)
+        self.sprayfalloff.setSingleStep(0.1)
+        self.sprayfalloff.setValue(1.0)
+        self.sprayfalloff.setToolTip("Spray falloff, from even (0) to gaussian (1)")
+        self.sprayfalloff.valueChanged.connect(
+            lambda f: self.canvas.set_config("spray_falloff", f)
+        )
+        self.drawingToolbar.addWidget(self.sprayfalloff)
+
         self.show()
 
     def choose_color(self, callback):
@@ -172,30 +353,30 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         )
 
     def next_stamp(self):
-        self.current_stamp_n += 1
-        if self.current_stamp_n >= len(constants.STAMPS):
-            self.current_stamp_n = 0
+        stamps = self.canvas.stamps
+        self.current_stamp_n = (self.current_stamp_n + 1) % len(stamps)
+        path = stamps.paths[self.current_stamp_n]
+        self.stampnextButton.setIcon(QIcon(QPixmap.fromImage(stamps.image(path))))
+        self.canvas.set_stamp(path)
 
-        pixmap = QPixmap(constants.STAMPS[self.current_stamp_n])
-        self.stampnextButton.setIcon(QIcon(pixmap))
+    def load_stamps(self):
+        folder = QFileDialog.getExistingDirectory(self, "Load Stamps")
+        if folder:
+            self.canvas.stamps.load_folder(folder)
 
-        self.canvas.current_stamp = pixmap
+    def stamps_changed(self, count):
+        self.statusBar.showMessage("%d stamps" % count, 3000)
 
     def copy_to_clipboard(self):
         clipboard = QApplication.clipboard()
 
-        if self.canvas.mode == "selectrect" and self.canvas.locked:
-            clipboard.setPixmap(self.canvas.selectrect_copy())
-
-        elif self.canvas.mode == "selectpoly" and self.canvas.locked:
-            clipboard.setPixmap(self.canvas.selectpoly_copy())
-
-        else:
-            clipboard.setPixmap(self.canvas.pixmap())
+        # The selection, if there is one, otherwise the whole image.
+        pixmap = self.canvas.tool.copy()
+        clipboard.setPixmap(pixmap if pixmap is not None else self.canvas.pixmap())
 
     def open_file(self):
         """
-        Open image file for editing, scaling the smaller dimension and cropping the remainder.
+        Open image file for editing, at its own size.
         :return:
         """
         path, _ = QFileDialog.getOpenFileName(
@@ -206,69 +387,380 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         )
 
         if path:
-            pixmap = QPixmap()
-            pixmap.load(path)
-
-            # We need to crop down to the size of our canvas. Get the size of the loaded image.
-            iw = pixmap.width()
-            ih = pixmap.height()
-
-            # Get the size of the space we're filling.
-            cw, ch = constants.CANVAS_DIMENSIONS
-
-            if iw / cw < ih / ch:  # The height is relatively bigger than the width.
-                pixmap = pixmap.scaledToWidth(cw)
-                hoff = (pixmap.height() - ch) // 2
-                pixmap = pixmap.copy(
-                    QRect(
-                        QPoint(0, hoff),
-                        QPoint(cw, pixmap.height() - hoff),
-                    )
-                )
-
-            elif iw / cw > ih / ch:  # The height is relatively bigger than the width.
-                pixmap = pixmap.scaledToHeight(ch)
-                woff = (pixmap.width() - cw) // 2
-                pixmap = pixmap.copy(
-                    QRect(
-                        QPoint(woff, 0),
-                        QPoint(pixmap.width() - woff, ch),
-                    )
-                )
-
-            self.canvas.setPixmap(pixmap)
+            image = QImage(path)
+            if not image.isNull():
+                self.canvas.load_image(image)
 
     def save_file(self):
         """
-        Save active canvas to image file.
+        Save active canvas to image file, in the background.
         :return:
         """
+        extensions = export.formats()
+        filters = [
+            "%s image files (*.%s)" % (name.upper(), ext)
+            for name, ext in extensions.items()
+        ]
+        path, selected = QFileDialog.getSaveFileName(
+            self, "Save file", "", ";;".join(filters)
+        )
+        if not path:
+            return
+
+        # Go by the extension if it's one we know, else the chosen filter.
+        format = (
+            list(extensions)[filters.index(selected)] if selected in filters else "png"
+        )
+        for name, ext in extensions.items():
+            if path.lower().endswith("." + ext):
+                format = name
+        if "." not in os.path.basename(path):
+            path += "." + extensions[format]
+
+        if format == "png":
+            value, ok = QInputDialog.getInt(
+                self, "Save PNG", "Compression level", constants.EXPORT_PNG_LEVEL, 0, 9
+            )
+            options = {"level": value}
+        else:
+            value, ok = QInputDialog.getInt(
+                self,
+                "Save %s" % format.upper(),
+                "Quality",
+                constants.EXPORT_QUALITY,
+                0,
+                100,
+            )
+            options = {"quality": value}
+        if not ok:
+            return
+
+        job = self.canvas.export_image(path, format, **options)
+        job.progress.connect(self.export_progress)
+        job.finished.connect(self.export_finished)
+        job.failed.connect(self.export_failed)
+        job.cancelled.connect(self.export_cancelled)
+        self.actionCancelSave.setEnabled(True)
+        self.statusBar.showMessage("Saving %s..." % os.path.basename(path))
+
+    def export_svg(self):
+        layers = [layer for layer in self.canvas.layers.layers if layer.shapes]
+        if not layers:
+            self.statusBar.showMessage("There are no shapes to export", 5000)
+            return
         path, _ = QFileDialog.getSaveFileName(
-            self, "Save file", "", "PNG Image file (*.png)"
+            self, "Export shapes", "", "SVG files (*.svg)"
         )
+        if not path:
+            return
+        if "." not in os.path.basename(path):
+            path += ".svg"
+        try:
+            with open(path, "w") as f:
+                f.write(vector.svg(layers, self.canvas.layers.size()))
+        except OSError as e:
+            self.statusBar.showMessage("Couldn't export shapes: %s" % e, 5000)
+        else:
+            self.statusBar.showMessage("Exported %s" % os.path.basename(path), 5000)
 
-        if path:
-            pixmap = self.canvas.pixmap()
-            pixmap.save(path, "PNG")
+    def export_progress(self, done, total):
+        self.exportProgress.setRange(0, total)
+        self.exportProgress.setValue(done)
+        self.exportProgress.show()
+
+    def export_ended(self, message):
+        if not self.canvas.export_jobs:
+            self.actionCancelSave.setEnabled(False)
+            self.exportProgress.hide()
+        self.statusBar.showMessage(message, 5000)
+
+    def export_finished(self, path):
+        self.export_ended("Saved %s" % os.path.basename(path))
+
+    def export_failed(self, error):
+        self.export_ended("Save failed: %s" % error)
+
+    def export_cancelled(self):
+        self.export_ended("Save cancelled")
+
+    def cancel_save(self):
+        for job in self.canvas.export_jobs:
+            job.cancel()
+
+    def zoom_changed(self, zoom):
+        self.zoomLabel.setText("%g%%" % round(zoom * 100, 1))
+
+    def layers_changed(self):
+        # Filters work on pixels, so they don't apply to vector layers.
+        raster = self.canvas.layers.layer.shapes is None
+        for action in self.filterActions:
+            action.setEnabled(raster)
 
     def invert(self):
-        img = QImage(self.canvas.pixmap())
-        img.invertPixels()
-        pixmap = QPixmap()
-        pixmap.convertFromImage(img)
-        self.canvas.setPixmap(pixmap)
+        self.run_filter("invert")
 
     def flip_horizontal(self):
-        pixmap = self.canvas.pixmap()
-        self.canvas.setPixmap(pixmap.transformed(QTransform().scale(-1, 1)))
+        self.canvas.flip(horizontal=True)
 
     def flip_vertical(self):
-        pixmap = self.canvas.pixmap()
-        self.canvas.setPixmap(pixmap.transformed(QTransform().scale(1, -1)))
+        self.canvas.flip(horizontal=False)
+
+    def run_filter(self, name):
+        """
+        Ask for the filter's settings, if it has any, and start it running.
+        """
+        params = {}
+        if FILTERS[name].params:
+            dialog = FilterDialog(FILTERS[name], self)
+            if not dialog.exec():
+                return
+            params = dialog.values()
+
+        job = self.canvas.apply_filter(name, **params)
+        job.progress.connect(self.filter_progress)
+        job.finished.connect(self.filter_finished)
+        job.failed.connect(self.filter_failed)
+        self.actionCancelFilter.setEnabled(True)
+        self.statusBar.showMessage("%s..." % FILTERS[name].label)
+
+    def filter_progress(self, done, total):
+        self.filterProgress.setRange(0, total)
+        self.filterProgress.setValue(done)
+        self.filterProgress.show()
+
+    def filter_finished(self):
+        self.actionCancelFilter.setEnabled(False)
+        self.filterProgress.hide()
+        self.statusBar.clearMessage()
+
+    def filter_failed(self, error):
+        self.filter_finished()
+        self.statusBar.showMessage("Filter failed: %s" % error, 5000)
+
+    def cancel_filter(self):
+        self.canvas.cancel_filter()
+        self.filter_finished()
+
+    def autosave_failed(self, error):
+        self.statusBar.showMessage("Autosave failed: %s" % error, 5000)
+
+
+class FilterDialog(QDialog):
+    """
+    Settings for a filter, with a spin box for each of its parameters.
+    """
+
+    def __init__(self, filter, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(filter.label)
+
+        layout = QFormLayout(self)
+        self.inputs = {}
+        for name, label, default, minimum, maximum in filter.params:
+            spin = QDoubleSpinBox() if isinstance(default, float) else QSpinBox()
+            spin.setRange(minimum, maximum)
+            spin.setValue(default)
+            layout.addRow(label, spin)
+            self.inputs[name] = spin
+
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        )
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    def values(self):
+        return {name: spin.value() for name, spin in self.inputs.items()}
+
+
+def autosave_directory():
+    directory = QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.AppLocalDataLocation
+    )
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        # journal.claim() will fail to lock in it, and autosave is turned off.
+        pass
+    return directory
+
+
+class LayersPanel(QWidget):
+    """
+    The canvas layers, top first, with settings for the active one.
+    """
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        layout = QVBoxLayout(self)
+
+        # Check a layer to show it, double click to rename it.
+        self.list = QListWidget()
+        self.list.currentRowChanged.connect(self.select)
+        self.list.itemChanged.connect(self.item_changed)
+        layout.addWidget(self.list)
+
+        form = QFormLayout()
+        self.mode = QComboBox()
+        self.mode.addItems([mode.title() for mode in BLEND_MODES])
+        self.mode.currentIndexChanged.connect(self.mode_changed)
+        form.addRow("Mode", self.mode)
+        self.opacity = QSpinBox()
+        self.opacity.setRange(0, 100)
+        self.opacity.setSuffix("%")
+        self.opacity.setKeyboardTracking(False)
+        self.opacity.valueChanged.connect(self.opacity_changed)
+        form.addRow("Opacity", self.opacity)
+        layout.addLayout(form)
+
+        buttons = QHBoxLayout()
+        for label, tip, slot in [
+            ("+", "Add layer", canvas.add_layer),
+            ("+V", "Add vector layer", lambda: canvas.add_layer(vector=True)),
+            ("-", "Remove layer", canvas.remove_layer),
+            ("Up", "Move layer up", lambda: self.move(1)),
+            ("Down", "Move layer down", lambda: self.move(-1)),
+        ]:
+            button = QPushButton(label)
+            button.setToolTip(tip)
+            button.clicked.connect(lambda checked, slot=slot: slot())
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+
+        canvas.layers_updated.connect(self.refresh)
+        self.refresh()
+
+    def index(self, row):
+        # The list is top first, the stack bottom first. Either way round.
+        return len(self.canvas.layers) - 1 - row
+
+    def refresh(self):
+        layers = self.canvas.layers
+        for widget in (self.list, self.mode, self.opacity):
+            widget.blockSignals(True)
+
+        # Update the items in place where possible, as this can be called
+        # from their own itemChanged signal.
+        while self.list.count() > len(layers):
+            self.list.takeItem(0)
+        while self.list.count() < len(layers):
+            item = QListWidgetItem()
+            item.setFlags(
+                item.flags()
+                | Qt.ItemFlag.ItemIsUserCheckable
+                | Qt.ItemFlag.ItemIsEditable
+            )
+            self.list.addItem(item)
+        for row in range(len(layers)):
+            layer = layers.layers[self.index(row)]
+            item = self.list.item(row)
+            item.setText(layer.name)
+            item.setCheckState(
+                Qt.CheckState.Checked if layer.visible else Qt.CheckState.Unchecked
+            )
+        self.list.setCurrentRow(self.index(layers.active))
+
+        self.mode.setCurrentIndex(list(BLEND_MODES).index(layers.layer.mode))
+        self.opacity.setValue(round(layers.layer.opacity * 100))
+        for widget in (self.list, self.mode, self.opacity):
+            widget.blockSignals(False)
+
+    def select(self, row):
+        if row >= 0:
+            self.canvas.select_layer(self.index(row))
+
+    def item_changed(self, item):
+        self.canvas.set_layer(
+            self.index(self.list.row(item)),
+            name=item.text(),
+            visible=item.checkState() == Qt.CheckState.Checked,
+        )
+
+    def mode_changed(self, n):
+        self.canvas.set_layer(self.canvas.layers.active, mode=list(BLEND_MODES)[n])
+
+    def opacity_changed(self, value):
+        self.canvas.set_layer(self.canvas.layers.active, opacity=value / 100)
+
+    def move(self, step):
+        active = self.canvas.layers.active
+        self.canvas.move_layer(active, active + step)
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--record", metavar="PATH", help="record canvas input to PATH, for replay"
+    )
+    parser.add_argument(
+        "--no-autosave", action="store_true", help="don't autosave for recovery"
+    )
+    parser.add_argument(
+        "--autosave-rate",
+        type=int,
+        default=constants.AUTOSAVE_BYTES_PER_SECOND,
+        metavar="BYTES",
+        help="most bytes per second to write when autosaving",
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="show a profiler HUD over the canvas"
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="profile, and write a Chrome trace to PATH on exit",
+    )
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    app.setApplicationName("Piecasso")
     app.setWindowIcon(QIcon(":/icons/piecasso.ico"))
     window = MainWindow()
+
+    claimed = None
+    if not args.no_autosave:
+        directory = autosave_directory()
+        claimed = journal.claim(directory)
+        if claimed is None:
+            window.statusBar.showMessage(
+                "Autosave is off, couldn't write to %s" % directory
+            )
+
+    if claimed:
+        path, lock = claimed
+        # The journal is removed on a clean exit, so if it's there whoever
+        # used it crashed.
+        recovered = journal.recover(path) if os.path.exists(path) else None
+        if recovered and (
+            QMessageBox.question(
+                window,
+                "Piecasso",
+                "Piecasso didn't close properly last time. "
+                "Recover the unsaved image?",
+            )
+            == QMessageBox.StandardButton.Yes
+        ):
+            window.canvas.set_layers(*recovered)
+        autosave = journal.Journal(
+            window.canvas, path, rate=args.autosave_rate, lock=lock
+        )
+        autosave.failed.connect(window.autosave_failed)
+        app.aboutToQuit.connect(autosave.close)
+
+    if args.profile or args.trace:
+        profiler = Profiler()
+        profiler.attach(window.canvas, timers=[window.timer.timeout])
+        hud = ProfilerHud(
+            profiler, window.canvas, input_stats=window.canvas.input_stats
+        )
+        if args.trace:
+            app.aboutToQuit.connect(lambda: profiler.save_trace(args.trace))
+
+    if args.record:
+        recorder = Recorder(window.canvas)
+        window.canvas.installEventFilter(recorder)
+        app.aboutToQuit.connect(lambda: recorder.save(args.record))
+
     app.exec()
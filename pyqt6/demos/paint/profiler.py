@@ -0,0 +1,237 @@
+"""
+An opt-in profiler for the canvas, with a HUD and Chrome trace output.
+
+Profiler.attach() wraps the canvas handlers on the instance, so nothing
+is timed (or slowed down) unless profiling is switched on. Each call is
+recorded as a span in one of three categories:
+
+- event: the mouse handlers, where tools respond to input.
+- paint: drawing into the image, as queued strokes are flushed and the
+  animation timer ticks.
+- upload: getting the image onto the screen: paintEvent, which draws the
+  visible part of the image into the window.
+
+ProfilerHud shows the rolling numbers over the canvas: frames per second,
+p50/p99 event handling time, the time per second spent in each category
+and the bytes uploaded per second. save_trace() writes every span to a
+JSON file which Chrome's trace viewer (chrome://tracing, or Perfetto)
+opens as a timeline.
+"""
+
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+import constants
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QFontDatabase, QPalette
+from PyQt6.QtWidgets import QLabel
+
+CATEGORIES = ("event", "paint", "upload")
+
+
+def percentile(values, p):
+    """
+    Return the pth percentile (0-100) of values, nearest rank.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+def paint_bytes(canvas, e):
+    # The exposed area of the window, in device pixels at 32 bits each.
+    ratio = canvas.devicePixelRatioF()
+    rect = e.rect()
+    return int(rect.width() * rect.height() * ratio * ratio * 4)
+
+
+class Profiler:
+    """
+    Records timed spans, keeping the recent ones for the rolling numbers
+    and up to max_spans of them for the trace.
+    """
+
+    def __init__(
+        self,
+        samples=constants.PROFILE_SAMPLES,
+        max_spans=constants.PROFILE_TRACE_SPANS,
+    ):
+        self.started = time.perf_counter()
+        self.pid = threading.get_native_id()
+        self.spans = deque(maxlen=max_spans)
+        # (end time, name, category, duration, bytes) for the last second,
+        # and the durations of the most recent event handlers.
+        self.recent = deque()
+        self.event_times = deque(maxlen=samples)
+
+    def record(self, name, category, start, end, size=0):
+        self.spans.append((name, category, start, end - start, size))
+        self.recent.append((end, name, category, end - start, size))
+        if category == "event":
+            self.event_times.append(end - start)
+
+    def instrument(self, obj, name, category, size=None, signals=()):
+        """
+        Replace obj.name with a wrapper which records each call.
+
+        :param size: optional function of the call's arguments, returning
+        the bytes it uploaded.
+        :param signals: signals connected to the method, which are
+        reconnected to the wrapper.
+        """
+        fn = getattr(obj, name)
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                self.record(name, category, start, end, size(obj, *args) if size else 0)
+
+        setattr(obj, name, timed)
+        for signal in signals:
+            signal.disconnect(fn)
+            signal.connect(timed)
+
+    def attach(self, canvas, timers=()):
+        """
+        Instrument a Canvas.
+
+        :param timers: timeout signals connected to canvas.on_timer.
+        """
+        for name in (
+            "mousePressEvent",
+            "mouseMoveEvent",
+            "mouseReleaseEvent",
+            "mouseDoubleClickEvent",
+        ):
+            self.instrument(canvas, name, "event")
+        self.instrument(
+            canvas, "flush_stroke", "paint", signals=[canvas.stroke_timer.timeout]
+        )
+        self.instrument(canvas, "on_timer", "paint", signals=timers)
+        self.instrument(canvas, "paintEvent", "upload", size=paint_bytes)
+
+    def stats(self, window=1.0):
+        """
+        :return: dict of the rolling numbers: fps, p50 and p99 event times
+        in milliseconds, milliseconds per second spent in each category
+        and bytes uploaded per second.
+        """
+        now = time.perf_counter()
+        while self.recent and self.recent[0][0] < now - window:
+            self.recent.popleft()
+
+        busy = dict.fromkeys(CATEGORIES, 0.0)
+        frames = uploaded = 0
+        for _, name, category, duration, size in self.recent:
+            busy[category] += duration
+            uploaded += size
+            if name == "paintEvent":
+                frames += 1
+
+        events = list(self.event_times)
+        return {
+            "fps": frames / window,
+            "event_p50_ms": percentile(events, 50) * 1000,
+            "event_p99_ms": percentile(events, 99) * 1000,
+            "busy_ms": {c: t * 1000 / window for c, t in busy.items()},
+            "upload_bytes": uploaded / window,
+        }
+
+    def trace(self):
+        """
+        Return the spans in Chrome's trace event format.
+        """
+        events = [
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self.started) * 1e6,
+                "dur": duration * 1e6,
+                "pid": self.pid,
+                "tid": self.pid,
+                "args": {"bytes": size} if size else {},
+            }
+            for name, category, start, duration, size in self.spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.trace(), f)
+
+
+class ProfilerHud(QLabel):
+    """
+    Shows a Profiler's rolling numbers in the top left of a widget, and
+    optionally a canvas's stroke input stats (a stroke.InputStats).
+    """
+
+    def __init__(
+        self,
+        profiler,
+        parent,
+        interval=constants.PROFILE_HUD_INTERVAL,
+        input_stats=None,
+    ):
+        super().__init__(parent)
+        self.profiler = profiler
+        self.input_stats = input_stats
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        # Opaque, so refreshing the HUD doesn't repaint the canvas under it
+        # and count as a frame.
+        self.setAutoFillBackground(True)
+        palette = self.palette()
+        palette.setColor(QPalette.ColorRole.Window, Qt.GlobalColor.black)
+        palette.setColor(QPalette.ColorRole.WindowText, Qt.GlobalColor.white)
+        self.setPalette(palette)
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.setMargin(4)
+        self.move(4, 4)
+        self.show()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(interval)
+        self.refresh()
+
+    def refresh(self):
+        stats = self.profiler.stats()
+        busy = stats["busy_ms"]
+        text = (
+            "%5.1f fps\n"
+            "event p50 %6.2f ms  p99 %6.2f ms\n"
+            "event %4.0f  paint %4.0f  upload %4.0f ms/s\n"
+            "upload %6.1f MB/s"
+            % (
+                stats["fps"],
+                stats["event_p50_ms"],
+                stats["event_p99_ms"],
+                busy["event"],
+                busy["paint"],
+                busy["upload"],
+                stats["upload_bytes"] / (1024 * 1024),
+            )
+        )
+        if self.input_stats is not None:
+            # Over the last few strokes' flushes.
+            strokes = self.input_stats.summary()
+            text += (
+                "\nstroke %5.1f events/frame\n"
+                "latency %5.1f ms  flush %5.2f ms"
+                % (
+                    strokes["events_per_frame"],
+                    strokes["latency_ms"],
+                    strokes["flush_ms"],
+                )
+            )
+        self.setText(text)
+        self.adjustSize()
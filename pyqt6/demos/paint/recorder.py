@@ -0,0 +1,230 @@
+"""
+Record and replay canvas input sessions.
+
+A Recorder watches the canvas as an event filter and logs each mouse and
+key event with a timestamp, in image coordinates so the view (zoom and
+pan) doesn't matter on replay. Changes to the mode, colors, stamp and
+config are logged as they happen. Sessions are saved as JSON lines.
+
+replay() feeds a session back into a canvas synchronously, timing every
+handler call, so a session recorded once can be replayed headless to
+benchmark the tools (see bench_replay.py).
+"""
+
+import json
+import time
+from collections import defaultdict
+
+import constants
+from PyQt6.QtCore import QEvent, QObject, QPointF, Qt
+from PyQt6.QtGui import QColor, QFont, QKeyEvent, QMouseEvent
+
+MOUSE_EVENTS = {
+    QEvent.Type.MouseButtonPress: "press",
+    QEvent.Type.MouseMove: "move",
+    QEvent.Type.MouseButtonRelease: "release",
+    QEvent.Type.MouseButtonDblClick: "dblclick",
+}
+EVENT_TYPES = {kind: t for t, kind in MOUSE_EVENTS.items()}
+MOUSE_HANDLERS = {
+    "press": "mousePressEvent",
+    "move": "mouseMoveEvent",
+    "release": "mouseReleaseEvent",
+    "dblclick": "mouseDoubleClickEvent",
+}
+
+
+def config_state(config):
+    """
+    Return the canvas config as plain JSON values.
+    """
+    return {
+        key: value.family() if isinstance(value, QFont) else value
+        for key, value in config.items()
+    }
+
+
+def color_name(color):
+    return QColor(color).name() if color is not None else None
+
+
+def canvas_state(canvas):
+    return {
+        "mode": canvas.mode,
+        "primary": color_name(canvas.primary_color),
+        "secondary": color_name(canvas.secondary_color),
+        "stamp": canvas.current_stamp_path,
+        "config": config_state(canvas.config),
+    }
+
+
+class Recorder(QObject):
+    """
+    Records input to a canvas. Install with canvas.installEventFilter().
+    """
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.records = []
+        self.started = time.perf_counter()
+
+        self.state = canvas_state(canvas)
+        self.records.append(
+            dict(
+                type="start",
+                size=[canvas.image.width(), canvas.image.height()],
+                **self.state,
+            )
+        )
+
+    def log(self, **record):
+        record["t"] = round(time.perf_counter() - self.started, 6)
+        self.records.append(record)
+
+    def log_changes(self):
+        """
+        Log anything about the canvas state which changed since the last event.
+        """
+        state = canvas_state(self.canvas)
+        for key in ("mode", "primary", "secondary", "stamp"):
+            if state[key] != self.state[key]:
+                self.log(type=key, value=state[key])
+        for key, value in state["config"].items():
+            if value != self.state["config"].get(key):
+                self.log(type="config", key=key, value=value)
+        self.state = state
+
+    def eventFilter(self, obj, e):
+        kind = MOUSE_EVENTS.get(e.type())
+        if kind:
+            # Leave out panning, which doesn't reach the tools.
+            panning = self.canvas.pan_pos is not None
+            if e.button() != Qt.MouseButton.MiddleButton and not panning:
+                self.log_changes()
+                pos = self.canvas.map_to_image(e.position())
+                self.log(
+                    type=kind,
+                    x=round(pos.x(), 3),
+                    y=round(pos.y(), 3),
+                    button=e.button().value,
+                    buttons=e.buttons().value,
+                    modifiers=e.modifiers().value,
+                )
+
+        elif e.type() == QEvent.Type.KeyPress:
+            self.log_changes()
+            self.log(
+                type="key", key=e.key(), text=e.text(), modifiers=e.modifiers().value
+            )
+
+        return False
+
+    def save(self, path):
+        save(path, self.records)
+
+
+def save(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def apply_state(canvas, record):
+    kind = record["type"]
+    if kind == "mode":
+        canvas.set_mode(record["value"])
+    elif kind == "primary":
+        canvas.set_primary_color(record["value"])
+    elif kind == "secondary":
+        canvas.set_secondary_color(record["value"])
+    elif kind == "stamp":
+        canvas.set_stamp(record["value"])
+    elif kind == "config":
+        value = record["value"]
+        if record["key"] == "font":
+            value = QFont(value)
+        canvas.set_config(record["key"], value)
+
+
+def replay(canvas, records, frame_interval=constants.FRAME_INTERVAL, paint=False):
+    """
+    Feed recorded events to canvas as fast as possible.
+
+    Queued strokes are flushed whenever the recorded time passes a frame
+    boundary, as the stroke timer would have, so the result doesn't depend
+    on how fast the replay runs.
+
+    :param canvas: a Canvas, which is reset to the recorded starting state.
+    :param records: list of records, from Recorder or load().
+    :param frame_interval: frame length in milliseconds.
+    :param paint: also repaint the whole canvas each frame, timed as "paint".
+    The canvas must be visible.
+    :return: dict mapping (mode, event type) to a list of handler times
+    in seconds.
+    """
+    timings = defaultdict(list)
+    frame = 0
+
+    def timed(mode, kind, fn, *args):
+        start = time.perf_counter()
+        fn(*args)
+        timings[(mode, kind)].append(time.perf_counter() - start)
+
+    for record in records:
+        kind = record["type"]
+
+        if kind == "start":
+            canvas.set_mode(record["mode"])
+            for key in ("primary", "secondary", "stamp"):
+                if record[key] is not None:
+                    apply_state(canvas, dict(type=key, value=record[key]))
+            for key, value in record["config"].items():
+                apply_state(canvas, dict(type="config", key=key, value=value))
+            canvas.initialize()
+            canvas.blank(*record["size"])
+            canvas.history.clear()
+            # Events are in image coordinates, so show the image 1:1.
+            canvas.zoom = 1.0
+            canvas.offset = QPointF()
+            continue
+
+        # Flush for any frames that ended before this event.
+        if int(record["t"] * 1000 / frame_interval) != frame:
+            frame = int(record["t"] * 1000 / frame_interval)
+            if canvas.stroke_queue:
+                timed(canvas.mode, "flush", canvas.flush_stroke)
+            if paint:
+                timed(canvas.mode, "paint", canvas.repaint)
+
+        if kind in MOUSE_HANDLERS:
+            pos = QPointF(record["x"], record["y"])
+            e = QMouseEvent(
+                EVENT_TYPES[kind],
+                pos,
+                pos,
+                Qt.MouseButton(record["button"]),
+                Qt.MouseButton(record["buttons"]),
+                Qt.KeyboardModifier(record["modifiers"]),
+            )
+            timed(canvas.mode, kind, getattr(canvas, MOUSE_HANDLERS[kind]), e)
+
+        elif kind == "key":
+            e = QKeyEvent(
+                QEvent.Type.KeyPress,
+                record["key"],
+                Qt.KeyboardModifier(record["modifiers"]),
+                record["text"],
+            )
+            timed(canvas.mode, "key", canvas.keyPressEvent, e)
+
+        else:
+            apply_state(canvas, record)
+
+    canvas.flush_stroke(final=True)
+    return timings
@@ -0,0 +1,37 @@
+"""
+Spray can dots, generated in bulk with NumPy.
+
+Each mouse event generates all of its dots in one go, and the canvas hands
+them to QPainter as a single QPolygonF (see stroke.points_polygon), so
+there is no per-dot Python work at all.
+"""
+
+import numpy as np
+
+rng = np.random.default_rng()
+
+
+def spray_offsets(n, sigma, falloff=1.0, generator=None):
+    """
+    Generate n random dot offsets around a point.
+
+    Angles are uniform. The distance from the centre blends between a flat
+    disc of radius 2 * sigma (falloff 0) and a 2D Gaussian with standard
+    deviation sigma (falloff 1, the original spray), by interpolating their
+    inverse distribution functions so one uniform sample gives both.
+
+    :param n: number of dots.
+    :param sigma: spread of the spray, in pixels.
+    :param falloff: 0 for even coverage, 1 for dense in the middle.
+    :return: (n, 2) float64 array of x, y offsets.
+    """
+    if generator is None:
+        generator = rng
+    u = generator.random(n)
+    theta = generator.random(n) * (2 * np.pi)
+
+    flat = 2 * sigma * np.sqrt(u)
+    gaussian = sigma * np.sqrt(-2 * np.log1p(-u))
+    r = flat + falloff * (gaussian - flat)
+
+    return np.column_stack((r * np.cos(theta), r * np.sin(theta)))
@@ -0,0 +1,197 @@
+"""
+Backing store for large canvases.
+
+Images above MAPPED_IMAGE_PIXELS keep their pixels in a memory-mapped
+temporary file instead of on the heap, so a 10k x 10k scan costs address
+space rather than RAM and the OS only pages in the parts being looked at
+or drawn on. The pixels are laid out row-major exactly as QImage expects,
+so QPainter and the NumPy views in fill.py work on the mapping in place
+and every tool keeps working unchanged.
+
+For display, Pyramid keeps a cache of downsampled tiles (a mipmap pyramid)
+so zoomed-out views are drawn from small tiles rather than by scaling the
+full image, and only tiles touched by an edit are rebuilt.
+"""
+
+import math
+import tempfile
+from collections import OrderedDict
+
+import constants
+import numpy as np
+from fill import image_array
+from PyQt6 import sip
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+
+
+class MappedImage(QImage):
+    """
+    QImage whose pixel data lives in a memory-mapped temporary file.
+
+    The mapping is owned by this object, so don't keep shallow copies
+    (QImage(image)) around longer than it. Deep copies are fine.
+    """
+
+    def __init__(self, width, height, fmt=constants.IMAGE_FORMAT):
+        self._file = tempfile.TemporaryFile(prefix="piecasso-")
+        self._buffer = np.memmap(
+            self._file, dtype=np.uint32, mode="w+", shape=(height, width)
+        )
+        super().__init__(
+            sip.voidptr(self._buffer.ctypes.data), width, height, width * 4, fmt
+        )
+
+
+def new_image(width, height, fmt=constants.IMAGE_FORMAT):
+    """
+    Create an uninitialised image, memory-mapped if it is large.
+    """
+    if width * height >= constants.MAPPED_IMAGE_PIXELS:
+        return MappedImage(width, height, fmt)
+    return QImage(width, height, fmt)
+
+
+def from_image(image):
+    """
+    Return image converted to the canvas format, in a store from new_image().
+    """
+    image = image.convertToFormat(constants.IMAGE_FORMAT)
+    if image.width() * image.height() < constants.MAPPED_IMAGE_PIXELS:
+        return image
+
+    mapped = MappedImage(image.width(), image.height())
+    image_array(mapped)[:] = image_array(image)
+    return mapped
+
+
+def average(a, b):
+    """
+    Average two uint32 pixel arrays channel by channel, rounding down.
+
+    Works on all four 8-bit channels at once, without widening: the shared
+    bits plus half the differing bits, masked so no bit shifts into the
+    channel below.
+    """
+    return (a & b) + (((a ^ b) >> 1) & np.uint32(0x7F7F7F7F))
+
+
+def downsample(arr):
+    """
+    Halve a (h, w) uint32 pixel array with a 2x2 box filter.
+
+    Channels are averaged independently, which is correct for
+    premultiplied alpha. Odd edges are padded by repeating the last pixel.
+    """
+    h, w = arr.shape
+    if h % 2 or w % 2:
+        arr = np.pad(arr, ((0, h % 2), (0, w % 2)), mode="edge")
+    return average(
+        average(arr[0::2, 0::2], arr[1::2, 0::2]),
+        average(arr[0::2, 1::2], arr[1::2, 1::2]),
+    )
+
+
+class Pyramid:
+    """
+    Lazily built, cached mipmap pyramid over an image.
+
+    Level 0 is the image itself; each level above halves the resolution.
+    Tiles are MIPMAP_TILE_SIZE pixels square at their own level and built
+    on demand from the four tiles below them, so a tile at level n only
+    ever reads from level n - 1. Cached tiles are dropped least recently
+    used first once MIPMAP_CACHE_TILES are held.
+    """
+
+    def __init__(self, image, tile_size=constants.MIPMAP_TILE_SIZE):
+        self.image = image
+        self.tile_size = tile_size
+        self.cache = OrderedDict()
+
+    @staticmethod
+    def level_for(scale):
+        """
+        Return the coarsest level with at least the given scale, so drawing
+        from it never needs to scale up.
+        """
+        if scale >= 1:
+            return 0
+        return int(math.floor(math.log2(1 / scale)))
+
+    def level_size(self, level):
+        w, h = self.image.width(), self.image.height()
+        return (w + (1 << level) - 1) >> level, (h + (1 << level) - 1) >> level
+
+    def tiles(self, level, rect):
+        """
+        Yield (tx, ty) for the tiles at level covering rect (in image coordinates).
+        """
+        span = self.tile_size << level
+        rect = rect.intersected(self.image.rect())
+        if rect.isEmpty():
+            return
+        for ty in range(rect.top() // span, rect.bottom() // span + 1):
+            for tx in range(rect.left() // span, rect.right() // span + 1):
+                yield tx, ty
+
+    def tile_rect(self, level, tx, ty):
+        """
+        Return the rect a tile covers, in image coordinates.
+        """
+        span = self.tile_size << level
+        return QRect(tx * span, ty * span, span, span).intersected(self.image.rect())
+
+    def _pixels(self, level, tx, ty):
+        key = (level, tx, ty)
+        arr = self.cache.get(key)
+        if arr is not None:
+            self.cache.move_to_end(key)
+            return arr
+
+        ts = self.tile_size
+        if level == 1:
+            # Read the 2x2 tile area straight from the image.
+            rect = self.tile_rect(level, tx, ty)
+            src = image_array(self.image)[
+                rect.top() : rect.bottom() + 1, rect.left() : rect.right() + 1
+            ]
+        else:
+            lw, lh = self.level_size(level - 1)
+            x0, y0 = tx * 2 * ts, ty * 2 * ts
+            src = np.zeros((min(2 * ts, lh - y0), min(2 * ts, lw - x0)), np.uint32)
+            for dy in (0, 1):
+                for dx in (0, 1):
+                    cx, cy = tx * 2 + dx, ty * 2 + dy
+                    if cx * ts < lw and cy * ts < lh:
+                        child = self._pixels(level - 1, cx, cy)
+                        ch, cw = child.shape
+                        src[dy * ts : dy * ts + ch, dx * ts : dx * ts + cw] = child
+
+        arr = downsample(src)
+        self.cache[key] = arr
+        while len(self.cache) > constants.MIPMAP_CACHE_TILES:
+            self.cache.popitem(last=False)
+        return arr
+
+    def tile(self, level, tx, ty):
+        """
+        Return a QImage of the tile at level (level >= 1).
+
+        The QImage shares memory with the cached array, so use it
+        immediately rather than holding on to it.
+        """
+        arr = self._pixels(level, tx, ty)
+        h, w = arr.shape
+        return QImage(sip.voidptr(arr.ctypes.data), w, h, w * 4, self.image.format())
+
+    def invalidate(self, rect=None):
+        """
+        Drop cached tiles overlapping rect (in image coordinates), or all.
+        """
+        if rect is None:
+            self.cache.clear()
+            return
+        top = max(self.image.width(), self.image.height()).bit_length()
+        for level in range(1, top + 1):
+            for tile in self.tiles(level, rect):
+                self.cache.pop((level,) + tile, None)
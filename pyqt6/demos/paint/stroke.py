@@ -0,0 +1,115 @@
+"""
+Input pipeline helpers for freehand strokes.
+
+Mouse moves during a stroke are queued rather than drawn one by one, and
+flushed once per frame as a single smoothed polyline. catmull_rom() turns
+the queued positions into that polyline, and InputStats keeps the counters
+for how well the pipeline is keeping up.
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+from PyQt6.QtCore import QRectF
+from PyQt6.QtGui import QPolygonF
+
+
+def catmull_rom(points, spacing=2.0, max_steps=32):
+    """
+    Interpolate a uniform Catmull-Rom spline through control points.
+
+    The curve runs from points[1] to points[-2]; the first and last points
+    only set the tangents at the ends. Each span is sampled roughly every
+    spacing pixels.
+
+    :param points: (n, 2) float array of control points, n >= 4.
+    :return: (m, 2) float array of polyline points, starting at points[1].
+    """
+    p0, p1, p2, p3 = points[:-3], points[1:-2], points[2:-1], points[3:]
+
+    lengths = np.hypot(*(p2 - p1).T)
+    steps = np.clip(np.ceil(lengths / spacing).astype(int), 1, max_steps)
+
+    # t in (0, 1] for every sample of every span, and the span it's in.
+    span = np.repeat(np.arange(len(steps)), steps)
+    first = np.repeat(np.cumsum(steps) - steps, steps)
+    t = ((np.arange(steps.sum()) - first + 1) / steps[span])[:, None]
+
+    a, b, c, d = p0[span], p1[span], p2[span], p3[span]
+    curve = 0.5 * (
+        2 * b
+        + (c - a) * t
+        + (2 * a - 5 * b + 4 * c - d) * t**2
+        + (3 * b - a - 3 * c + d) * t**3
+    )
+    return np.vstack((points[1:2], curve))
+
+
+def points_polygon(points):
+    """
+    Build a QPolygonF from an (n, 2) float array, copying straight into it.
+
+    :return: tuple of (QPolygonF, bounding QRectF).
+    """
+    polygon = QPolygonF()
+    n = len(points)
+    if not n:
+        return polygon, QRectF()
+    polygon.resize(n)
+    data = polygon.data()
+    data.setsize(n * 2 * 8)
+    np.frombuffer(data, dtype=np.float64).reshape(n, 2)[:] = points
+
+    (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+    return polygon, QRectF(x0, y0, x1 - x0, y1 - y0)
+
+
+class InputStats:
+    """
+    Rolling counters over the most recent stroke flushes.
+
+    For each flush this records how many move events it drew, how long the
+    oldest of them waited in the queue until it was drawn (latency), and
+    how long the drawing itself took.
+    """
+
+    def __init__(self, window=120):
+        self.events = deque(maxlen=window)
+        self.latency = deque(maxlen=window)
+        self.flush_time = deque(maxlen=window)
+
+    def record(self, events, queued_at, started_at):
+        now = time.perf_counter()
+        self.events.append(events)
+        self.latency.append(now - queued_at)
+        self.flush_time.append(now - started_at)
+
+    def clear(self):
+        self.events.clear()
+        self.latency.clear()
+        self.flush_time.clear()
+
+    def events_per_frame(self):
+        return sum(self.events) / len(self.events) if self.events else 0.0
+
+    def summary(self):
+        """
+        :return: dict of mean events per frame, and mean and worst latency
+        and flush time in milliseconds.
+        """
+
+        def ms(values):
+            if not values:
+                return 0.0, 0.0
+            return 1000 * sum(values) / len(values), 1000 * max(values)
+
+        latency, latency_max = ms(self.latency)
+        flush, flush_max = ms(self.flush_time)
+        return {
+            "events_per_frame": self.events_per_frame(),
+            "latency_ms": latency,
+            "latency_max_ms": latency_max,
+            "flush_ms": flush,
+            "flush_max_ms": flush_max,
+        }
@@ -0,0 +1,833 @@
+"""
+The canvas tools, one object per mode.
+
+Each tool is a Tool subclass registered in TOOLS under its mode name. The
+canvas creates a fresh instance when its mode is set (or reset), so a
+tool's state lives on the tool and is thrown away with it, rather than in
+attributes on the canvas which every mode change has to reset.
+
+A tool handles events by defining any of the methods named in EVENTS,
+which receive events already mapped to image coordinates. When a tool is
+created it looks them up once into its handlers table, with None for the
+ones it doesn't define, so the canvas dispatches each event with a single
+dict lookup and skips mapping events no handler wants.
+
+Tools paint through the canvas: begin_edit(), touch() and end_edit() for
+undo, damage() to repaint, set_overlay() for previews, and add_shape()
+for finished shapes. To add a tool, subclass Tool, decorate it with
+@register and select it with canvas.set_mode(name).
+"""
+
+import constants
+import numpy as np
+from atlas import placed
+from fill import apply_mask, fill_mask
+from PyQt6.QtCore import QPointF, QRect, QRectF, Qt
+from PyQt6.QtGui import (
+    QBrush,
+    QFontMetricsF,
+    QImage,
+    QPainter,
+    QPen,
+    QPixmap,
+    QPolygonF,
+)
+from spray import spray_offsets
+from stroke import points_polygon
+from utils import build_font
+from vector import Shape
+
+# The handler methods a tool can define. strokeEvent receives smoothed
+# stroke polylines: while a stroke is in progress moves are queued for it
+# instead of going to mouseMoveEvent (see Canvas.queue_stroke).
+EVENTS = (
+    "mousePressEvent",
+    "mouseMoveEvent",
+    "mouseReleaseEvent",
+    "mouseDoubleClickEvent",
+    "strokeEvent",
+    "keyPressEvent",
+)
+
+TOOLS = {}
+
+
+def register(cls):
+    """
+    Class decorator adding a tool to TOOLS, under its name.
+    """
+    TOOLS[cls.name] = cls
+    return cls
+
+
+def tool_for(canvas, mode):
+    """
+    Return a new tool for mode, or one which ignores everything if there
+    is no such tool.
+    """
+    return TOOLS.get(mode, Tool)(canvas)
+
+
+class Tool:
+    """
+    A canvas mode. Subclasses set name, define handlers from EVENTS and
+    keep any state in attributes listed in their __slots__.
+    """
+
+    __slots__ = ("canvas", "handlers", "preview_pen", "dash_offset")
+
+    name = None
+    # Whether the tool can be used on vector layers.
+    vector = False
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.handlers = {name: getattr(self, name, None) for name in EVENTS}
+        # Set for selections, which are previewed as marching ants.
+        self.preview_pen = None
+        self.dash_offset = 0
+
+    def style_changed(self):
+        """
+        Called when the colors, size or fill change.
+        """
+
+    def copy(self):
+        """
+        Return the selected part of the image as a QPixmap, or None if
+        nothing is selected.
+        """
+        return None
+
+
+# Freehand tools.
+
+
+class StrokeTool(Tool):
+    """
+    Presses start an edit, and a stroke in the primary (left button) or
+    secondary color which lasts until the release.
+    """
+
+    __slots__ = ("active_color", "last_pos")
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.active_color = None
+        self.last_pos = None
+
+    def mousePressEvent(self, e):
+        canvas = self.canvas
+        canvas.begin_edit()
+        self.last_pos = e.position()
+        # Start the stroke curve, with the first point doubled as its tangent.
+        start = (self.last_pos.x(), self.last_pos.y())
+        canvas.stroke_tail = [start, start]
+
+        if e.button() == Qt.MouseButton.LeftButton:
+            self.active_color = canvas.primary_color
+        else:
+            self.active_color = canvas.secondary_color
+
+    def mouseReleaseEvent(self, e):
+        canvas = self.canvas
+        canvas.flush_stroke(final=True)
+        canvas.stroke_tail = ()
+        self.last_pos = None
+        canvas.end_edit()
+
+    def pen(self):
+        return QPen(
+            self.active_color,
+            self.canvas.config["size"],
+            Qt.PenStyle.SolidLine,
+            Qt.PenCapStyle.RoundCap,
+            Qt.PenJoinStyle.RoundJoin,
+        )
+
+    def strokeEvent(self, points):
+        self.canvas.draw_stroke(self.pen(), points)
+
+
+@register
+class PenTool(StrokeTool):
+    __slots__ = ()
+    name = "pen"
+
+
+@register
+class BrushTool(StrokeTool):
+    __slots__ = ()
+    name = "brush"
+
+    def pen(self):
+        pen = super().pen()
+        pen.setWidthF(self.canvas.config["size"] * constants.BRUSH_MULT)
+        return pen
+
+
+@register
+class EraserTool(StrokeTool):
+    __slots__ = ()
+    name = "eraser"
+
+    def pen(self):
+        return QPen(
+            self.canvas.eraser_color,
+            30,
+            Qt.PenStyle.SolidLine,
+            Qt.PenCapStyle.RoundCap,
+            Qt.PenJoinStyle.RoundJoin,
+        )
+
+
+@register
+class SprayTool(StrokeTool):
+    # Sprays on every move rather than drawing a smoothed stroke.
+    __slots__ = ()
+    name = "spray"
+    strokeEvent = None
+
+    def mouseMoveEvent(self, e):
+        if self.last_pos:
+            canvas = self.canvas
+            config = canvas.config
+            n = config["size"] * constants.SPRAY_PAINT_N
+            offsets = spray_offsets(
+                int(n * config["spray_density"]),
+                config["size"] * constants.SPRAY_PAINT_MULT,
+                config["spray_falloff"],
+            )
+            points, bounds = points_polygon(
+                offsets + np.array([e.position().x(), e.position().y()])
+            )
+            rect = bounds.toAlignedRect().adjusted(-1, -1, 1, 1)
+
+            canvas.touch(rect)
+            p = QPainter(canvas.image)
+            p.setPen(QPen(self.active_color, 1))
+            p.drawPoints(points)
+            p.end()
+            canvas.damage(rect)
+
+
+@register
+class StampTool(Tool):
+    """
+    Stamps are drawn from the atlas, and dragging lays a trail of them,
+    STAMP_SPACING of the stamp's width apart, as one undo step.
+    """
+
+    __slots__ = ("last_pos",)
+    name = "stamp"
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.last_pos = None
+
+    def variant(self):
+        canvas = self.canvas
+        return canvas.stamps.variant(
+            canvas.current_stamp_path,
+            canvas.config["stamp_scale"],
+            canvas.config["stamp_angle"],
+        )
+
+    def stamp_at(self, points):
+        """
+        Draw the current stamp centred on each of points.
+        """
+        canvas = self.canvas
+        page, rect = self.variant()
+        targets = [placed(rect, point) for point in points]
+        area = QRect()
+        for target in targets:
+            area = area.united(target.toAlignedRect())
+        canvas.touch(area)
+
+        p = QPainter(canvas.image)
+        source = QRectF(rect)
+        for target in targets:
+            p.drawImage(target, page, source)
+        p.end()
+        canvas.damage(area)
+
+    def mousePressEvent(self, e):
+        if self.variant() is None:
+            return
+        self.canvas.begin_edit()
+        self.last_pos = e.position()
+        self.stamp_at([self.last_pos])
+
+    def mouseMoveEvent(self, e):
+        if self.last_pos is None:
+            return
+        _, rect = self.variant()
+        step = max(rect.width() * constants.STAMP_SPACING, 1)
+        delta = e.position() - self.last_pos
+        distance = (delta.x() ** 2 + delta.y() ** 2) ** 0.5
+        if distance < step:
+            return
+        points = [
+            self.last_pos + delta * (n * step / distance)
+            for n in range(1, int(distance // step) + 1)
+        ]
+        self.last_pos = points[-1]
+        self.stamp_at(points)
+
+    def mouseReleaseEvent(self, e):
+        self.last_pos = None
+        self.canvas.end_edit()
+
+
+# Single click tools.
+
+
+@register
+class FillTool(Tool):
+    __slots__ = ()
+    name = "fill"
+
+    def mousePressEvent(self, e):
+        canvas = self.canvas
+        if e.button() == Qt.MouseButton.LeftButton:
+            color = canvas.primary_color
+        else:
+            color = canvas.secondary_color
+
+        x, y = int(e.position().x()), int(e.position().y())
+        mask, rect = fill_mask(
+            canvas.image,
+            x,
+            y,
+            color,
+            tolerance=canvas.config["fill_tolerance"],
+            connectivity=canvas.config["fill_connectivity"],
+        )
+        if mask is not None:
+            canvas.begin_edit()
+            canvas.touch(rect)
+            apply_mask(canvas.image, mask, color)
+            canvas.end_edit()
+            canvas.damage(rect)
+
+
+@register
+class DropperTool(Tool):
+    __slots__ = ()
+    name = "dropper"
+    vector = True
+
+    def mousePressEvent(self, e):
+        # Read the pixel straight from the composited image.
+        canvas = self.canvas
+        pos = e.position().toPoint()
+        image = canvas.composite()
+        if not image.valid(pos):
+            return
+        hex = image.pixelColor(pos).name()
+
+        if e.button() == Qt.MouseButton.LeftButton:
+            canvas.set_primary_color(hex)
+            canvas.primary_color_updated.emit(hex)  # Update UI.
+
+        elif e.button() == Qt.MouseButton.RightButton:
+            canvas.set_secondary_color(hex)
+            canvas.secondary_color_updated.emit(hex)  # Update UI.
+
+
+@register
+class TextTool(Tool):
+    """
+    Click to place the text, type it, then click again to draw it (or
+    right click to cancel).
+    """
+
+    __slots__ = ("current_pos", "current_text")
+    name = "text"
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.current_pos = None
+        self.current_text = ""
+
+    def pen(self):
+        return QPen(
+            self.canvas.primary_color,
+            1,
+            Qt.PenStyle.SolidLine,
+            Qt.PenCapStyle.RoundCap,
+            Qt.PenJoinStyle.RoundJoin,
+        )
+
+    def keyPressEvent(self, e):
+        if self.current_pos is not None:
+            if e.key() == Qt.Key.Key_Backspace:
+                self.current_text = self.current_text[:-1]
+            else:
+                self.current_text = self.current_text + e.text()
+            self.canvas.refresh_overlay()
+
+    def mousePressEvent(self, e):
+        canvas = self.canvas
+        if e.button() == Qt.MouseButton.LeftButton and self.current_pos is None:
+            self.current_pos = e.position()
+            self.current_text = ""
+            canvas.timer_event = canvas.overlay_timerEvent
+            canvas.set_overlay(self.overlay, self.overlay_rect)
+
+        elif e.button() == Qt.MouseButton.LeftButton:
+            canvas.timer_cleanup()
+            # Draw the text to the image
+            rect = self.overlay_rect()
+
+            canvas.begin_edit()
+            canvas.touch(rect)
+            p = QPainter(canvas.image)
+            p.setRenderHints(QPainter.RenderHint.Antialiasing)
+            p.setFont(build_font(canvas.config))
+            p.setPen(self.pen())
+            p.drawText(self.current_pos, self.current_text)
+            p.end()
+            canvas.end_edit()
+            canvas.damage(rect)
+
+            canvas.reset_mode()
+
+        elif e.button() == Qt.MouseButton.RightButton and self.current_pos:
+            canvas.reset_mode()
+
+    def overlay(self, p):
+        font = build_font(self.canvas.config)
+        p.setRenderHints(QPainter.RenderHint.Antialiasing)
+        p.setFont(font)
+        p.setPen(self.pen())
+        p.drawText(self.current_pos, self.current_text)
+
+        # Text cursor, so there is something to see before typing.
+        metrics = QFontMetricsF(font)
+        x = self.current_pos.x() + metrics.horizontalAdvance(self.current_text)
+        p.setPen(constants.SELECTION_SHADOW_PEN)
+        p.drawLine(
+            QPointF(x, self.current_pos.y() - metrics.ascent()),
+            QPointF(x, self.current_pos.y() + metrics.descent()),
+        )
+
+    def overlay_rect(self):
+        metrics = QFontMetricsF(build_font(self.canvas.config))
+        pad = metrics.averageCharWidth()
+        width = metrics.horizontalAdvance(self.current_text)
+        return (
+            metrics.boundingRect(self.current_text)
+            .united(QRectF(0, -metrics.ascent(), width, metrics.height()))
+            .translated(self.current_pos)
+            .adjusted(-pad, -pad, pad, pad)
+            .toAlignedRect()
+        )
+
+
+# Shape tools, dragged out from a corner: Rectangle, Ellipse, Rounded-rect.
+
+
+class ShapeTool(Tool):
+    """
+    Drags out a shape_fn (a QPainter method taking a rect, then
+    shape_args), previewed on the overlay and added on release.
+    """
+
+    __slots__ = ("origin_pos", "current_pos")
+    vector = True
+    shape_fn = None
+    shape_args = ()
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.origin_pos = None
+        self.current_pos = None
+
+    def mousePressEvent(self, e):
+        canvas = self.canvas
+        self.origin_pos = e.position()
+        self.current_pos = e.position()
+        canvas.timer_event = canvas.overlay_timerEvent
+        canvas.set_overlay(self.overlay, self.overlay_rect)
+
+    def overlay(self, p):
+        shape = QRectF(self.origin_pos, self.current_pos).normalized()
+        self.canvas.draw_preview(
+            p,
+            self.shape_fn,
+            shape,
+            *self.shape_args,
+            brush=self.canvas.shape_brush(),
+        )
+
+    def overlay_rect(self):
+        return self.canvas.preview_rect([self.origin_pos, self.current_pos])
+
+    def mouseMoveEvent(self, e):
+        if self.origin_pos:
+            self.current_pos = e.position()
+            self.canvas.refresh_overlay()
+
+    def mouseReleaseEvent(self, e):
+        canvas = self.canvas
+        if self.origin_pos:
+            # Clear up indicator.
+            canvas.timer_cleanup()
+
+            shape = QRectF(self.origin_pos, e.position()).normalized()
+            rect = canvas.segment_rect(
+                shape.topLeft(), shape.bottomRight(), canvas.config["size"]
+            )
+            canvas.add_shape(
+                Shape(
+                    self.shape_fn,
+                    (shape, *self.shape_args),
+                    canvas.shape_pen(),
+                    canvas.shape_brush(),
+                ),
+                rect,
+            )
+
+        canvas.reset_mode()
+
+
+@register
+class RectTool(ShapeTool):
+    __slots__ = ()
+    name = "rect"
+    shape_fn = "drawRect"
+
+
+@register
+class EllipseTool(ShapeTool):
+    __slots__ = ()
+    name = "ellipse"
+    shape_fn = "drawEllipse"
+
+
+@register
+class RoundRectTool(ShapeTool):
+    __slots__ = ()
+    name = "roundrect"
+    shape_fn = "drawRoundedRect"
+    shape_args = (25, 25)
+
+
+@register
+class LineTool(ShapeTool):
+    __slots__ = ()
+    name = "line"
+
+    def overlay(self, p):
+        self.canvas.draw_preview(p, "drawLine", self.origin_pos, self.current_pos)
+
+    def mouseReleaseEvent(self, e):
+        canvas = self.canvas
+        if self.origin_pos:
+            # Clear up indicator.
+            canvas.timer_cleanup()
+
+            rect = canvas.segment_rect(
+                self.origin_pos, e.position(), canvas.config["size"]
+            )
+            canvas.add_shape(
+                Shape("drawLine", (self.origin_pos, e.position()), canvas.shape_pen()),
+                rect,
+            )
+
+        canvas.reset_mode()
+
+
+# Poly tools, clicked out point by point and finished with a double click.
+
+
+class PolyTool(Tool):
+    """
+    Clicks add the points of a shape_fn (a QPainter method taking points),
+    a double click adds the last one and the shape, and a right click
+    cancels.
+    """
+
+    __slots__ = ("points", "current_pos")
+    vector = True
+    shape_fn = None
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.points = None
+        self.current_pos = None
+
+    def mousePressEvent(self, e):
+        canvas = self.canvas
+        if e.button() == Qt.MouseButton.LeftButton:
+            if self.points:
+                self.points.append(e.position())
+                canvas.refresh_overlay()
+            else:
+                self.points = [e.position()]
+                self.current_pos = e.position()
+                canvas.timer_event = canvas.overlay_timerEvent
+                canvas.set_overlay(self.overlay, self.overlay_rect)
+
+        elif e.button() == Qt.MouseButton.RightButton and self.points:
+            # Clean up, we're not drawing
+            canvas.timer_cleanup()
+            canvas.reset_mode()
+
+    def brush(self):
+        # Note the brush is ignored for polylines.
+        if self.canvas.secondary_color:
+            return QBrush(self.canvas.secondary_color)
+        return QBrush()
+
+    def overlay(self, p):
+        self.canvas.draw_preview(
+            p,
+            self.shape_fn,
+            *self.points + [self.current_pos],
+            brush=self.brush(),
+        )
+
+    def overlay_rect(self):
+        return self.canvas.preview_rect(self.points + [self.current_pos])
+
+    def mouseMoveEvent(self, e):
+        if self.points:
+            self.current_pos = e.position()
+            self.canvas.refresh_overlay()
+
+    def mouseDoubleClickEvent(self, e):
+        canvas = self.canvas
+        canvas.timer_cleanup()
+        points = self.points + [e.position()]
+        bounds = QPolygonF(points).boundingRect()
+        rect = canvas.segment_rect(
+            bounds.topLeft(), bounds.bottomRight(), canvas.config["size"]
+        )
+        canvas.add_shape(
+            Shape(self.shape_fn, points, canvas.shape_pen(), self.brush()),
+            rect,
+        )
+
+        canvas.reset_mode()
+
+
+@register
+class PolylineTool(PolyTool):
+    __slots__ = ()
+    name = "polyline"
+    shape_fn = "drawPolyline"
+
+
+@register
+class PolygonTool(PolyTool):
+    __slots__ = ()
+    name = "polygon"
+    shape_fn = "drawPolygon"
+
+
+# Selections, which stay on the overlay (locked) until copied or the mode
+# is reset.
+
+
+@register
+class SelectRectTool(ShapeTool):
+    __slots__ = ("locked",)
+    name = "selectrect"
+    shape_fn = "drawRect"
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.locked = False
+
+    def mousePressEvent(self, e):
+        self.preview_pen = constants.SELECTION_PEN
+        super().mousePressEvent(e)
+
+    def mouseMoveEvent(self, e):
+        if not self.locked:
+            super().mouseMoveEvent(e)
+
+    def mouseReleaseEvent(self, e):
+        self.current_pos = e.position()
+        self.locked = True
+        self.canvas.refresh_overlay()
+
+    def copy(self):
+        """
+        Copy a rectangle region of the current image, returning it.
+
+        :return: QPixmap of the copied region.
+        """
+        if not self.locked:
+            return None
+        rect = QRectF(self.origin_pos, self.current_pos).normalized().toRect()
+        return QPixmap.fromImage(self.canvas.composite().copy(rect))
+
+
+@register
+class SelectPolyTool(PolyTool):
+    __slots__ = ("locked",)
+    name = "selectpoly"
+    shape_fn = "drawPolygon"
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.locked = False
+
+    def mousePressEvent(self, e):
+        if not self.locked:
+            self.preview_pen = constants.SELECTION_PEN
+            super().mousePressEvent(e)
+
+    def mouseMoveEvent(self, e):
+        if not self.locked:
+            super().mouseMoveEvent(e)
+
+    def mouseDoubleClickEvent(self, e):
+        self.current_pos = e.position()
+        self.locked = True
+        self.canvas.refresh_overlay()
+
+    def copy(self):
+        """
+        Copy a polygon region from the current image, returning it.
+
+        Crop to the bounding rect of the selection, then create a mask
+        for the selected area and use it to blank out non-selected
+        regions. Only the bounding rect is ever copied or masked.
+
+        :return: QPixmap of the copied region.
+        """
+        if not self.locked:
+            return None
+        userpoly = QPolygonF(self.points + [self.current_pos]).toPolygon()
+        rect = userpoly.boundingRect()
+        image = self.canvas.composite().copy(rect)
+
+        # Construct a mask where the user selected area will be kept,
+        # the rest removed from the image is transparent.
+        mask = QImage(rect.size(), constants.IMAGE_FORMAT)
+        mask.fill(Qt.GlobalColor.transparent)
+        p = QPainter(mask)
+        p.translate(-rect.topLeft())
+        p.setPen(QPen(Qt.GlobalColor.black))
+        p.setBrush(QBrush(Qt.GlobalColor.black))
+        p.drawPolygon(userpoly)
+        p.end()
+
+        # Keep the image only where the mask is opaque.
+        p = QPainter(image)
+        p.setCompositionMode(QPainter.CompositionMode.CompositionMode_DestinationIn)
+        p.drawImage(0, 0, mask)
+        p.end()
+        return QPixmap.fromImage(image)
+
+
+# Vector layers.
+
+
+@register
+class ShapesTool(Tool):
+    """
+    Selects the shape under the mouse on a vector layer and drags it
+    around. Delete removes it, and changing the colors, size or fill
+    restyles it.
+    """
+
+    __slots__ = ("selected", "origin_pos", "current_pos", "moving")
+    name = "shapes"
+    vector = True
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        # The id of the selected shape, and the shape as it was before
+        # the drag in progress.
+        self.selected = None
+        self.origin_pos = self.current_pos = self.moving = None
+
+    @property
+    def shapes(self):
+        return self.canvas.layers.layer.shapes
+
+    def style_changed(self):
+        """
+        Give the selected shape the current colors, size and fill.
+        """
+        if self.selected is None:
+            return
+        canvas = self.canvas
+        shape = self.shapes.shapes[self.selected]
+        canvas.begin_edit()
+        canvas.change_shape(
+            self.selected, shape.restyled(canvas.shape_pen(), canvas.shape_brush())
+        )
+        canvas.end_edit()
+        canvas.refresh_overlay()
+
+    def delete(self):
+        canvas = self.canvas
+        key = self.selected
+        self.select(None)
+        canvas.begin_edit()
+        canvas.change_shape(key, None)
+        canvas.end_edit()
+
+    def select(self, key):
+        canvas = self.canvas
+        self.selected = key
+        if key is None:
+            canvas.timer_cleanup()
+            return
+        self.preview_pen = constants.SELECTION_PEN
+        canvas.timer_event = canvas.overlay_timerEvent
+        canvas.set_overlay(self.overlay, self.overlay_rect)
+
+    def overlay(self, p):
+        shape = self.shapes.shapes[self.selected]
+        self.canvas.draw_preview(p, "drawRect", shape.bounds())
+
+    def overlay_rect(self):
+        bounds = self.shapes.shapes[self.selected].bounds()
+        return self.canvas.preview_rect([bounds.topLeft(), bounds.bottomRight()])
+
+    def keyPressEvent(self, e):
+        if self.selected is not None and e.key() in (
+            Qt.Key.Key_Delete,
+            Qt.Key.Key_Backspace,
+        ):
+            self.delete()
+
+    def mousePressEvent(self, e):
+        # Select the shape under the mouse, and start dragging it.
+        shapes = self.shapes
+        if shapes is None:
+            return
+        self.select(shapes.hit(e.position()))
+        if self.selected is not None:
+            self.canvas.begin_edit()
+            self.origin_pos = self.current_pos = e.position()
+            self.moving = shapes.shapes[self.selected]
+
+    def mouseMoveEvent(self, e):
+        if self.origin_pos is None:
+            return
+        shapes = self.shapes
+        offset = e.position() - self.current_pos
+        self.current_pos = e.position()
+        moved = shapes.shapes[self.selected].translated(offset)
+        self.canvas.render_shapes(shapes.set(self.selected, moved))
+        self.canvas.refresh_overlay()
+
+    def mouseReleaseEvent(self, e):
+        if self.origin_pos is None:
+            return
+        canvas = self.canvas
+        # Record the whole drag as one change.
+        shape = self.shapes.shapes[self.selected]
+        if shape is not self.moving:
+            canvas.history.record(self.selected, self.moving, shape)
+        canvas.end_edit()
+        self.origin_pos = self.current_pos = self.moving = None
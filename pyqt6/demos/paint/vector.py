@@ -0,0 +1,351 @@
+"""
+Vector layers: shapes kept as objects, and rasterised on demand.
+
+On a vector layer the shape tools add a Shape to the layer's
+ShapeDocument instead of painting straight into its pixels. The layer's
+image is still what the canvas shows and composites, but it is only ever
+drawn from the shapes: any change redraws just the bounding boxes it
+affects, drawing the shapes which overlap them in order, clipped.
+
+Shapes are immutable, so moving or restyling one replaces it with a new
+Shape under the same id. The document keeps them by id (which is also
+their stacking order) and in a GridIndex, a uniform grid of cells each
+listing the shapes whose bounds overlap it, so hit-testing a point or
+finding the shapes in a rect only looks at the shapes nearby, however
+many there are in all.
+"""
+
+from xml.sax.saxutils import quoteattr
+
+import constants
+import numpy as np
+from PyQt6.QtCore import QPointF, QRectF, Qt
+from PyQt6.QtGui import (
+    QBrush,
+    QPainter,
+    QPainterPath,
+    QPainterPathStroker,
+    QTransform,
+)
+
+# Shapes which are only ever outlines, whatever the brush.
+OPEN_SHAPES = {"drawLine", "drawPolyline"}
+
+
+class Shape:
+    """
+    A shape, drawn with the named QPainter method and arguments.
+
+    :param kind: drawRect, drawEllipse, drawRoundedRect (args: a QRectF,
+    plus the radii for rounded rects), drawLine (two QPointFs), drawPolyline
+    or drawPolygon (QPointFs).
+    :param brush: QBrush for closed shapes, or None.
+    """
+
+    __slots__ = ("kind", "args", "pen", "brush", "_path", "_outline", "_bounds")
+
+    def __init__(self, kind, args, pen, brush=None):
+        self.kind = kind
+        self.args = tuple(args)
+        self.pen = pen
+        self.brush = None if kind in OPEN_SHAPES else brush
+        self._path = self._outline = self._bounds = None
+
+    @property
+    def filled(self):
+        return self.brush is not None and self.brush.style() != Qt.BrushStyle.NoBrush
+
+    def draw(self, p):
+        p.setPen(self.pen)
+        p.setBrush(self.brush or QBrush())
+        getattr(p, self.kind)(*self.args)
+
+    def path(self):
+        if self._path is None:
+            path = QPainterPath()
+            if self.kind == "drawRect":
+                path.addRect(self.args[0])
+            elif self.kind == "drawEllipse":
+                path.addEllipse(self.args[0])
+            elif self.kind == "drawRoundedRect":
+                path.addRoundedRect(*self.args)
+            else:
+                path.moveTo(self.args[0])
+                for point in self.args[1:]:
+                    path.lineTo(point)
+                if self.kind == "drawPolygon":
+                    path.closeSubpath()
+            self._path = path
+        return self._path
+
+    def bounds(self):
+        """
+        Return the QRectF the shape covers, pen included.
+        """
+        if self._bounds is None:
+            pad = self.pen.widthF() / 2 + 1
+            self._bounds = self.path().boundingRect().adjusted(-pad, -pad, pad, pad)
+        return self._bounds
+
+    def contains(self, point):
+        """
+        True if point is on the shape's outline (within SHAPE_HIT_TOLERANCE), or
+        inside it if it's filled.
+        """
+        if self.filled and self.path().contains(point):
+            return True
+        if self._outline is None:
+            stroker = QPainterPathStroker()
+            stroker.setWidth(self.pen.widthF() + 2 * constants.SHAPE_HIT_TOLERANCE)
+            stroker.setCapStyle(Qt.PenCapStyle.RoundCap)
+            stroker.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
+            self._outline = stroker.createStroke(self.path())
+        return self._outline.contains(point)
+
+    def mapped(self, transform):
+        """
+        Return the shape moved by a QTransform which keeps rects upright,
+        such as a translation or a flip.
+        """
+        args = [
+            (
+                transform.mapRect(arg)
+                if isinstance(arg, QRectF)
+                else transform.map(arg) if isinstance(arg, QPointF) else arg
+            )
+            for arg in self.args
+        ]
+        return Shape(self.kind, args, self.pen, self.brush)
+
+    def translated(self, offset):
+        return self.mapped(QTransform.fromTranslate(offset.x(), offset.y()))
+
+    def restyled(self, pen=None, brush=None):
+        return Shape(
+            self.kind,
+            self.args,
+            self.pen if pen is None else pen,
+            self.brush if brush is None else brush,
+        )
+
+    def svg(self):
+        """
+        Return the shape as an SVG element.
+        """
+        color = self.pen.color()
+        attrs = {
+            "stroke": color.name(),
+            "stroke-opacity": "%.3g" % color.alphaF(),
+            "stroke-width": "%g" % max(self.pen.widthF(), 1),
+            "stroke-linecap": "round",
+            "stroke-linejoin": "round",
+            "fill": "none",
+        }
+        if self.filled:
+            fill = self.brush.color()
+            attrs["fill"] = fill.name()
+            attrs["fill-opacity"] = "%.3g" % fill.alphaF()
+
+        if self.kind in ("drawRect", "drawRoundedRect"):
+            rect = self.args[0]
+            tag = "rect"
+            attrs.update(
+                x=rect.x(), y=rect.y(), width=rect.width(), height=rect.height()
+            )
+            if self.kind == "drawRoundedRect":
+                attrs.update(rx=self.args[1], ry=self.args[2])
+        elif self.kind == "drawEllipse":
+            rect = self.args[0]
+            tag = "ellipse"
+            centre = rect.center()
+            attrs.update(
+                cx=centre.x(), cy=centre.y(), rx=rect.width() / 2, ry=rect.height() / 2
+            )
+        elif self.kind == "drawLine":
+            start, end = self.args
+            tag = "line"
+            attrs.update(x1=start.x(), y1=start.y(), x2=end.x(), y2=end.y())
+        else:
+            tag = "polygon" if self.kind == "drawPolygon" else "polyline"
+            attrs["points"] = " ".join("%g,%g" % (p.x(), p.y()) for p in self.args)
+            if tag == "polygon":
+                # Qt fills polygons with the odd-even rule.
+                attrs["fill-rule"] = "evenodd"
+
+        return "<%s %s/>" % (
+            tag,
+            " ".join(
+                "%s=%s"
+                % (
+                    key,
+                    quoteattr("%g" % value if isinstance(value, float) else str(value)),
+                )
+                for key, value in attrs.items()
+            ),
+        )
+
+
+class GridIndex:
+    """
+    A uniform grid over the plane, each cell holding the ids of the shapes
+    whose bounds overlap it.
+    """
+
+    def __init__(self, cell_size=constants.SHAPE_GRID_CELL):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cells(self, rect):
+        size = self.cell_size
+        x0, x1 = int(rect.left() // size), int(rect.right() // size)
+        y0, y1 = int(rect.top() // size), int(rect.bottom() // size)
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                yield cx, cy
+
+    def insert(self, key, rect):
+        for cell in self._cells(rect):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key, rect):
+        for cell in self._cells(rect):
+            ids = self.cells.get(cell)
+            if ids is not None:
+                ids.discard(key)
+                if not ids:
+                    del self.cells[cell]
+
+    def at(self, point):
+        size = self.cell_size
+        return self.cells.get(
+            (int(point.x() // size), int(point.y() // size)), frozenset()
+        )
+
+    def query(self, rect):
+        found = set()
+        for cell in self._cells(rect):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+
+class ShapeDocument:
+    """
+    The shapes on a vector layer, by id, bottom to top.
+
+    Every change returns the QRectF it affected, for render().
+    """
+
+    def __init__(self):
+        self.shapes = {}
+        self.index = GridIndex()
+        self.next_id = 1
+        # The bounds of each shape as left, top, right, bottom, in rows by
+        # id (NaN for none), so a cell's candidates are checked in one go.
+        self.boxes = np.full((256, 4), np.nan)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def add(self, shape):
+        """
+        Add a shape on top of the others.
+
+        :return: tuple of (id, affected QRectF).
+        """
+        key = self.next_id
+        self.next_id += 1
+        return key, self.set(key, shape)
+
+    def set(self, key, shape):
+        """
+        Replace the shape with id key, adding it if it's new and removing
+        it if shape is None.
+
+        :return: the affected QRectF.
+        """
+        dirty = QRectF()
+        old = self.shapes.pop(key, None)
+        if old is not None:
+            self.index.remove(key, old.bounds())
+            self.boxes[key] = np.nan
+            dirty = old.bounds()
+        if shape is not None:
+            bounds = shape.bounds()
+            self.shapes[key] = shape
+            self.index.insert(key, bounds)
+            if key >= len(self.boxes):
+                grown = np.full((max(key + 1, 2 * len(self.boxes)), 4), np.nan)
+                grown[: len(self.boxes)] = self.boxes
+                self.boxes = grown
+            self.boxes[key] = bounds.getCoords()
+            dirty = dirty.united(bounds)
+            self.next_id = max(self.next_id, key + 1)
+        return dirty
+
+    def _within(self, keys, left, top, right, bottom):
+        """
+        Return the keys whose bounds overlap the given box, top first.
+        """
+        keys = np.fromiter(keys, dtype=np.intp, count=len(keys))
+        boxes = self.boxes[keys]
+        keys = keys[
+            (boxes[:, 0] <= right)
+            & (boxes[:, 2] >= left)
+            & (boxes[:, 1] <= bottom)
+            & (boxes[:, 3] >= top)
+        ]
+        return np.sort(keys)[::-1].tolist()
+
+    def hit(self, point):
+        """
+        Return the id of the topmost shape at point, or None.
+        """
+        x, y = point.x(), point.y()
+        for key in self._within(self.index.at(point), x, y, x, y):
+            if self.shapes[key].contains(point):
+                return key
+        return None
+
+    def overlapping(self, rect):
+        """
+        Return the ids of the shapes whose bounds overlap rect, bottom first.
+        """
+        return self._within(self.index.query(rect), *rect.getCoords())[::-1]
+
+    def render(self, image, rect):
+        """
+        Redraw rect of image (a QRect) from the shapes.
+        """
+        rect = rect.intersected(image.rect())
+        if rect.isEmpty():
+            return
+        p = QPainter(image)
+        p.setClipRect(rect)
+        p.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        p.fillRect(rect, Qt.GlobalColor.transparent)
+        p.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+        for key in self.overlapping(QRectF(rect)):
+            self.shapes[key].draw(p)
+        p.end()
+
+
+def svg(layers, size):
+    """
+    Return an SVG document of the shapes on the given vector layers, bottom
+    first, each layer a group.
+    """
+    w, h = size.width(), size.height()
+    lines = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+        'viewBox="0 0 %d %d">' % (w, h, w, h)
+    ]
+    for layer in layers:
+        attrs = 'id=%s opacity="%g"' % (quoteattr(layer.name), layer.opacity)
+        if not layer.visible:
+            attrs += ' display="none"'
+        lines.append("<g %s>" % attrs)
+        doc = layer.shapes
+        lines.extend(doc.shapes[key].svg() for key in sorted(doc.shapes))
+        lines.append("</g>")
+    lines.append("</svg>")
+    return "\n".join(lines) + "\n"
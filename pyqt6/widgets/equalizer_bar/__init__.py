@@ -1 +1,2 @@
 from .equalizer_bar import EqualizerBar
+from .spectrum import PipeReader, SpectrumSource, WavReader
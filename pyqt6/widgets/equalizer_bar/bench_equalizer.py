@@ -0,0 +1,146 @@
+"""
+Benchmark an EqualizerBar with many bars, against a 60 fps frame budget.
+
+Times paintEvent (through repaint()) with fresh random values every
+frame, and compares it with painting every lit cell with its own QColor
+and fillRect, as the widget used to. Also times feed(): one frame at a
+time, a block of frames at once, and from several threads together,
+with the frame timer draining the ring as it would at 60 fps.
+
+Run with: python bench_equalizer.py [--bars 256] [--steps 11]
+[--size 1280x400] [--frames 200] [--threads 4]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from equalizer_bar import EqualizerBar
+from PyQt6.QtCore import QRectF
+from PyQt6.QtGui import QBrush, QColor, QPainter
+from PyQt6.QtWidgets import QApplication
+
+
+class PerCellBar(EqualizerBar):
+    """
+    Paints as EqualizerBar used to: a QColor, QRectF and fillRect per lit
+    cell, with the layout worked out again on every paint.
+    """
+
+    def paintEvent(self, e):
+        painter = QPainter(self)
+        brush = QBrush(self._background_color)
+        painter.fillRect(self.rect(), brush)
+
+        d_height = self.height() - (self._padding * 2)
+        d_width = self.width() - (self._padding * 2)
+        step_y = d_height / self.n_steps
+        bar_height = step_y * self._y_solid_percent
+        bar_height_space = step_y * (1 - self._y_solid_percent) / 2
+        step_x = d_width / self.n_bars
+        bar_width = step_x * self._x_solid_percent
+        bar_width_space = step_x * (1 - self._x_solid_percent) / 2
+
+        for b in range(self.n_bars):
+            pc = (self._values[b] - self._vmin) / (self._vmax - self._vmin)
+            for n in range(int(pc * self.n_steps)):
+                brush.setColor(QColor(self.steps[n]))
+                rect = QRectF(
+                    self._padding + (step_x * b) + bar_width_space,
+                    self._padding + d_height - ((1 + n) * step_y) + bar_height_space,
+                    bar_width,
+                    bar_height,
+                )
+                painter.fillRect(rect, brush)
+        painter.end()
+
+
+def bench_paint(app, cls, args, width, height, frames):
+    colors = [
+        QColor.fromHsv(240 - 200 * n // args.steps, 230, 240) for n in range(args.steps)
+    ]
+    bar = cls(args.bars, [color.name() for color in colors])
+    bar.setDecayFrequencyMs(0)
+    bar.resize(width, height)
+    bar.show()
+    app.processEvents()
+
+    times = []
+    for values in frames:
+        bar.setValues(values)
+        start = time.perf_counter()
+        bar.repaint()
+        times.append(time.perf_counter() - start)
+    bar.close()
+    return times
+
+
+def bench_feed(app, args, frames):
+    bar = EqualizerBar(args.bars, args.steps)
+    bar.setDecayFrequencyMs(0)
+
+    start = time.perf_counter()
+    for values in frames:
+        bar.feed(values)
+    single = (time.perf_counter() - start) / len(frames)
+
+    start = time.perf_counter()
+    bar.feed(frames)
+    block = (time.perf_counter() - start) / len(frames)
+
+    # Several producers at once, while the GUI thread shows frames.
+    per_thread = len(frames) // args.threads
+
+    def produce(n):
+        for values in frames[n * per_thread : (n + 1) * per_thread]:
+            bar.feed(values)
+
+    threads = [threading.Thread(target=produce, args=(n,)) for n in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        app.processEvents()
+    threaded = (time.perf_counter() - start) / (per_thread * args.threads)
+    return single, block, threaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=11)
+    parser.add_argument("--size", default="1280x400")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = QApplication(sys.argv[:1])
+    rng = np.random.default_rng(0)
+    frames = rng.uniform(0, 100, (args.frames, args.bars))
+
+    print(
+        "%d bars x %d steps at %dx%d, %d frames (60 fps is 16.7 ms):"
+        % (args.bars, args.steps, width, height, args.frames)
+    )
+    for label, cls in (("per cell", PerCellBar), ("cached", EqualizerBar)):
+        times = bench_paint(app, cls, args, width, height, frames)
+        print(
+            "  paint, %-9s p50 %6.2f ms   max %6.2f ms"
+            % (label, statistics.median(times) * 1000, max(times) * 1000)
+        )
+
+    single, block, threaded = bench_feed(app, args, frames)
+    print("  feed(), one frame        %8.1f us/frame" % (single * 1e6))
+    print("  feed(), all at once      %8.1f us/frame" % (block * 1e6))
+    print("  feed(), %d threads        %8.1f us/frame" % (args.threads, threaded * 1e6))
+
+
+if __name__ == "__main__":
+    main()
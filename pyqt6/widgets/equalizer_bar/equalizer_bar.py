@@ -1,13 +1,66 @@
-from PyQt6.QtCore import QRect, QRectF, QSize, Qt, QTimer
-from PyQt6.QtGui import QBrush, QColor, QPainter
+import itertools
+
+import numpy as np
+from PyQt6.QtCore import QRect, QRectF, QSize, QTimer, pyqtSignal
+from PyQt6.QtGui import QBrush, QColor, QPainter, QPixmap
 from PyQt6.QtWidgets import QSizePolicy, QWidget
 
 
+class FrameRing:
+    """
+    A fixed size ring of frames (one value per bar), which any number of
+    producer threads write into and the GUI thread reads from, without locks.
+
+    A writer claims a slot by taking the next sequence number from an
+    itertools.count (atomic under the GIL), marks the slot unpublished,
+    copies its frame in and then publishes it by storing the sequence
+    number. The reader takes the peak of every frame published since it
+    last read, so bursts are never queued up, and frames overwritten
+    before they were read are simply dropped.
+    """
+
+    def __init__(self, size, width):
+        self.size = size
+        self.frames = np.zeros((size, width))
+        self.published = np.full(size, -1, np.int64)
+        self._sequence = itertools.count()
+        self._read = -1
+
+    def push(self, frame):
+        seq = next(self._sequence)
+        slot = seq % self.size
+        self.published[slot] = -1
+        self.frames[slot] = frame
+        self.published[slot] = seq
+
+    def drain(self):
+        """
+        Return the peak of the frames published since the last drain, or
+        None if there are none.
+        """
+        published = self.published.copy()
+        fresh = published > self._read
+        if not fresh.any():
+            return None
+        peak = self.frames[fresh].max(axis=0)
+        # Drop any frame which was rewritten while we read it.
+        if (self.published[fresh] != published[fresh]).any():
+            return None
+        self._read = published.max()
+        return peak
+
+
 class EqualizerBar(QWidget):
+    # Emitted (from any thread) the first time data is fed in, to start
+    # the frame timer on the GUI thread.
+    _feed_started = pyqtSignal()
+
     def __init__(self, bars, steps):
         super().__init__()
 
-        self.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.MinimumExpanding)
+        self.setSizePolicy(
+            QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.MinimumExpanding
+        )
 
         if isinstance(steps, list):
             # list of colours.
@@ -38,48 +91,101 @@ class EqualizerBar(QWidget):
         self._vmin = 0
         self._vmax = 100
 
-        # Current values are stored in a list.
-        self._values = [0.0] * bars
+        # Current values are stored in an array.
+        self._values = np.zeros(bars)
+
+        # Data fed in from other threads, shown at the frame rate.
+        self._ring = FrameRing(64, bars)
+        self._feeding = False
+        self._frame_timer = QTimer(self)
+        self._frame_timer.timeout.connect(self._show_fed)
+        self._feed_started.connect(self._frame_timer.start)
+        self.setFrameRate(60)
+
+        # The background, and every cell lit, drawn at the current size by
+        # _layout(). Each paint copies the lit part of each bar across.
+        self._background = None
+        self._lit = None
 
     def paintEvent(self, e):
+        if self._background is None or self._background.size() != self._pixmap_size():
+            self._layout()
+
         painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._background)
+
+        if self.n_steps:
+            ratio = self._lit.devicePixelRatio()
+            pc = (self._values - self._vmin) / (self._vmax - self._vmin)
+            lit = np.clip((pc * self.n_steps).astype(int), 0, self.n_steps)
+            for b in np.flatnonzero(lit):
+                x0, x1 = self._bar_x[b]
+                top = self._step_top[lit[b] - 1]
+                rect = QRect(x0, top, x1 - x0, self._bottom - top)
+                source = QRectF(
+                    rect.x() * ratio,
+                    rect.y() * ratio,
+                    rect.width() * ratio,
+                    rect.height() * ratio,
+                )
+                painter.drawPixmap(QRectF(rect), self._lit, source)
+
+        painter.end()
+
+    def _pixmap_size(self):
+        return self.size() * self.devicePixelRatioF()
 
-        brush = QBrush()
-        brush.setColor(self._background_color)
-        brush.setStyle(Qt.BrushStyle.SolidPattern)
-        rect = QRect(0, 0, painter.device().width(), painter.device().height())
-        painter.fillRect(rect, brush)
+    def _layout(self):
+        """
+        Work out where every cell goes at the current size, and draw the
+        background and fully lit pixmaps.
+        """
+        width, height = self.width(), self.height()
 
         # Define our canvas.
-        d_height = painter.device().height() - (self._padding * 2)
-        d_width = painter.device().width() - (self._padding * 2)
+        d_height = height - (self._padding * 2)
+        d_width = width - (self._padding * 2)
 
-        # Draw the bars.
-        step_y = d_height / self.n_steps
+        step_y = d_height / max(self.n_steps, 1)
         bar_height = step_y * self._y_solid_percent
-        bar_height_space = step_y * (1 - self._x_solid_percent) / 2
+        bar_height_space = step_y * (1 - self._y_solid_percent) / 2
 
         step_x = d_width / self.n_bars
         bar_width = step_x * self._x_solid_percent
-        bar_width_space = step_x * (1 - self._y_solid_percent) / 2
-
-        for b in range(self.n_bars):
-            # Calculate the y-stop position for this bar, from the value in range.
-            pc = (self._values[b] - self._vmin) / (self._vmax - self._vmin)
-            n_steps_to_draw = int(pc * self.n_steps)
-
-            for n in range(n_steps_to_draw):
-                brush.setColor(QColor(self.steps[n]))
-                rect = QRectF(
-                    self._padding + (step_x * b) + bar_width_space,
-                    self._padding + d_height - ((1 + n) * step_y) + bar_height_space,
-                    bar_width,
-                    bar_height,
-                )
-                painter.fillRect(rect, brush)
-
+        bar_width_space = step_x * (1 - self._x_solid_percent) / 2
+
+        # Cell edges, rounded to whole pixels so the lit part of a bar can
+        # be copied across exactly.
+        left = self._padding + step_x * np.arange(self.n_bars) + bar_width_space
+        self._bar_x = np.stack(
+            [np.round(left), np.round(left + bar_width)], axis=1
+        ).astype(int)
+        bottom = self._padding + d_height - step_y * np.arange(1, self.n_steps + 1)
+        self._step_top = np.round(bottom + bar_height_space).astype(int)
+        step_bottom = np.round(bottom + bar_height_space + bar_height).astype(int)
+        self._bottom = self._padding + d_height
+
+        ratio = self.devicePixelRatioF()
+        self._background = QPixmap(self._pixmap_size())
+        self._background.setDevicePixelRatio(ratio)
+        self._background.fill(self._background_color)
+
+        self._lit = QPixmap(self._background)
+        painter = QPainter(self._lit)
+        for n, color in enumerate(self.steps):
+            brush = QBrush(QColor(color))
+            top, cell_height = self._step_top[n], step_bottom[n] - self._step_top[n]
+            for x0, x1 in self._bar_x:
+                painter.fillRect(x0, top, x1 - x0, cell_height, brush)
         painter.end()
 
+    def _relayout(self):
+        self._background = None
+        self.update()
+
+    def resizeEvent(self, e):
+        self._background = None
+
     def sizeHint(self):
         return QSize(20, 120)
 
@@ -100,41 +206,67 @@ class EqualizerBar(QWidget):
             self._timer.start()
 
     def _decay_beat(self):
-        self._values = [max(0, v - self._decay) for v in self._values]
+        if not self._values.any():
+            return  # Nothing to decay, or redraw.
+        np.subtract(self._values, self._decay, out=self._values)
+        np.maximum(self._values, 0, out=self._values)
         self.update()  # Redraw new position.
 
     def setValues(self, v):
-        self._values = v
+        self._values = np.array(v, dtype=float).reshape(self.n_bars)
         self.update()
 
     def values(self):
-        return self._values
+        return self._values.tolist()
+
+    def feed(self, values):
+        """
+        Feed in new values, from any thread. Accepts one value per bar, or
+        an array with a row of them per frame.
+
+        Whatever has been fed in is shown at the frame rate, each bar at
+        its peak since the last frame.
+        """
+        frames = np.asarray(values, dtype=float).reshape(-1, self.n_bars)
+        for frame in frames:
+            self._ring.push(frame)
+        if not self._feeding:
+            self._feeding = True
+            self._feed_started.emit()
+
+    def setFrameRate(self, fps):
+        self._frame_timer.setInterval(int(1000 / fps))
+
+    def _show_fed(self):
+        peak = self._ring.drain()
+        if peak is not None:
+            self.setValues(peak)
 
     def setRange(self, vmin, vmax):
         assert float(vmin) < float(vmax)
         self._vmin, self._vmax = float(vmin), float(vmax)
 
     def setColor(self, color):
-        self.steps = [color] * self._bar.n_steps
-        self.update()
+        self.steps = [color] * self.n_steps
+        self._relayout()
 
     def setColors(self, colors):
         self.n_steps = len(colors)
         self.steps = colors
-        self.update()
+        self._relayout()
 
     def setBarPadding(self, i):
         self._padding = int(i)
-        self.update()
+        self._relayout()
 
     def setBarSolidXPercent(self, f):
         self._x_solid_percent = float(f)
-        self.update()
+        self._relayout()
 
     def setBarSolidYPercent(self, f):
         self._y_solid_percent = float(f)
-        self.update()
+        self._relayout()
 
     def setBackgroundColor(self, color):
         self._background_color = QColor(color)
-        self.update()
+        self._relayout()
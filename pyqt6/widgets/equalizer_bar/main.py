@@ -1,18 +1,39 @@
-import random
+import argparse
+import os
 import sys
 
-from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QApplication, QMainWindow
 
 from equalizer_bar import EqualizerBar
+from spectrum import PipeReader, SpectrumSource, WavReader
+
+SWEEP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sweep.wav")
+
+parser = argparse.ArgumentParser(description="Show the spectrum of some audio.")
+parser.add_argument(
+    "source",
+    nargs="?",
+    default=SWEEP,
+    help="a WAV file, or raw 16-bit PCM from a pipe or - for stdin "
+    "(default: the bundled sweep.wav, looped)",
+)
+parser.add_argument("--rate", type=int, default=44100, help="raw PCM sample rate")
+parser.add_argument("--channels", type=int, default=1, help="raw PCM channels")
+parser.add_argument("--fps", type=int, default=60)
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    help="play the source through once without showing a window, "
+    "then print the latency",
+)
 
 
 class Window(QMainWindow):
-    def __init__(self):
+    def __init__(self, reader, fps):
         super().__init__()
 
         self.equalizer = EqualizerBar(
-            5,
+            16,
             [
                 "#0C0786",
                 "#40039C",
@@ -31,18 +52,39 @@ class Window(QMainWindow):
         # self.equalizer.setBarSolidXPercent(0.4)
         self.setCentralWidget(self.equalizer)
 
-        self._timer = QTimer()
-        self._timer.setInterval(100)
-        self._timer.timeout.connect(self.update_values)
-        self._timer.start()
+        self.source = SpectrumSource(reader, self.equalizer, fps=fps)
 
-    def update_values(self):
-        self.equalizer.setValues(
-            [min(100, v + random.randint(0, 50) if random.randint(0, 5) > 2 else v) for v in self.equalizer.values()]
-        )
+
+args = parser.parse_args()
+if args.headless:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+if args.source.lower().endswith(".wav"):
+    reader = WavReader(args.source, loop=not args.headless)
+else:
+    reader = PipeReader(args.source, rate=args.rate, channels=args.channels)
+
+
+def failed(error):
+    print("Couldn't read %s: %s" % (args.source, error), file=sys.stderr)
+    app.exit(1)
 
 
 app = QApplication(sys.argv)
-w = Window()
-w.show()
-app.exec()
+w = Window(reader, args.fps)
+w.source.failed.connect(failed)
+if args.headless:
+    w.source.finished.connect(app.quit)
+    w.resize(400, 300)
+    w.grab()  # Paint once, so later frames are realistic.
+else:
+    w.show()
+w.source.start()
+if app.exec():
+    sys.exit(1)
+
+stats = w.source.latency()
+print(
+    "latency p50 {p50_ms:.2f} ms, p99 {p99_ms:.2f} ms, max {max_ms:.2f} ms; "
+    "{shown} frames shown, {dropped} dropped".format(**stats)
+)
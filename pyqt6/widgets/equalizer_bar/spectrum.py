@@ -0,0 +1,252 @@
+"""
+Audio spectrum sources for the EqualizerBar.
+
+A reader supplies PCM audio in chunks: WavReader from a WAV file (paced
+to play in real time), or PipeReader from raw PCM on a pipe or stdin, e.g.
+
+    arecord -f S16_LE -r 44100 -c 1 | python main.py -
+
+Anything else that iterates over mono float chunks and has a rate
+attribute works too.
+
+SpectrumSource reads the chunks on a worker thread and turns the most
+recent FFT_SIZE samples into the energy in each of the bar's bands with
+NumPy (Hann window, log spaced bands, in dB). A timer on the GUI thread
+passes the newest result to EqualizerBar.setValues() at a fixed frame
+rate. Results the GUI didn't get round to showing are dropped, never
+queued, so a slow frame can't make the display fall behind the audio.
+If the reader raises (it can't open its pipe, or the WAV is truncated or
+in an unsupported format) the source emits failed instead of finished.
+"""
+
+import statistics
+import sys
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+CHUNK_SIZE = 1024
+FFT_SIZE = 2048
+# Band range, and the level shown as an empty bar.
+MIN_FREQUENCY = 40
+MAX_FREQUENCY = 16000
+FLOOR_DB = -60
+
+
+def decode(data, sample_width, channels):
+    """
+    Convert interleaved little-endian PCM bytes to mono float samples
+    in -1 to 1.
+    """
+    if sample_width == 1:
+        samples = np.frombuffer(data, np.uint8).astype(np.float32) - 128
+    elif sample_width == 2:
+        samples = np.frombuffer(data, "<i2").astype(np.float32)
+    elif sample_width == 3:
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = (raw[:, 0] << 8 | raw[:, 1] << 16 | raw[:, 2] << 24) >> 8
+        samples = samples.astype(np.float32)
+    elif sample_width == 4:
+        samples = np.frombuffer(data, "<i4").astype(np.float32)
+    else:
+        raise ValueError("Unsupported sample width: %d" % sample_width)
+    samples /= 2 ** (8 * sample_width - 1)
+    if channels > 1:
+        samples = samples[: len(samples) // channels * channels]
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+class WavReader:
+    """
+    Reads a WAV file in chunks, as fast as it would play unless realtime
+    is False.
+    """
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE, realtime=True, loop=False):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.realtime = realtime
+        self.loop = loop
+        with wave.open(path, "rb") as f:
+            self.rate = f.getframerate()
+
+    def __iter__(self):
+        started = time.perf_counter()
+        played = 0
+        while True:
+            with wave.open(self.path, "rb") as f:
+                width, channels = f.getsampwidth(), f.getnchannels()
+                while True:
+                    data = f.readframes(self.chunk_size)
+                    if not data:
+                        break
+                    samples = decode(data, width, channels)
+                    played += len(samples)
+                    if self.realtime:
+                        # Wait until the last of these samples would have
+                        # been heard.
+                        delay = started + played / self.rate - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    yield samples
+            if not self.loop:
+                return
+
+
+class PipeReader:
+    """
+    Reads raw interleaved PCM from a binary stream, or a path (such as a
+    named pipe) or "-" for stdin. Reads block until audio arrives, so the
+    producer sets the pace.
+    """
+
+    def __init__(
+        self, stream, rate=44100, channels=1, sample_width=2, chunk_size=CHUNK_SIZE
+    ):
+        self.stream = stream
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        stream = self.stream
+        if stream == "-":
+            stream = sys.stdin.buffer
+        elif isinstance(stream, str):
+            stream = open(stream, "rb")
+        frame_bytes = self.channels * self.sample_width
+        size = self.chunk_size * frame_bytes
+        pending = b""
+        with stream:
+            while True:
+                data = stream.read(size - len(pending))
+                if not data:
+                    return
+                pending += data
+                if len(pending) == size:
+                    yield decode(pending, self.sample_width, self.channels)
+                    pending = b""
+
+
+def band_edges(bands, rate, fft_size=FFT_SIZE, fmin=MIN_FREQUENCY, fmax=MAX_FREQUENCY):
+    """
+    Return the FFT bin each of bands log spaced bands starts at, plus the
+    end of the last, with every band at least one bin wide.
+    """
+    fmax = min(fmax, rate / 2)
+    bins = np.geomspace(fmin, fmax, bands + 1) * fft_size / rate
+    edges = np.round(bins).astype(int)
+    edges[0] = max(edges[0], 1)
+    for n in range(1, len(edges)):
+        edges[n] = max(edges[n], edges[n - 1] + 1)
+    return edges
+
+
+class Spectrum:
+    """
+    Turns windows of FFT_SIZE samples into band levels, from 0 (FLOOR_DB
+    or quieter) to 100 (a full scale sine wave).
+    """
+
+    def __init__(self, bands, rate, fft_size=FFT_SIZE):
+        self.window = np.hanning(fft_size).astype(np.float32)
+        self.edges = band_edges(bands, rate, fft_size)
+        # The power of a full scale sine wave, windowed.
+        self.reference = (self.window.sum() / 2) ** 2
+
+    def levels(self, samples):
+        power = np.abs(np.fft.rfft(samples * self.window)) ** 2
+        power = power[: self.edges[-1]]
+        energy = np.add.reduceat(power, self.edges[:-1])
+        db = 10 * np.log10(energy / self.reference + 1e-12)
+        return np.clip((db - FLOOR_DB) * 100 / -FLOOR_DB, 0, 100)
+
+
+class SpectrumSource(QObject):
+    """
+    Shows the spectrum of the audio from reader on an EqualizerBar, at fps
+    frames per second.
+    """
+
+    # Emitted when the reader runs out of audio.
+    finished = pyqtSignal()
+    # Emitted with the error message if the reader or spectrum raises.
+    failed = pyqtSignal(str)
+
+    def __init__(self, reader, bar, fps=60, fft_size=FFT_SIZE, parent=None):
+        super().__init__(parent)
+        self.reader = reader
+        self.bar = bar
+        self.spectrum = Spectrum(bar.n_bars, reader.rate, fft_size)
+        self.fft_size = fft_size
+
+        # The newest levels, and when the audio they came from arrived.
+        # Replaced by the worker, taken by the timer.
+        self._latest = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.computed = 0
+        self.shown = 0
+        self.latencies = deque(maxlen=1000)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self._show)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.timer.start()
+
+    def stop(self):
+        self._stop.set()
+        self.timer.stop()
+
+    def _run(self):
+        buffer = np.zeros(self.fft_size, np.float32)
+        try:
+            for samples in self.reader:
+                arrived = time.perf_counter()
+                if self._stop.is_set():
+                    return
+                samples = samples[-self.fft_size :]
+                buffer = np.roll(buffer, -len(samples))
+                buffer[-len(samples) :] = samples
+                self._latest = (self.spectrum.levels(buffer), arrived)
+                self.computed += 1
+        except Exception as e:
+            self.failed.emit(str(e) or type(e).__name__)
+            return
+        self.finished.emit()
+
+    def _show(self):
+        latest, self._latest = self._latest, None
+        if latest is None:
+            return
+        levels, arrived = latest
+        self.bar.setValues(levels)
+        self.shown += 1
+        self.latencies.append(time.perf_counter() - arrived)
+
+    def latency(self):
+        """
+        :return: dict of p50, p99 and max milliseconds from audio arriving
+        to its levels reaching the bar, and how many results were shown
+        and dropped.
+        """
+        times = sorted(self.latencies) or [0.0]
+        return {
+            "p50_ms": statistics.median(times) * 1000,
+            "p99_ms": times[min(int(len(times) * 0.99), len(times) - 1)] * 1000,
+            "max_ms": times[-1] * 1000,
+            "shown": self.shown,
+            "dropped": self.computed - self.shown,
+        }
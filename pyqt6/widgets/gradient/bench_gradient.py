@@ -0,0 +1,73 @@
+"""
+Benchmark coloring arrays through a Gradient, as a colormap.
+
+Maps a frame of random values through Gradient.map() for a few dtypes,
+with the range found from the data (so NaNs and infinities are skipped)
+and given up front, and with 1% NaNs. Also times mapToImage(), and the
+first lut() after a change to the gradient.
+
+Run with: python bench_gradient.py [--size 3840x2160] [--rounds 10]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from gradient import Gradient
+from PyQt6.QtWidgets import QApplication
+
+
+def timed(fn, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="3840x2160")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = QApplication(sys.argv[:1])
+    gradient = Gradient()
+    gradient.setGradient([(0, "black"), (0.5, "red"), (1, "yellow")])
+
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((height, width))
+    with_nans = data.copy()
+    with_nans[rng.random(data.shape) < 0.01] = np.nan
+    cases = [
+        ("float64", data, {}),
+        ("float64, vmin/vmax", data, dict(vmin=-3, vmax=3)),
+        ("float64, 1% NaN", with_nans, {}),
+        ("float32", data.astype(np.float32), {}),
+        ("uint16", (data * 1000 + 32768).astype(np.uint16), {}),
+    ]
+
+    print("%dx%d values, median of %d:" % (width, height, args.rounds))
+    for label, values, kwargs in cases:
+        t = timed(lambda: gradient.map(values, **kwargs), args.rounds)
+        print("  map(), %-20s %8.1f ms" % (label, t * 1000))
+    t = timed(lambda: gradient.mapToImage(data), args.rounds)
+    print("  mapToImage(), float64      %8.1f ms" % (t * 1000))
+
+    def relut():
+        gradient.gradientChanged.emit()
+        gradient.lut()
+
+    t = timed(relut, args.rounds)
+    print("  lut() after a change       %8.3f ms" % (t * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,113 @@
 from PyQt6.QtCore import QRect, QRectF, QSize, Qt, pyqtSignal
-from PyQt6.QtGui import QColor, QLinearGradient, QPainter, QPen
+from PyQt6.QtGui import QColor, QImage, QLinearGradient, QPainter, QPen
 from PyQt6.QtWidgets import QColorDialog, QSizePolicy, QWidget
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Values colored by apply_lut() at a time.
+MAP_CHUNK_SIZE = 1 << 18
+
+
+def apply_lut(values, lut, vmin=None, vmax=None, *, nan_color=(0, 0, 0, 0)):
+    """
+    Color an array of values through an RGBA lookup table. Values at or
+    below vmin (including -inf) get the first entry, values at or above
+    vmax (including inf) the last, and NaNs get nan_color. If vmin and vmax
+    are equal, every value gets the first entry.
+
+    >>> lut = np.array([[0, 0, 0, 255], [255, 255, 255, 255]], np.uint8)
+    >>> apply_lut([0.0, np.nan, 0.9, 2.0], lut, 0, 1).tolist()
+    [[0, 0, 0, 255], [0, 0, 0, 0], [255, 255, 255, 255], [255, 255, 255, 255]]
+    >>> apply_lut([np.nan, 5.0, 7.0], lut, nan_color=(255, 0, 0, 128)).tolist()
+    [[255, 0, 0, 128], [0, 0, 0, 255], [255, 255, 255, 255]]
+    >>> apply_lut([np.inf, 0.0, 1.0, -np.inf], lut).tolist()
+    [[255, 255, 255, 255], [0, 0, 0, 255], [255, 255, 255, 255], [0, 0, 0, 255]]
+    >>> apply_lut(np.array([0, 2], np.uint8), lut, 1, 2).tolist()
+    [[0, 0, 0, 255], [255, 255, 255, 255]]
+    >>> apply_lut(np.empty((0, 3)), lut).shape
+    (0, 3, 4)
+
+    :param values: array-like of numbers, any shape.
+    :param lut: (size, 4) uint8 array of RGBA colors, as from Gradient.lut().
+    :param vmin: value for the first entry, defaults to the smallest of
+        values, ignoring NaNs and infinities.
+    :param vmax: value for the last entry, defaults to the largest of
+        values, ignoring NaNs and infinities.
+    :param nan_color: (r, g, b, a) for NaN values.
+    :return: uint8 array of RGBA colors, of shape values.shape + (4,).
+    """
+    values = np.asarray(values)
+    if not values.size:
+        return np.empty(values.shape + (4,), np.uint8)
+    if vmin is None or vmax is None:
+        # fmin and fmax skip NaNs.
+        low = float(np.fmin.reduce(values, axis=None))
+        high = float(np.fmax.reduce(values, axis=None))
+        if not (np.isfinite(low) and np.isfinite(high)):
+            # Only look for infinities to leave out if there are any.
+            finite = np.isfinite(values)
+            if finite.any():
+                low = values.min(where=finite, initial=np.inf)
+                high = values.max(where=finite, initial=-np.inf)
+            else:
+                low = high = 0.0
+        vmin = low if vmin is None else vmin
+        vmax = high if vmax is None else vmax
+    size = len(lut)
+    scale = (size - 1) / (vmax - vmin) if vmax > vmin else 0.0
+    # Look colors up as one 32-bit value each, rather than 4 bytes.
+    lut = np.ascontiguousarray(lut, np.uint8).view(np.uint32).ravel()
+    nan_value = np.array(nan_color, np.uint8).view(np.uint32)[0]
+    # Only floats can be NaN, so don't look for them in anything else.
+    has_nan = values.dtype.kind == "f"
+    if not has_nan:
+        # Subtract as float64, so unsigned values below vmin don't wrap.
+        vmin = np.float64(vmin)
+
+    # Work through the values in chunks, reusing the same small buffers,
+    # rather than allocating several temporary arrays as big as values.
+    flat = values.reshape(-1)
+    colors = np.empty(flat.size, np.uint32)
+    chunk = min(flat.size, MAP_CHUNK_SIZE)
+    index = np.empty(chunk, np.float32)
+    ints = np.empty(chunk, np.intp)
+    for start in range(0, flat.size, chunk):
+        end = min(start + chunk, flat.size)
+        i, n = index[: end - start], ints[: end - start]
+        if scale:
+            np.subtract(flat[start:end], vmin, out=i, casting="unsafe")
+            i *= scale
+        else:
+            # Not scaled by 0, which would turn infinities into NaNs.
+            i[...] = 0
+        if has_nan:
+            nans = np.isnan(i if scale else flat[start:end])
+            # Look NaNs up as anything, then replace them.
+            i[nans] = 0
+        # Infinities land on the ends here.
+        np.clip(i, 0, size - 1, out=i)
+        i += 0.5
+        np.copyto(n, i, casting="unsafe")
+        out = colors[start:end]
+        lut.take(n, out=out)
+        if has_nan:
+            out[nans] = nan_value
+    return colors.view(np.uint8).reshape(values.shape + (4,))
+
 
 class Gradient(QWidget):
+    """
+    An editor for a linear gradient, made of stops of (position, color).
+
+    The gradient can also be used as a colormap: lut() compiles it into an
+    RGBA lookup table, and map() colors arrays of values through that, NaNs
+    included. Both need numpy installed. Tables are cached until
+    gradientChanged fires.
+    """
+
     gradientChanged = pyqtSignal()
 
     def __init__(self, gradient=None):
@@ -28,6 +132,10 @@ class Gradient(QWidget):
 
         self._drag_position = None
 
+        # Lookup tables built by lut(), by size.
+        self._luts = {}
+        self.gradientChanged.connect(self._luts.clear)
+
     def paintEvent(self, e):
         painter = QPainter(self)
         width = painter.device().width()
@@ -93,6 +201,65 @@ class Gradient(QWidget):
     def gradient(self):
         return self._gradient
 
+    def lut(self, size=256):
+        """
+        Return the gradient sampled at size evenly spaced points from 0 to 1,
+        interpolating each channel linearly between stops.
+
+        :param size: number of entries.
+        :return: (size, 4) uint8 array of RGBA colors. Shared, don't modify it.
+        """
+        if np is None:
+            raise ImportError("Gradient.lut() needs numpy installed")
+        if size not in self._luts:
+            stops = sorted(self._gradient, key=lambda g: g[0])
+            positions = [stop for stop, _ in stops]
+            colors = [QColor(color).getRgb() for _, color in stops]
+            x = np.linspace(0.0, 1.0, size)
+            lut = np.empty((size, 4), np.uint8)
+            for channel in range(4):
+                values = [color[channel] for color in colors]
+                lut[:, channel] = np.rint(np.interp(x, positions, values))
+            lut.flags.writeable = False
+            self._luts[size] = lut
+        return self._luts[size]
+
+    def map(self, values, vmin=None, vmax=None, *, size=256, nan_color=None):
+        """
+        Color an array of values through the gradient. Values at or below
+        vmin get the first color, values at or above vmax the last. See
+        apply_lut().
+
+        :param values: array-like of numbers, any shape.
+        :param vmin: value for the start of the gradient, defaults to the
+            smallest of values, ignoring NaNs and infinities.
+        :param vmax: value for the end of the gradient, defaults to the
+            largest of values, ignoring NaNs and infinities.
+        :param size: number of entries in the lookup table used.
+        :param nan_color: color for NaN values, transparent by default.
+        :return: uint8 array of RGBA colors, of shape values.shape + (4,).
+        """
+        lut = self.lut(size)
+        if nan_color is not None:
+            nan_color = QColor(nan_color).getRgb()
+            return apply_lut(values, lut, vmin, vmax, nan_color=nan_color)
+        return apply_lut(values, lut, vmin, vmax)
+
+    def mapToImage(self, values, vmin=None, vmax=None, *, size=256, nan_color=None):
+        """
+        Color a 2D array of values through the gradient, as a QImage of
+        the same width and height. See map().
+        """
+        colors = np.ascontiguousarray(
+            self.map(values, vmin, vmax, size=size, nan_color=nan_color)
+        )
+        height, width = colors.shape[:2]
+        image = QImage(
+            colors.data, width, height, width * 4, QImage.Format.Format_RGBA8888
+        )
+        # Copy, so the image doesn't depend on the array.
+        return image.copy()
+
     @property
     def _end_stops(self):
         return [0, len(self._gradient) - 1]
@@ -177,6 +344,7 @@ class Gradient(QWidget):
             _, color = self._gradient[self._drag_position]
             self._gradient[self._drag_position] = stop, color
             self._constrain_gradient()
+            self.gradientChanged.emit()
             self.update()
 
     def mouseDoubleClickEvent(self, e):
@@ -0,0 +1,112 @@
+"""
+Benchmark drawing with the mouse on a PaintWidget, for each engine.
+
+Sends the same wandering mouse drag to a widget using each engine, and
+reports the time spent per mouse move, both in the move handler alone and
+including the repaints (processed once per 60 Hz frame, as a 1000 Hz mouse
+would deliver them), plus the time to draw the same points with
+drawStroke().
+
+Run with: python bench_paint.py [--moves 5000] [--size 800x600] [--width 4]
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QEvent, QPointF, Qt
+from PyQt6.QtGui import QMouseEvent
+from PyQt6.QtWidgets import QApplication
+
+from paint import PaintWidget
+
+ENGINES = ["qpainter", "numpy"]
+
+# Mouse moves per frame, for a 1000 Hz mouse at 60 Hz.
+MOVES_PER_FRAME = 16
+
+
+def wander(n, width, height, seed=0):
+    rng = random.Random(seed)
+    x, y = width / 2, height / 2
+    angle = 0.0
+    points = []
+    for _ in range(n):
+        angle += rng.gauss(0, 0.2)
+        x = min(max(x + 2 * math.cos(angle), 0), width - 1)
+        y = min(max(y + 2 * math.sin(angle), 0), height - 1)
+        points.append((x, y))
+    return points
+
+
+def move_event(x, y):
+    pos = QPointF(x, y)
+    return QMouseEvent(
+        QEvent.Type.MouseMove,
+        pos,
+        pos,
+        Qt.MouseButton.NoButton,
+        Qt.MouseButton.LeftButton,
+        Qt.KeyboardModifier.NoModifier,
+    )
+
+
+def bench(app, engine, points, width, height, pen_width):
+    widget = PaintWidget(width, height, engine=engine)
+    widget.setPenWidth(pen_width)
+    widget.show()
+    app.processEvents()
+
+    events = [move_event(x, y) for x, y in points]
+    handler = []
+    start = time.perf_counter()
+    for n, e in enumerate(events):
+        t = time.perf_counter()
+        widget.mouseMoveEvent(e)
+        handler.append(time.perf_counter() - t)
+        if n % MOVES_PER_FRAME == 0:
+            app.processEvents()
+    widget.mouseReleaseEvent(e)
+    app.processEvents()
+    total = (time.perf_counter() - start) / len(events)
+
+    start = time.perf_counter()
+    widget.drawStroke(points)
+    app.processEvents()
+    stroke = time.perf_counter() - start
+
+    widget.close()
+    return statistics.median(handler), total, stroke
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--moves", type=int, default=5000)
+    parser.add_argument("--size", default="800x600")
+    parser.add_argument("--width", type=int, default=4)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = QApplication(sys.argv)
+    points = wander(args.moves, width, height)
+    print("%d moves on %dx%d, pen width %d:" % (args.moves, width, height, args.width))
+    print(
+        "  %-10s %12s %16s %12s"
+        % ("engine", "handler p50", "with repaints", "drawStroke")
+    )
+    for engine in ENGINES:
+        handler, total, stroke = bench(app, engine, points, width, height, args.width)
+        print(
+            "  %-10s %9.3f ms %10.3f ms/move %9.1f ms"
+            % (engine, handler * 1000, total * 1000, stroke * 1000)
+        )
+
+
+if __name__ == "__main__":
+    main()
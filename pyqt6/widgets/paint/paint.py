@@ -1,21 +1,62 @@
-from PyQt6.QtCore import QPoint, QPointF, Qt
-from PyQt6.QtGui import QBrush, QColor, QPainter, QPen, QPixmap
+from PyQt6.QtCore import QPoint, QPointF, QRect, Qt
+from PyQt6.QtGui import QBrush, QColor, QImage, QPainter, QPen, QPixmap, QPolygonF
 from PyQt6.QtWidgets import QLabel
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class PaintWidget(QLabel):
-    def __init__(self, width, height, background="white", *args, **kwargs):
+    """
+    A bitmap canvas to draw on with the mouse.
+
+    With engine="numpy" strokes are rasterised (anti-aliased, with round
+    caps) straight into the canvas image's pixels through a NumPy view of
+    them, and only the rect each segment covers is repainted, instead of
+    drawing with a new QPainter and re-setting the whole pixmap on every
+    mouse move. This needs numpy installed.
+
+    Either way, drawStroke() draws a whole array of points at once, e.g.
+    to replay recorded handwriting. Both engines draw it as one QPainter
+    polyline, which is many times faster for a long stroke than blending
+    it in a segment at a time. pixmap() and setPixmap() get and replace
+    the canvas. With the numpy engine they copy to and from the canvas
+    image, so changes to the returned pixmap only show once it's set back.
+
+    Run bench_paint.py to compare the two engines.
+    """
+
+    def __init__(
+        self, width, height, background="white", *args, engine="qpainter", **kwargs
+    ):
         super().__init__(*args, **kwargs)
-        pixmap = QPixmap(width, height)
-
-        # Fill the canvas with the initial color.
-        painter = QPainter(pixmap)
-        brush = QBrush()
-        brush.setColor(QColor(background))
-        brush.setStyle(Qt.BrushStyle.SolidPattern)
-        painter.fillRect(0, 0, pixmap.width(), pixmap.height(), brush)
-        painter.end()
-        self.setPixmap(pixmap)
+        if engine not in ("qpainter", "numpy"):
+            raise ValueError("engine must be 'qpainter' or 'numpy'")
+        if engine == "numpy" and np is None:
+            raise ImportError("engine='numpy' needs numpy installed")
+        self._engine = engine
+
+        if engine == "numpy":
+            self._image = QImage(width, height, QImage.Format.Format_RGB32)
+            self._image.fill(QColor(background))
+            self._bind_pixels()
+            # The coverage of the current stroke so far, per pixel, so where
+            # its segments overlap the colour is only blended in once.
+            self._coverage = None
+            self._stroke_rect = QRect()
+        else:
+            pixmap = QPixmap(width, height)
+
+            # Fill the canvas with the initial color.
+            painter = QPainter(pixmap)
+            brush = QBrush()
+            brush.setColor(QColor(background))
+            brush.setStyle(Qt.BrushStyle.SolidPattern)
+            painter.fillRect(0, 0, pixmap.width(), pixmap.height(), brush)
+            painter.end()
+            self.setPixmap(pixmap)
 
         self.last_x, self.last_y = None, None
         self._pen_color = QColor("#000000")
@@ -27,24 +68,84 @@ class PaintWidget(QLabel):
     def setPenWidth(self, w):
         self._pen_width = int(w)
 
+    def _bind_pixels(self):
+        """
+        Point _pixels at the image's pixels, as a (height, width, 4) array
+        sharing its memory. Each pixel is a native-endian 0xAARRGGBB value.
+
+        A QPainter on the image may move its pixels (if they were shared),
+        so this must be called again after painting on it.
+        """
+        bits = self._image.bits()
+        bits.setsize(self._image.sizeInBytes())
+        self._pixels = np.frombuffer(bits, np.uint8).reshape(
+            self._image.height(), self._image.bytesPerLine() // 4, 4
+        )[:, : self._image.width()]
+
+    def pixmap(self):
+        if self._engine == "numpy":
+            # Copy, as a pixmap from an image can share its pixels, and
+            # would change with every stroke.
+            return QPixmap.fromImage(self._image.copy())
+        return super().pixmap()
+
+    def setPixmap(self, pixmap):
+        if self._engine != "numpy":
+            super().setPixmap(pixmap)
+            return
+        painter = QPainter(self._image)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        painter.drawPixmap(0, 0, pixmap)
+        painter.end()
+        self._bind_pixels()
+        self.update()
+
+    def image(self):
+        """
+        Return a copy of the canvas.
+        """
+        if self._engine == "numpy":
+            return self._image.copy()
+        return self.pixmap().toImage()
+
+    def sizeHint(self):
+        if self._engine == "numpy":
+            return self._image.size()
+        return super().sizeHint()
+
+    def paintEvent(self, e):
+        if self._engine != "numpy":
+            super().paintEvent(e)
+            return
+        painter = QPainter(self)
+        rect = e.rect()
+        painter.drawImage(rect.topLeft(), self._image, rect)
+        painter.end()
+
     def mouseMoveEvent(self, e):
         if self.last_x is None:  # First event.
             self.last_x = e.position().x()
             self.last_y = e.position().y()
-            return  #  Ignore the first time.
-
-        pixmap = self.pixmap()
-        painter = QPainter(pixmap)
-        p = painter.pen()
-        p.setWidth(self._pen_width)
-        p.setColor(self._pen_color)
-        painter.setPen(p)
-        painter.drawLine(
-            QPointF(self.last_x, self.last_y),
-            QPointF(e.position().x(), e.position().y()),
-        )
-        painter.end()
-        self.setPixmap(pixmap)
+            return  #  Ignore the first time.
+
+        if self._engine == "numpy":
+            rect = self._draw_segment(
+                self.last_x, self.last_y, e.position().x(), e.position().y()
+            )
+            self.update(rect)
+        else:
+            pixmap = self.pixmap()
+            painter = QPainter(pixmap)
+            p = painter.pen()
+            p.setWidth(self._pen_width)
+            p.setColor(self._pen_color)
+            painter.setPen(p)
+            painter.drawLine(
+                QPointF(self.last_x, self.last_y),
+                QPointF(e.position().x(), e.position().y()),
+            )
+            painter.end()
+            self.setPixmap(pixmap)
 
         # Update the origin for next time.
         self.last_x = e.position().x()
@@ -57,11 +158,119 @@ class PaintWidget(QLabel):
     def mouseReleaseEvent(self, e):
         self.last_x = None
         self.last_y = None
+        if self._engine == "numpy":
+            self._end_stroke()
+
+    def drawStroke(self, points, color=None, width=None):
+        """
+        Draw a stroke through a sequence of points, as if drawn with the
+        mouse, and repaint the area it covers once.
+
+        :param points: (N, 2) array-like of x, y positions.
+        :param color: pen color, defaults to the current one.
+        :param width: pen width, defaults to the current one.
+        """
+        pen_color, pen_width = self._pen_color, self._pen_width
+        if color is not None:
+            self._pen_color = QColor(color)
+        if width is not None:
+            self._pen_width = int(width)
+        try:
+            self._draw_stroke(points)
+        finally:
+            self._pen_color, self._pen_width = pen_color, pen_width
+
+    def _draw_stroke(self, points):
+        polygon = QPolygonF([QPointF(float(x), float(y)) for x, y in points])
+        if polygon.isEmpty():
+            return
+        if self._engine == "numpy":
+            painter = QPainter(self._image)
+        else:
+            pixmap = self.pixmap()
+            painter = QPainter(pixmap)
+        pen = QPen(self._pen_color, self._pen_width)
+        pen.setCapStyle(Qt.PenCapStyle.RoundCap)
+        pen.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
+        painter.setPen(pen)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if polygon.count() == 1:
+            painter.drawPoint(polygon[0])
+        else:
+            painter.drawPolyline(polygon)
+        painter.end()
+        if self._engine == "numpy":
+            self._bind_pixels()
+            pad = self._pen_width // 2 + 2
+            self.update(
+                polygon.boundingRect().toAlignedRect().adjusted(-pad, -pad, pad, pad)
+            )
+        else:
+            self.setPixmap(pixmap)
+
+    def _draw_segment(self, x0, y0, x1, y1):
+        """
+        Blend a round capped line into the image, and return the QRect it
+        covers.
+        """
+        h, w = self._pixels.shape[:2]
+        radius = self._pen_width / 2
+        pad = radius + 1
+        left = max(int(min(x0, x1) - pad), 0)
+        top = max(int(min(y0, y1) - pad), 0)
+        right = min(int(max(x0, x1) + pad) + 1, w)
+        bottom = min(int(max(y0, y1) + pad) + 1, h)
+        if left >= right or top >= bottom:
+            return QRect()
+
+        # Distance from each pixel centre to the segment.
+        ys, xs = np.ogrid[top:bottom, left:right]
+        px = xs + 0.5 - x0
+        py = ys + 0.5 - y0
+        dx, dy = x1 - x0, y1 - y0
+        length2 = dx * dx + dy * dy
+        if length2:
+            t = np.clip((px * dx + py * dy) / length2, 0, 1)
+            px = px - t * dx
+            py = py - t * dy
+        coverage = np.clip(radius + 0.5 - np.hypot(px, py), 0, 1).astype(np.float32)
+
+        if self._coverage is None:
+            self._coverage = np.zeros((h, w), np.float32)
+        old = self._coverage[top:bottom, left:right]
+        new = np.maximum(old, coverage)
+
+        # Blending in alpha * coverage, having already blended in
+        # alpha * old, takes this fraction of what's left.
+        alpha = self._pen_color.alphaF()
+        remaining = 1 - alpha * old
+        amount = np.divide(
+            alpha * (new - old),
+            remaining,
+            out=np.zeros_like(remaining),
+            where=remaining > 0,
+        )
+        old[...] = new
+
+        color = np.array([self._pen_color.rgb()], np.uint32).view(np.uint8)
+        pixels = self._pixels[top:bottom, left:right]
+        blended = pixels + (color - pixels.astype(np.float32)) * amount[..., None]
+        pixels[...] = np.rint(blended)
+
+        rect = QRect(left, top, right - left, bottom - top)
+        self._stroke_rect = self._stroke_rect.united(rect)
+        return rect
+
+    def _end_stroke(self):
+        if self._coverage is not None and not self._stroke_rect.isEmpty():
+            r = self._stroke_rect
+            self._coverage[r.top() : r.bottom() + 1, r.left() : r.right() + 1] = 0
+        self._stroke_rect = QRect()
 
     def _flood_fill_from_event(self, e):
-        image = self.pixmap().toImage()
+        image = self.image()
         w, h = image.width(), image.height()
-        x, y = e.position().x(), e.position().y()
+        x, y = int(e.position().x()), int(e.position().y())
 
         # Get our target color from origin.
         target_color = image.pixel(x, y)
@@ -87,8 +296,11 @@ class PaintWidget(QLabel):
             return points
 
         # Now perform the search and fill.
-        pixmap = self.pixmap()
-        painter = QPainter(pixmap)
+        if self._engine == "numpy":
+            painter = QPainter(self._image)
+        else:
+            pixmap = self.pixmap()
+            painter = QPainter(pixmap)
         painter.setPen(QPen(self._pen_color))
 
         while queue:
@@ -97,4 +309,9 @@ class PaintWidget(QLabel):
                 painter.drawPoint(QPoint(x, y))
                 queue.extend(get_cardinal_points(have_seen, (x, y)))
 
-        self.setPixmap(pixmap)
+        painter.end()
+        if self._engine == "numpy":
+            self._bind_pixels()
+            self.update()
+        else:
+            self.setPixmap(pixmap)
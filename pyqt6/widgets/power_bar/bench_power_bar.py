@@ -0,0 +1,106 @@
+"""
+Benchmark a panel of PowerBars all changing value every frame.
+
+Lays out 100 PowerBars, and for each frame gives every bar a new value
+through PowerBar.setValues() and lets the event loop apply and paint
+them. Each bar repaints only the steps between its old and new values;
+with --full every bar is repainted whole as well, as it used to be, for
+comparison.
+
+It then checks that repainting only the changed steps left exactly the
+pixels a full repaint draws: the window's backing store is read back
+from the screen, the whole window is repainted, and the two are compared.
+
+Run with: python bench_power_bar.py [--bars 100] [--frames 120] [--full]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from power_bar import PowerBar
+from PyQt6.QtWidgets import QApplication, QGridLayout, QWidget
+
+COLORS = [
+    "#053061",
+    "#2166ac",
+    "#4393c3",
+    "#92c5de",
+    "#d1e5f0",
+    "#f7f7f7",
+    "#fddbc7",
+    "#f4a582",
+    "#d6604d",
+    "#b2182b",
+    "#67001f",
+]
+COLUMNS = 20
+
+
+def frame(app, bars, values, full):
+    start = time.perf_counter()
+    PowerBar.setValues(zip(bars, values))
+    if full:
+        for bar in bars:
+            bar._bar.update()
+    app.processEvents()
+    return time.perf_counter() - start
+
+
+def snapshot(app, window):
+    """
+    Read the window's pixels back as they are, without repainting.
+    """
+    return app.primaryScreen().grabWindow(window.winId()).toImage()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--full", action="store_true")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    window = QWidget()
+    layout = QGridLayout(window)
+    bars = []
+    for n in range(args.bars):
+        bar = PowerBar(COLORS)
+        layout.addWidget(bar, n // COLUMNS, n % COLUMNS)
+        bars.append(bar)
+    window.resize(1600, 1000)
+    window.show()
+    app.processEvents()
+
+    rng = random.Random(0)
+    times = [
+        frame(app, bars, [rng.randrange(100) for _ in bars], args.full)
+        for _ in range(args.frames)
+    ]
+
+    incremental = snapshot(app, window)
+    window.repaint()
+    repainted = snapshot(app, window)
+
+    print(
+        "%d bars, %d frames, %s:"
+        % (args.bars, args.frames, "full repaints" if args.full else "changed steps")
+    )
+    print(
+        "  per frame  p50 %6.2f ms   max %6.2f ms"
+        % (statistics.median(times) * 1000, max(times) * 1000)
+    )
+    print(
+        "  pixels %s a full repaint"
+        % ("match" if incremental == repainted else "DIFFER from")
+    )
+
+
+if __name__ == "__main__":
+    main()
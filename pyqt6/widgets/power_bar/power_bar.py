@@ -1,4 +1,4 @@
-from PyQt6.QtCore import QRect, QRectF, QSize, Qt, pyqtSignal
+from PyQt6.QtCore import QRectF, QSize, QTimer, pyqtSignal
 from PyQt6.QtGui import QBrush, QColor, QPainter
 from PyQt6.QtWidgets import QDial, QSizePolicy, QVBoxLayout, QWidget
 
@@ -31,61 +31,102 @@ class _Bar(QWidget):
         self._background_color = QColor("black")
         self._padding = 4.0  # n-pixel gap around edge.
 
+        # The dial's state, kept up to date by PowerBar so painting doesn't
+        # have to ask the dial for it.
+        self._vmin, self._vmax, self._value = 0, 99, 0
+        self._lit = 0
+
+        # A brush and rect for each step, built by _layout() when first
+        # needed after a resize or change of style.
+        self._brushes = None
+        self._rects = None
+
     def paintEvent(self, e):
+        if self._rects is None:
+            self._layout()
+
         painter = QPainter(self)
+        painter.fillRect(e.rect(), self._background_color)
 
-        brush = QBrush()
-        brush.setColor(self._background_color)
-        brush.setStyle(Qt.BrushStyle.SolidPattern)
-        rect = QRect(0, 0, painter.device().width(), painter.device().height())
-        painter.fillRect(rect, brush)
+        # Only the steps that changed are repainted, everything else is
+        # clipped away.
+        area = QRectF(e.rect())
+        for n in range(self._lit):
+            if self._rects[n].intersects(area):
+                painter.fillRect(self._rects[n], self._brushes[n])
 
-        # Get current state.
-        parent = self.parent()
-        vmin, vmax = parent.minimum(), parent.maximum()
-        value = parent.value()
+        painter.end()
 
-        # Define our canvas.
-        d_height = painter.device().height() - (self._padding * 2)
-        d_width = painter.device().width() - (self._padding * 2)
+    def _layout(self):
+        """
+        Build the brush and rect for every step, at the current size.
+        """
+        d_height = self.height() - (self._padding * 2)
+        d_width = self.width() - (self._padding * 2)
 
-        # Draw the bars.
         step_size = d_height / self.n_steps
         bar_height = step_size * self._bar_solid_percent
         bar_spacer = step_size * (1 - self._bar_solid_percent) / 2
 
-        # Calculate the y-stop position, from the value in range.
-        pc = (value - vmin) / (vmax - vmin)
-        n_steps_to_draw = int(pc * self.n_steps)
-
-        for n in range(n_steps_to_draw):
-            brush.setColor(QColor(self.steps[n]))
-            rect = QRectF(
+        self._brushes = [QBrush(QColor(color)) for color in self.steps]
+        self._rects = [
+            QRectF(
                 self._padding,
                 self._padding + d_height - ((1 + n) * step_size) + bar_spacer,
                 d_width,
                 bar_height,
             )
-            painter.fillRect(rect, brush)
+            for n in range(self.n_steps)
+        ]
 
-        painter.end()
+    def _relayout(self):
+        self._rects = None
+        self._lit = self._steps_lit()
+        self.update()
+
+    def resizeEvent(self, e):
+        self._rects = None
 
     def sizeHint(self):
         return QSize(40, 120)
 
+    def _steps_lit(self):
+        # Calculate the y-stop position, from the value in range.
+        if self._vmax == self._vmin:
+            return 0
+        pc = (self._value - self._vmin) / (self._vmax - self._vmin)
+        return min(max(int(pc * self.n_steps), 0), self.n_steps)
+
+    def _set_range(self, vmin, vmax):
+        self._vmin, self._vmax = vmin, vmax
+        self._relayout()
+
+    def _set_value(self, value):
+        self._value = value
+        lit = self._steps_lit()
+        if lit == self._lit:
+            return
+        low, high = sorted((self._lit, lit))
+        self._lit = lit
+        if self._rects is None:
+            self.update()
+            return
+        # Repaint the steps between the old and new values.
+        area = self._rects[low].united(self._rects[high - 1])
+        self.update(area.toAlignedRect())
+
     def _trigger_refresh(self):
         self.update()
 
     def _calculate_clicked_value(self, e):
-        parent = self.parent()
-        vmin, vmax = parent.minimum(), parent.maximum()
-        d_height = self.size().height() + (self._padding * 2)
+        vmin, vmax = self._vmin, self._vmax
+        d_height = self.size().height() - (self._padding * 2)
         step_size = d_height / self.n_steps
-        click_y = e.y() - self._padding - step_size / 2
+        click_y = e.position().y() - self._padding - step_size / 2
 
         pc = (d_height - click_y) / d_height
         value = vmin + pc * (vmax - vmin)
-        self.clickedValue.emit(value)
+        self.clickedValue.emit(round(value))
 
     def mouseMoveEvent(self, e):
         self._calculate_clicked_value(e)
@@ -103,6 +144,9 @@ class PowerBar(QWidget):
     right-clicking resets the color to None (no-color).
     """
 
+    # Values waiting for setValues() to apply them, by bar.
+    _pending = {}
+
     def __init__(self, steps=5):
         super().__init__()
 
@@ -115,7 +159,10 @@ class PowerBar(QWidget):
         self._dial = QDial()
         self._dial.setNotchesVisible(True)
         self._dial.setWrapping(False)
-        self._dial.valueChanged.connect(self._bar._trigger_refresh)
+        self._dial.valueChanged.connect(self._bar._set_value)
+        self._dial.rangeChanged.connect(self._bar._set_range)
+        self._bar._set_range(self._dial.minimum(), self._dial.maximum())
+        self._bar._set_value(self._dial.value())
 
         # Take feedback from click events on the meter.
         self._bar.clickedValue.connect(self._dial.setValue)
@@ -130,24 +177,47 @@ class PowerBar(QWidget):
         try:
             return getattr(self._dial, name)
         except AttributeError:
-            raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, name))
+            raise AttributeError(
+                "'{}' object has no attribute '{}'".format(
+                    self.__class__.__name__, name
+                )
+            )
+
+    @staticmethod
+    def setValues(values):
+        """
+        Set the values of many PowerBars together, in the next tick of the
+        event loop, so they all repaint at once. If a bar is given another
+        value before then, only the latest is used.
+
+        :param values: dict of {PowerBar: value}, or (PowerBar, value) pairs.
+        """
+        if not PowerBar._pending:
+            QTimer.singleShot(0, PowerBar._apply_pending)
+        PowerBar._pending.update(values)
+
+    @staticmethod
+    def _apply_pending():
+        pending, PowerBar._pending = PowerBar._pending, {}
+        for bar, value in pending.items():
+            bar._dial.setValue(value)
 
     def setColor(self, color):
         self._bar.steps = [color] * self._bar.n_steps
-        self._bar.update()
+        self._bar._relayout()
 
     def setColors(self, colors):
         self._bar.n_steps = len(colors)
         self._bar.steps = colors
-        self._bar.update()
+        self._bar._relayout()
 
     def setBarPadding(self, i):
         self._bar._padding = int(i)
-        self._bar.update()
+        self._bar._relayout()
 
     def setBarSolidPercent(self, f):
         self._bar._bar_solid_percent = float(f)
-        self._bar.update()
+        self._bar._relayout()
 
     def setBackgroundColor(self, color):
         self._bar._background_color = QColor(color)
@@ -1 +1 @@
-from .toggle import Toggle, AnimatedToggle
+from .toggle import Toggle, AnimatedToggle, ToggleAnimator
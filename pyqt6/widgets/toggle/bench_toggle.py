@@ -0,0 +1,107 @@
+"""
+Benchmark flipping a panel of AnimatedToggles all at once ("select all").
+
+Fills a window with toggles, checks every one, and lets the animations
+run to the end. It reports how long creating and checking them took, and
+the CPU time and paints used while they animated. With --scroll the
+toggles are in a small scroll area, so most of them can't be seen.
+
+Run with: python bench_toggle.py [--toggles 1000] [--rounds 3] [--scroll]
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QEventLoop, QTimer
+from PyQt6.QtWidgets import QApplication, QGridLayout, QScrollArea, QWidget
+from toggle import AnimatedToggle
+
+COLUMNS = 40
+
+# Long enough for the handle and pulse animations to finish.
+SETTLE_MS = 700
+
+
+class CountingToggle(AnimatedToggle):
+    paints = 0
+
+    def paintEvent(self, e):
+        CountingToggle.paints += 1
+        super().paintEvent(e)
+
+
+def build(count, scroll):
+    panel = QWidget()
+    layout = QGridLayout(panel)
+    toggles = []
+    for n in range(count):
+        toggle = CountingToggle()
+        layout.addWidget(toggle, n // COLUMNS, n % COLUMNS)
+        toggles.append(toggle)
+
+    if scroll:
+        window = QScrollArea()
+        window.setWidget(panel)
+        window.resize(800, 600)
+    else:
+        window = panel
+        window.resize(panel.sizeHint())
+    window.show()
+    return window, toggles
+
+
+def settle(app):
+    loop = QEventLoop()
+    QTimer.singleShot(SETTLE_MS, loop.quit)
+    loop.exec()
+    app.processEvents()
+
+
+def flip(app, toggles, checked):
+    CountingToggle.paints = 0
+    cpu = time.process_time()
+    start = time.perf_counter()
+    for toggle in toggles:
+        toggle.setChecked(checked)
+    set_time = time.perf_counter() - start
+    settle(app)
+    return set_time, time.process_time() - cpu, CountingToggle.paints
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--toggles", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--scroll", action="store_true")
+    args = parser.parse_args()
+
+    app = QApplication([])
+    start = time.perf_counter()
+    window, toggles = build(args.toggles, args.scroll)
+    build_time = time.perf_counter() - start
+    settle(app)
+
+    results = []
+    for n in range(args.rounds * 2):
+        results.append(flip(app, toggles, n % 2 == 0))
+
+    set_times, cpu_times, paints = zip(*results)
+    print(
+        "%d toggles%s, %d flips:"
+        % (args.toggles, " in a scroll area" if args.scroll else "", len(results))
+    )
+    print("  create and show     %8.1f ms" % (build_time * 1000))
+    print("  setChecked on all   %8.1f ms" % (statistics.median(set_times) * 1000))
+    print(
+        "  CPU while animating %8.1f ms (of %d ms)"
+        % (statistics.median(cpu_times) * 1000, SETTLE_MS)
+    )
+    print("  paints              %8d" % statistics.median(paints))
+
+
+if __name__ == "__main__":
+    main()
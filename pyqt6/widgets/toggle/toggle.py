@@ -1,12 +1,15 @@
+from PyQt6 import sip
 from PyQt6.QtCore import (
+    QCoreApplication,
     QEasingCurve,
+    QElapsedTimer,
+    QObject,
     QPoint,
     QPointF,
-    QPropertyAnimation,
     QRectF,
-    QSequentialAnimationGroup,
     QSize,
     Qt,
+    QTimer,
     pyqtProperty,
     pyqtSlot,
 )
@@ -109,10 +112,119 @@ class Toggle(QCheckBox):
         self.update()
 
 
+class ToggleAnimator(QObject):
+    """
+    Runs the animations of every AnimatedToggle in the application from one
+    frame timer, instead of each toggle running its own animations.
+
+    Each frame moves the handle (then grows the pulse) of every toggle
+    that is animating, and repaints each of them once. The timer only runs
+    while something is animating. A toggle that can't be seen, e.g.
+    because it's scrolled out of view, jumps straight to its new position,
+    whether it was hidden when it changed state or while it was animating.
+    """
+
+    _instance = None
+
+    # Time between frames, in ms.
+    frame_interval = 16
+
+    @classmethod
+    def instance(cls):
+        """
+        Return the animator shared by every toggle, creating it if needed.
+        """
+        if cls._instance is None or sip.isdeleted(cls._instance):
+            cls._instance = cls(QCoreApplication.instance())
+        return cls._instance
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        # Animating toggles, with when they started (ms) and the handle's
+        # start and end positions.
+        self._active = {}
+        self._handle_curve = QEasingCurve(QEasingCurve.Type.InOutCubic)
+
+        self._clock = QElapsedTimer()
+        self._clock.start()
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(self.frame_interval)
+        self._timer.timeout.connect(self._step)
+
+    def start(self, toggle, end):
+        """
+        Animate toggle's handle from where it is now to end (0 or 1),
+        followed by the pulse.
+        """
+        if not toggle.isVisible() or toggle.visibleRegion().isEmpty():
+            self.stop(toggle)
+            toggle._handle_position = end
+            toggle.update()
+            return
+
+        self._active[toggle] = (self._clock.elapsed(), toggle._handle_position, end)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def stop(self, toggle):
+        """
+        Stop animating toggle, leaving it where it is.
+        """
+        if self._active.pop(toggle, None) is not None:
+            toggle._pulsing = False
+
+    def _step(self):
+        now = self._clock.elapsed()
+        finished = []
+        for toggle, (started, start, end) in self._active.items():
+            if sip.isdeleted(toggle):
+                finished.append(toggle)
+                continue
+            if not toggle.isVisible() or toggle.visibleRegion().isEmpty():
+                # Hidden or scrolled away since it started, so finish now.
+                toggle._handle_position = end
+                toggle._pulsing = False
+                finished.append(toggle)
+                toggle.update()
+                continue
+
+            elapsed = now - started
+            pulse_elapsed = elapsed - toggle.handle_duration
+            if pulse_elapsed < 0:
+                progress = self._handle_curve.valueForProgress(
+                    elapsed / toggle.handle_duration
+                )
+                toggle._handle_position = start + (end - start) * progress
+            elif pulse_elapsed < toggle.pulse_duration:
+                toggle._handle_position = end
+                toggle._pulsing = True
+                r0, r1 = toggle.pulse_radii
+                toggle._pulse_radius = r0 + (r1 - r0) * (
+                    pulse_elapsed / toggle.pulse_duration
+                )
+            else:
+                toggle._handle_position = end
+                toggle._pulsing = False
+                finished.append(toggle)
+            toggle.update()
+
+        for toggle in finished:
+            del self._active[toggle]
+        if not self._active:
+            self._timer.stop()
+
+
 class AnimatedToggle(Toggle):
     _transparent_pen = QPen(Qt.GlobalColor.transparent)
     _light_grey_pen = QPen(Qt.GlobalColor.lightGray)
 
+    # Animation timings, in ms, and the pulse's start and end radius.
+    handle_duration = 200
+    pulse_duration = 350
+    pulse_radii = (10, 20)
+
     def __init__(
         self,
         *args,
@@ -121,33 +233,17 @@ class AnimatedToggle(Toggle):
         **kwargs,
     ):
         self._pulse_radius = 0
+        self._pulsing = False
 
         super().__init__(*args, **kwargs)
 
-        self.animation = QPropertyAnimation(self, b"handle_position", self)
-        self.animation.setEasingCurve(QEasingCurve.Type.InOutCubic)
-        self.animation.setDuration(200)  # time in ms
-
-        self.pulse_anim = QPropertyAnimation(self, b"pulse_radius", self)
-        self.pulse_anim.setDuration(350)  # time in ms
-        self.pulse_anim.setStartValue(10)
-        self.pulse_anim.setEndValue(20)
-
-        self.animations_group = QSequentialAnimationGroup()
-        self.animations_group.addAnimation(self.animation)
-        self.animations_group.addAnimation(self.pulse_anim)
-
         self._pulse_unchecked_animation = QBrush(QColor(pulse_unchecked_color))
         self._pulse_checked_animation = QBrush(QColor(pulse_checked_color))
 
     @pyqtSlot(int)
     def handle_state_change(self, value):
-        self.animations_group.stop()
-        if value:
-            self.animation.setEndValue(1)
-        else:
-            self.animation.setEndValue(0)
-        self.animations_group.start()
+        # The shared animator steps every toggle from one timer.
+        ToggleAnimator.instance().start(self, 1 if value else 0)
 
     def paintEvent(self, e: QPaintEvent):
         contRect = self.contentsRect()
@@ -168,7 +264,7 @@ class AnimatedToggle(Toggle):
 
         xPos = contRect.x() + handleRadius + trailLength * self._handle_position
 
-        if self.pulse_anim.state() == QPropertyAnimation.State.Running:
+        if self._pulsing:
             p.setBrush(
                 self._pulse_checked_animation
                 if self.isChecked()